@@ -0,0 +1,167 @@
+import json
+
+from constants import InferenceConstants
+from services.db_service import get_sample, set_prediction_annotated_image
+from services.image_store import store_annotated_image
+from services.helper_log import logger
+
+
+RENDERERS = ("ultralytics", "light")
+
+# BGR colors of the light renderer, indexed by class id
+PALETTE = [(56, 56, 255), (151, 157, 255), (31, 112, 255), (29, 178, 255), (49, 210, 207),
+           (10, 249, 72), (23, 204, 146), (134, 219, 61), (211, 188, 0), (255, 149, 0)]
+
+
+def plot_result(result):
+    """Draw the boxes of an Ultralytics result on its image, with Ultralytics' own plotting."""
+    return result.plot()
+
+
+def draw_detections(image, predictions):
+    """
+    Draw the boxes and labels of predictions on a copy of the frame with plain OpenCV calls.
+
+    Args:
+        image (numpy.ndarray): The BGR frame.
+        predictions (list): Prediction dicts with class_id, class_name, confidence and bbox.
+
+    Returns:
+        numpy.ndarray: The annotated copy.
+    """
+    import cv2
+
+    annotated = image.copy()
+    thickness = max(1, round(sum(image.shape[:2]) / 1000))
+    for prediction in predictions:
+        color = PALETTE[(prediction.get("class_id") or 0) % len(PALETTE)]
+        label = f"{prediction['class_name']} {prediction['confidence']:.2f}"
+        for x1, y1, x2, y2 in prediction["bbox"]:
+            cv2.rectangle(annotated, (int(x1), int(y1)), (int(x2), int(y2)), color, thickness)
+            cv2.putText(annotated, label, (int(x1), max(int(y1) - 4 * thickness, 12)),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.5 * thickness, color, thickness, cv2.LINE_AA)
+    return annotated
+
+
+def encode_jpeg(image):
+    """Encode an image to JPEG bytes."""
+    import cv2
+
+    _, img_encoded = cv2.imencode('.jpg', image)
+    return img_encoded.tobytes()
+
+
+class Annotation:
+    def __init__(self, predictions, result=None, image=None, data=None, path=None,
+                 renderer=InferenceConstants.ANNOTATION_RENDERER):
+        """
+        Annotated image of a prediction, rendered the first time something asks for it.
+
+        Only the first available source is used: the Ultralytics result, the decoded
+        frame, the encoded frame, then the image file. A pickled annotation, e.g. one
+        returned by a process worker, keeps only the encoded frame or the file.
+
+        Args:
+            predictions (list): The detections to draw.
+            result (Results): Ultralytics result of the frame.
+            image (numpy.ndarray): The decoded frame.
+            data (bytes): The encoded frame.
+            path (str): Path of the image file.
+            renderer (str): "ultralytics" or "light", see `InferenceConstants.ANNOTATION_RENDERER`.
+        """
+        if renderer not in RENDERERS:
+            raise ValueError(f"Unknown annotation renderer: {renderer}")
+        self.predictions = predictions
+        self.renderer = renderer
+        self._result = result
+        self._image = image
+        self._data = data
+        self._path = path
+        self._jpeg = None
+
+    @property
+    def jpeg(self):
+        """The rendered JPEG, or None while nothing asked for it."""
+        return self._jpeg
+
+    def _frame(self):
+        import cv2
+        import numpy as np
+
+        if self._result is not None:
+            return self._result.orig_img
+        if self._image is not None:
+            return self._image
+        if self._data is not None:
+            return cv2.imdecode(np.frombuffer(self._data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        return cv2.imread(self._path)
+
+    def draw(self):
+        """Draw the annotated frame, without caching it."""
+        if self.renderer == "ultralytics" and self._result is not None:
+            return plot_result(self._result)
+        frame = self._frame()
+        if frame is None:
+            raise ValueError("The annotated frame can't be decoded")
+        return draw_detections(frame, self.predictions)
+
+    def render(self):
+        """
+        Render and encode the annotated image once, later calls return the same bytes.
+
+        Returns:
+            bytes: The annotated JPEG.
+        """
+        if self._jpeg is None:
+            self._jpeg = encode_jpeg(self.draw())
+            # The frame is no longer needed once rendered
+            self._result = self._image = self._data = self._path = None
+        return self._jpeg
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        if state["_data"] is not None or state["_path"] is not None:
+            # The decoded frame is megabytes, the light renderer draws from the JPEG instead
+            state["_result"] = state["_image"] = None
+        return state
+
+    def __bool__(self):
+        # A prediction with an annotation that wasn't rendered yet still succeeded
+        return True
+
+
+def stored_detections(prediction):
+    """Detections of a predictions row, all of them when stored, the best one otherwise."""
+    if prediction["detections"]:
+        return json.loads(prediction["detections"])
+    return [{
+        "class_id": prediction["class_id"],
+        "class_name": prediction["class_name"],
+        "confidence": prediction["confidence"],
+        "bbox": json.loads(prediction["bbox"]),
+    }]
+
+
+def render_stored_prediction(prediction):
+    """
+    Render the annotated image of a stored prediction from its sample and keep it in the store.
+
+    Args:
+        prediction (sqlite3.Row): The predictions row.
+
+    Returns:
+        str: Hash of the stored annotated image, or None when the sample image is gone.
+    """
+    sample = get_sample(prediction["sample_id"]) if prediction["sample_id"] else None
+    if sample is None:
+        return None
+    try:
+        # No Ultralytics result to plot from anymore, the light renderer only needs the boxes
+        jpeg = Annotation(stored_detections(prediction), path=sample["path"], renderer="light").render()
+    except Exception as e:
+        logger.error(f"Failed to render the annotated image of prediction {prediction['id']}: {e}")
+        return None
+
+    image_hash = store_annotated_image(jpeg)
+    set_prediction_annotated_image(prediction["id"], image_hash)
+    return image_hash
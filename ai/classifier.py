@@ -1,7 +1,20 @@
-from ultralytics import YOLO
+import argparse
 import os
 
-def train():
+def train(epochs=120, imgsz=640, batch=32, name="classification", project=None, workers=8):
+    """
+    Fine-tune the base model on the dataset and export the result.
+
+    Args:
+        epochs (int): Number of epochs.
+        imgsz (int): Image size.
+        batch (int): Batch size.
+        name (str): Run name, the results go to `project/name`.
+        project (str): Directory holding the runs, Ultralytics' default when None.
+        workers (int): Data loader worker processes.
+    """
+    # Imported here so the training process can limit torch's threads first
+    from ultralytics import YOLO
 
     model_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'ai', 'yolov8n.pt')
 
@@ -11,10 +24,34 @@ def train():
 
     base_model.train(
         data=file_path,                    # YAML file with dataset paths
-        epochs=120,                        # Number of epochs
-        imgsz=640,                         # Image size
-        batch=32,                          # Batch size
-        name="classification"
+        epochs=epochs,                     # Number of epochs
+        imgsz=imgsz,                       # Image size
+        batch=batch,                       # Batch size
+        name=name,
+        project=project,
+        exist_ok=True,                     # Keep the run in project/name, don't suffix it
+        workers=workers
     )
 
-    base_model.export(format="onnx")
\ No newline at end of file
+    # Dynamic axes, the inference scheduler sends whole batches
+    base_model.export(format="onnx", dynamic=True)
+
+
+if __name__ == "__main__":
+    # Entry point of the training process started by ai.training_service
+    parser = argparse.ArgumentParser(description="Train the detection model.")
+    parser.add_argument("--epochs", type=int, default=120)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=32)
+    parser.add_argument("--name", default="classification")
+    parser.add_argument("--project", default=None)
+    parser.add_argument("--threads", type=int, default=None,
+                        help="CPU threads torch may use")
+    args = parser.parse_args()
+
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    train(epochs=args.epochs, imgsz=args.imgsz, batch=args.batch, name=args.name,
+          project=args.project, workers=args.threads or 8)
@@ -0,0 +1,109 @@
+"""
+Compare accuracy and latency of the inference backends on the validation set.
+
+    python -m ai.compare_backends --json data/ai/backends.json
+
+Reports mAP from Ultralytics' validator, per-image latency percentiles and how
+often each backend's top detection agrees with the PyTorch model.
+"""
+import argparse
+import glob
+import json
+import os
+import statistics
+import time
+
+from ai.export_backends import DATA_DIR, VALID_IMAGES_DIR
+from ai.model_registry import BACKEND_FILES, model_path_for
+
+
+DATA_YAML = os.path.join(DATA_DIR, 'data.yaml')
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def top_detection(result):
+    """Class of the most confident box, or None when nothing was detected."""
+    if not len(result.boxes):
+        return None
+    return int(result.boxes.cls[result.boxes.conf.argmax()])
+
+
+def evaluate(backend, images, imgsz=640):
+    from ultralytics import YOLO
+
+    model = YOLO(model_path_for(backend), task="detect")
+    metrics = model.val(data=DATA_YAML, split="val", imgsz=imgsz, batch=1,
+                        plots=False, verbose=False)
+
+    # Warm up, the first call pays for graph setup
+    model(images[0], imgsz=imgsz, verbose=False)
+    latencies = []
+    top = []
+    for path in images:
+        started = time.perf_counter()
+        result = model(path, imgsz=imgsz, verbose=False)[0]
+        latencies.append((time.perf_counter() - started) * 1000)
+        top.append(top_detection(result))
+
+    return {
+        "backend": backend,
+        "map50_95": float(metrics.box.map),
+        "map50": float(metrics.box.map50),
+        "latency_ms": {
+            "mean": statistics.fmean(latencies),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+        },
+        "validator_speed_ms": dict(metrics.speed),
+    }, top
+
+
+def compare(backends, images, imgsz=640):
+    reports = []
+    reference = None
+    for backend in backends:
+        report, top = evaluate(backend, images, imgsz)
+        if reference is None:
+            reference = top
+        report["top_class_agreement"] = sum(
+            a == b for a, b in zip(top, reference)) / len(images)
+        reports.append(report)
+    return reports
+
+
+def print_table(reports):
+    print(f"{'backend':<10} {'mAP50-95':>9} {'mAP50':>7} {'p50 ms':>8} {'p95 ms':>8} {'agree':>6}")
+    for report in reports:
+        latency = report["latency_ms"]
+        print(f"{report['backend']:<10} {report['map50_95']:>9.4f} {report['map50']:>7.4f} "
+              f"{latency['p50']:>8.1f} {latency['p95']:>8.1f} {report['top_class_agreement']:>6.1%}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare the inference backends on the validation set.")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKEND_FILES),
+                        help="Defaults to every backend whose model has been exported")
+    parser.add_argument("--images", default=VALID_IMAGES_DIR)
+    parser.add_argument("--max-images", type=int, default=None)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    backends = args.backends or [backend for backend in BACKEND_FILES
+                                 if os.path.exists(model_path_for(backend))]
+    # Agreement is measured against the first backend, keep PyTorch first
+    backends.sort(key=lambda backend: backend != "pytorch")
+    images = sorted(glob.glob(os.path.join(args.images, "*.jpg")))[:args.max_images]
+    if not images:
+        raise SystemExit(f"No images in {args.images}")
+
+    reports = compare(backends, images, args.imgsz)
+    print_table(reports)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump({"images": len(images), "backends": reports}, report_file, indent=2)
@@ -0,0 +1,167 @@
+"""
+Build the exported variants of the served weights for the ONNX Runtime and OpenVINO backends.
+
+    python -m ai.export_backends onnx onnx-int8
+
+Every variant is built in a temporary directory and moved next to best.pt once
+complete, so a running server never loads a half-written model.
+"""
+import argparse
+import glob
+import os
+import shutil
+import tempfile
+
+import cv2
+import numpy as np
+
+from ai.model_registry import DEFAULT_MODEL_PATH, model_path_for, require_backend
+from services.helper_log import logger
+
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'ai')
+VALID_IMAGES_DIR = os.path.join(DATA_DIR, 'input', 'valid', 'images')
+
+
+def _install(source, target):
+    """Move a built model into place, replacing the previous one."""
+    if os.path.isdir(source):
+        # Directories can't be swapped atomically, move the old one aside first
+        if os.path.exists(target):
+            previous = target + ".old"
+            shutil.rmtree(previous, ignore_errors=True)
+            os.replace(target, previous)
+            shutil.rmtree(previous, ignore_errors=True)
+        shutil.move(source, target)
+    else:
+        shutil.move(source, target + ".tmp")
+        os.replace(target + ".tmp", target)
+    logger.info(f"Installed {target}")
+
+
+def _export(weights, export_format, imgsz):
+    # The export needs the runtime of the format too
+    require_backend(export_format)
+    from ultralytics import YOLO
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        # Export from a copy, Ultralytics writes its output next to the weights
+        local_weights = os.path.join(work_dir, os.path.basename(weights))
+        shutil.copyfile(weights, local_weights)
+        # Dynamic axes, the scheduler sends whole batches
+        exported = YOLO(local_weights).export(
+            format=export_format, imgsz=imgsz, dynamic=True)
+        target = model_path_for("onnx" if export_format == "onnx" else export_format)
+        _install(exported, target)
+        return target
+
+
+def export_onnx(weights=DEFAULT_MODEL_PATH, imgsz=640):
+    return _export(weights, "onnx", imgsz)
+
+
+def export_openvino(weights=DEFAULT_MODEL_PATH, imgsz=640):
+    return _export(weights, "openvino", imgsz)
+
+
+def letterbox(image, size=640):
+    """Resize keeping the aspect ratio and pad to `size`, the way Ultralytics prepares its input."""
+    height, width = image.shape[:2]
+    scale = min(size / height, size / width)
+    resized = cv2.resize(image, (round(width * scale), round(height * scale)),
+                         interpolation=cv2.INTER_LINEAR)
+    canvas = np.full((size, size, 3), 114, dtype=np.uint8)
+    top = (size - resized.shape[0]) // 2
+    left = (size - resized.shape[1]) // 2
+    canvas[top:top + resized.shape[0], left:left + resized.shape[1]] = resized
+    return canvas
+
+
+def load_calibration_batch(path, imgsz=640):
+    image = cv2.imread(path)
+    if image is None:
+        return None
+    image = letterbox(image, imgsz)[:, :, ::-1]  # BGR -> RGB
+    return np.ascontiguousarray(image.transpose(2, 0, 1)[None], dtype=np.float32) / 255.0
+
+
+def quantize_int8(onnx_path=None, calibration_dir=VALID_IMAGES_DIR, imgsz=640, max_images=200):
+    """
+    Statically quantize the ONNX model to INT8, calibrated on the validation images.
+
+    Args:
+        onnx_path (str): FP32 model, see `export_onnx`.
+        calibration_dir (str): Images the activation ranges are calibrated on.
+        imgsz (int): Model input size.
+        max_images (int): Maximum number of calibration images.
+
+    Returns:
+        str: Path of the installed INT8 model.
+    """
+    import onnx
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                          QuantType, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    onnx_path = onnx_path or model_path_for("onnx")
+    source = onnx.load(onnx_path)
+    input_name = source.graph.input[0].name
+    images = sorted(glob.glob(os.path.join(calibration_dir, "*.jpg")))[:max_images]
+    if not images:
+        raise FileNotFoundError(f"No calibration images in {calibration_dir}")
+
+    class ImageCalibrationReader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(images)
+
+        def get_next(self):
+            for path in self._paths:
+                batch = load_calibration_batch(path, imgsz)
+                if batch is not None:
+                    return {input_name: batch}
+            return None
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        preprocessed = os.path.join(work_dir, "preprocessed.onnx")
+        quantized = os.path.join(work_dir, "quantized.onnx")
+        quant_pre_process(onnx_path, preprocessed)
+        logger.info(f"Calibrating INT8 quantization on {len(images)} images.")
+        quantize_static(
+            preprocessed, quantized, ImageCalibrationReader(),
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax)
+
+        # Ultralytics reads class names, stride and input size from the metadata
+        model = onnx.load(quantized)
+        del model.metadata_props[:]
+        model.metadata_props.extend(source.metadata_props)
+        onnx.save(model, quantized)
+
+        target = model_path_for("onnx-int8")
+        _install(quantized, target)
+        return target
+
+
+EXPORTERS = {
+    "onnx": lambda args: export_onnx(args.weights, args.imgsz),
+    "onnx-int8": lambda args: quantize_int8(
+        None, args.calibration_dir, args.imgsz, args.max_images),
+    "openvino": lambda args: export_openvino(args.weights, args.imgsz),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the served weights for other inference backends.")
+    parser.add_argument("backends", nargs="+", choices=list(EXPORTERS),
+                        help="onnx-int8 needs the onnx model, build both in that order")
+    parser.add_argument("--weights", default=DEFAULT_MODEL_PATH)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--calibration-dir", default=VALID_IMAGES_DIR)
+    parser.add_argument("--max-images", type=int, default=200)
+    args = parser.parse_args()
+
+    for backend in args.backends:
+        print(EXPORTERS[backend](args))
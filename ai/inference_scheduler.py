@@ -0,0 +1,112 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from ai.predictor import predict_batch
+from constants import InferenceConstants
+from services.helper_log import logger
+
+
+class InferenceScheduler:
+    def __init__(self, max_batch_size=InferenceConstants.MAX_BATCH_SIZE,
+                 max_wait_ms=InferenceConstants.MAX_WAIT_MS):
+        """
+        Coalesce samples from every source into micro-batches for the model.
+
+        Args:
+            max_batch_size (int): Maximum number of samples per forward pass.
+            max_wait_ms (int): How long to wait for more samples once the first one arrived.
+        """
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.running = False
+
+    def start(self):
+        """Start the batching thread if it isn't running yet."""
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            self._thread = threading.Thread(
+                target=self._run, name="inference-scheduler", daemon=True)
+            self._thread.start()
+            logger.info(
+                f"Inference scheduler started (batch={self.max_batch_size}, wait={self.max_wait * 1000:.0f}ms).")
+
+    def stop(self, timeout=5):
+        """Stop the batching thread after the samples already queued are scored."""
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def submit(self, sample):
+        """
+        Queue a sample for inference.
+
+        Args:
+            sample (dict): Sample dictionary, see `ai.predictor.predict`.
+
+        Returns:
+            Future: Resolves to the `(predictions, annotated_image)` tuple `predict` returns.
+        """
+        self.start()
+        future = Future()
+        self._queue.put((sample, future))
+        return future
+
+    def _collect_batch(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # Keep the stop sentinel for the main loop
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                if not self.running and self._queue.empty():
+                    break
+                continue
+
+            batch = self._collect_batch(item)
+            batch = [(sample, future) for sample, future in batch
+                     if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                outputs = predict_batch([sample for sample, _ in batch])
+                for (_, future), output in zip(batch, outputs):
+                    future.set_result(output)
+            except Exception as e:
+                logger.error(f"Batched inference failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+
+    def get_stats(self):
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize(),
+        }
+
+
+inference_scheduler = InferenceScheduler()
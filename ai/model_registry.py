@@ -0,0 +1,166 @@
+import importlib.util
+import os
+import threading
+
+from constants import InferenceConstants
+from services.helper_log import logger
+
+
+WEIGHTS_DIR = os.path.join(
+    os.path.dirname(__file__),
+    '..',
+    'data',
+    'ai',
+    'output',
+    'weights'
+)
+
+# Weights file of every backend, all derived from best.pt, see ai/export_backends.py
+BACKEND_FILES = {
+    "pytorch": "best.pt",
+    "onnx": "best.onnx",
+    "onnx-int8": "best.int8.onnx",
+    "openvino": "best_openvino_model",
+}
+
+# Runtime each exported backend needs, Ultralytics would otherwise try to pip install it
+BACKEND_MODULES = {
+    "onnx": "onnxruntime",
+    "onnx-int8": "onnxruntime",
+    "openvino": "openvino",
+}
+
+DEFAULT_MODEL_PATH = os.path.join(WEIGHTS_DIR, BACKEND_FILES["pytorch"])
+
+
+def model_path_for(backend):
+    if backend not in BACKEND_FILES:
+        raise ValueError(f"Unknown inference backend: {backend}")
+    return os.path.join(WEIGHTS_DIR, BACKEND_FILES[backend])
+
+
+def require_backend(backend):
+    """
+    Fail fast when the runtime of a backend isn't installed.
+
+    Raises:
+        RuntimeError: The runtime module is missing, the message says what to install.
+    """
+    module = BACKEND_MODULES.get(backend)
+    # find_spec doesn't import the module, checking stays cheap
+    if module and importlib.util.find_spec(module) is None:
+        raise RuntimeError(
+            f"The {backend} inference backend needs the {module} package, install it with "
+            f"`pip install -r requirements.txt` or choose another ARMORY_INFERENCE_BACKEND.")
+
+
+class ModelRegistry:
+    def __init__(self, model_path=None, warmup_imgsz=640, backend=InferenceConstants.BACKEND):
+        """
+        Keep a single resident YOLO model for the whole process.
+
+        Ultralytics runs every backend behind the same interface, so predictions
+        have the same format whichever backend is selected.
+
+        Args:
+            model_path (str): Path to the model weights, defaults to the backend's weights.
+            warmup_imgsz (int): Size of the dummy image used to warm the model up.
+            backend (str): "pytorch", "onnx", "onnx-int8" or "openvino", see `InferenceConstants.BACKEND`.
+        """
+        self.backend = backend
+        self.model_path = model_path or model_path_for(backend)
+        self.warmup_imgsz = warmup_imgsz
+        self.model = None
+        self.loaded_mtime = None
+        self.version = None
+        self._reload_listeners = []
+        self._lock = threading.Lock()
+        # Ultralytics models are not safe to call from several threads at once
+        self.inference_lock = threading.Lock()
+
+    def _weights_mtime(self):
+        try:
+            return os.path.getmtime(self.model_path)
+        except OSError:
+            return None
+
+    def weights_version(self):
+        """
+        Identify the weights currently on disk, without loading them.
+
+        Returns:
+            str: e.g. "1736069400000000000-6234112", or None if the file is missing.
+        """
+        try:
+            stat = os.stat(self.model_path)
+        except OSError:
+            return None
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    def add_reload_listener(self, listener):
+        """
+        Call `listener(version)` every time new weights were loaded.
+
+        Args:
+            listener (callable): Receives the `weights_version` of the loaded weights.
+        """
+        self._reload_listeners.append(listener)
+
+    def _warm_up(self, model):
+        """Run a dummy inference so the first real frame doesn't pay graph setup."""
+        import numpy as np
+
+        dummy = np.zeros((self.warmup_imgsz, self.warmup_imgsz, 3), dtype=np.uint8)
+        with self.inference_lock:
+            model(dummy, verbose=False)
+
+    def _load(self):
+        require_backend(self.backend)
+        # Importing Ultralytics pulls in torch, only pay for it once a model is needed
+        from ultralytics import YOLO
+
+        mtime = self._weights_mtime()
+        version = self.weights_version()
+        logger.info(f"Loading {self.backend} model weights from {self.model_path}")
+        # Exported models don't always carry their task, ours is always detection
+        model = YOLO(self.model_path, task="detect")
+        self._warm_up(model)
+        self.model = model
+        self.loaded_mtime = mtime
+        self.version = version
+        logger.info("Model loaded and warmed up.")
+        for listener in self._reload_listeners:
+            try:
+                listener(version)
+            except Exception as e:
+                logger.error(f"Model reload listener failed: {e}")
+        return model
+
+    def load(self):
+        """Load (or reload) the weights from disk and warm the model up."""
+        with self._lock:
+            return self._load()
+
+    def reload_if_changed(self):
+        """Reload the model when the weights file changed on disk since the last load."""
+        mtime = self._weights_mtime()
+        if mtime is None or mtime == self.loaded_mtime:
+            return self.model
+
+        with self._lock:
+            if self._weights_mtime() != self.loaded_mtime:
+                logger.info("Model weights changed on disk, reloading.")
+                self._load()
+            return self.model
+
+    def get_model(self):
+        """Return the resident model, loading it lazily on first use."""
+        if self.model is None:
+            with self._lock:
+                if self.model is None:
+                    self._load()
+                return self.model
+        return self.reload_if_changed()
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,290 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from ai.annotation import Annotation
+from ai.model_registry import model_registry
+from constants import InferenceConstants
+from services.category_cache import category_cache
+from services.db_service import (clear_prediction_cache, delete_stale_prediction_cache_rows,
+                                 get_prediction_cache_rows, write_prediction_cache_rows)
+from services.image_store import annotated_image_bytes, annotated_image_store, store_annotated_image
+from services.helper_log import logger
+
+
+MODES = ("off", "exact", "perceptual")
+
+
+def difference_hash(data):
+    """
+    Compute the 64-bit difference hash of an encoded image.
+
+    Near-identical frames (recompression, sensor noise, small exposure changes)
+    hash to values only a few bits apart.
+
+    Args:
+        data (bytes): The encoded image.
+
+    Returns:
+        int: The hash, or None if the image can't be decoded.
+    """
+    import cv2
+    import numpy as np
+
+    # Decoding at 1/8 scale is plenty for a 9x8 thumbnail and much cheaper
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8),
+                         cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if image is None:
+        return None
+    thumbnail = cv2.resize(image, (9, 8), interpolation=cv2.INTER_AREA)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).flatten()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+class PredictionCache:
+    def __init__(self, mode=InferenceConstants.CACHE_MODE,
+                 max_entries=InferenceConstants.CACHE_MAX_ENTRIES,
+                 max_bytes=InferenceConstants.CACHE_MAX_BYTES,
+                 max_distance=InferenceConstants.CACHE_MAX_DISTANCE,
+                 touch_flush=InferenceConstants.CACHE_TOUCH_FLUSH):
+        """
+        LRU cache of predictions keyed by the SHA-256 of the image bytes, persisted in SQLite.
+
+        Entries belong to the weights version they were computed with and are
+        dropped as soon as other weights are loaded.
+
+        Args:
+            mode (str): "off", "exact" or "perceptual", see `InferenceConstants.CACHE_MODE`.
+            max_entries (int): Maximum number of cached images.
+            max_bytes (int): Maximum size of the cached predictions and annotated images.
+            max_distance (int): Perceptual mode, largest hash distance counted as a duplicate.
+            touch_flush (int): Number of hits after which their LRU order is persisted.
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown prediction cache mode: {mode}")
+
+        self.mode = mode
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_distance = max_distance
+        self.touch_flush = touch_flush
+
+        self._entries = OrderedDict()  # image hash -> entry, least recently used first
+        self._size = 0
+        self._version = None
+        self._loaded = False
+        self._touched = {}  # image hash -> last_used not yet written to the database
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.mode != "off"
+
+    def load(self, version):
+        """(Re)load the entries of a weights version from the database and purge the others."""
+        deleted = delete_stale_prediction_cache_rows(version)
+        if deleted:
+            logger.info(f"Dropped {deleted} cached predictions of previous model weights.")
+
+        entries = OrderedDict()
+        size = 0
+        for row in get_prediction_cache_rows(version, self.max_entries):
+            entries[row["image_hash"]] = {
+                "perceptual_hash": int(row["perceptual_hash"], 16) if row["perceptual_hash"] else None,
+                "predictions": json.loads(row["predictions"]),
+                "annotated_image_hash": row["annotated_image_hash"],
+                "size": row["size"],
+            }
+            size += row["size"]
+
+        with self._lock:
+            self._entries = entries
+            self._size = size
+            self._version = version
+            self._touched.clear()
+            self._loaded = True
+        logger.info(f"Prediction cache loaded with {len(entries)} entries.")
+
+    def invalidate(self, version):
+        """Drop every entry not computed by `version`, registered as a model reload listener."""
+        if self._loaded and version != self._version:
+            self.load(version)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._touched.clear()
+            self._size = 0
+        clear_prediction_cache()
+
+    def _ensure_loaded(self, version):
+        if not self._loaded or version != self._version:
+            self.load(version)
+
+    def _find_similar(self, perceptual_hash):
+        best_key, best_distance = None, self.max_distance + 1
+        for key, entry in self._entries.items():
+            if entry["perceptual_hash"] is None:
+                continue
+            distance = (entry["perceptual_hash"] ^ perceptual_hash).bit_count()
+            if distance < best_distance:
+                best_key, best_distance = key, distance
+        return best_key
+
+    def lookup(self, path, version, data=None):
+        """
+        Look an image up by content.
+
+        Args:
+            path (str): Path of the image file.
+            version (str): `ModelRegistry.weights_version` of the weights that would score it.
+            data (bytes): Content of the image when already in memory, `path` isn't read then.
+
+        Returns:
+            tuple: The cached `(predictions, annotated_image)` or None, and the key to `store` a miss under.
+        """
+        if data is None:
+            with open(path, "rb") as image_file:
+                data = image_file.read()
+        image_hash = hashlib.sha256(data).hexdigest()
+        perceptual_hash = difference_hash(data) if self.mode == "perceptual" else None
+        key = (image_hash, perceptual_hash)
+
+        self._ensure_loaded(version)
+        with self._lock:
+            hit_key = image_hash if image_hash in self._entries else None
+            if hit_key is None and perceptual_hash is not None:
+                hit_key = self._find_similar(perceptual_hash)
+            if hit_key is None:
+                self.misses += 1
+                return None, key
+            entry = self._entries[hit_key]
+
+        try:
+            annotated_image = None
+            if entry["annotated_image_hash"] is not None:
+                annotated_image = annotated_image_store.get(entry["annotated_image_hash"])
+        except OSError:
+            # The annotated image is gone, score the image again
+            self._remove(hit_key)
+            self.misses += 1
+            return None, key
+
+        with self._lock:
+            if hit_key in self._entries:
+                self._entries.move_to_end(hit_key)
+                self._touched[hit_key] = time.time()
+            if hit_key == image_hash:
+                self.hits += 1
+            else:
+                self.near_hits += 1
+            flush = len(self._touched) >= self.touch_flush
+        if flush:
+            self.flush()
+
+        # Attributes are looked up at hit time, they may have changed since
+        predictions = [{**prediction, "attributes": category_cache.get_attributes(prediction["class_name"])}
+                       for prediction in entry["predictions"]]
+        if annotated_image is None:
+            # Cached before anything rendered it, draw the cached boxes on this frame if asked to
+            annotated_image = Annotation(predictions, data=data)
+        return (predictions, annotated_image), key
+
+    def store(self, key, output, version):
+        """
+        Cache a freshly computed prediction.
+
+        Args:
+            key (tuple): The key returned by the `lookup` that missed.
+            output (tuple): The `(predictions, annotated_image)` computed for the image.
+            version (str): Weights version the prediction was computed with.
+        """
+        predictions, annotated_image = output
+        if annotated_image is None or version is None:
+            return
+
+        image_hash, perceptual_hash = key
+        cached_predictions = [{k: v for k, v in prediction.items() if k != "attributes"}
+                              for prediction in predictions]
+        # A lazy annotation nobody rendered yet is cached without image, it is rendered on a hit
+        annotated_image_hash = store_annotated_image(annotated_image)
+        # Size of the annotated image plus the stored predictions
+        size = len(annotated_image_bytes(annotated_image, render=False) or b"") + len(json.dumps(cached_predictions))
+        now = time.time()
+
+        evicted = []
+        with self._lock:
+            if version != self._version:
+                return
+            previous = self._entries.pop(image_hash, None)
+            if previous:
+                self._size -= previous["size"]
+            self._entries[image_hash] = {
+                "perceptual_hash": perceptual_hash,
+                "predictions": cached_predictions,
+                "annotated_image_hash": annotated_image_hash,
+                "size": size,
+            }
+            self._size += size
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                evicted_hash, entry = self._entries.popitem(last=False)
+                self._size -= entry["size"]
+                self._touched.pop(evicted_hash, None)
+                evicted.append(evicted_hash)
+                self.evictions += 1
+            touches = [(last_used, touched_hash) for touched_hash, last_used in self._touched.items()]
+            self._touched.clear()
+
+        inserted = image_hash not in evicted
+        write_prediction_cache_rows(
+            version,
+            inserts=[(image_hash, format(perceptual_hash, "016x") if perceptual_hash is not None else None,
+                      cached_predictions, annotated_image_hash, size, now)] if inserted else [],
+            touches=touches,
+            deletes=evicted)
+
+    def _remove(self, image_hash):
+        with self._lock:
+            entry = self._entries.pop(image_hash, None)
+            if entry is None:
+                return
+            self._size -= entry["size"]
+            self._touched.pop(image_hash, None)
+            version = self._version
+        write_prediction_cache_rows(version, deletes=[image_hash])
+
+    def flush(self):
+        """Persist the LRU order of the entries hit since the last write."""
+        with self._lock:
+            touches = [(last_used, image_hash) for image_hash, last_used in self._touched.items()]
+            self._touched.clear()
+            version = self._version
+        if touches:
+            write_prediction_cache_rows(version, touches=touches)
+
+    def get_stats(self):
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "mode": self.mode,
+            "model_version": self._version,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self._size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+        }
+
+
+prediction_cache = PredictionCache()
+model_registry.add_reload_listener(prediction_cache.invalidate)
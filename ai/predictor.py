@@ -1,12 +1,199 @@
 
 from fastapi import logger
-from ultralytics import YOLO
-import cv2
 import os
 import base64
-from constants import AIConstants
-from services.db_service import get_category_attribute_data_by_name
+from ai.annotation import Annotation
+from constants import AIConstants, InferenceConstants
+from ai.model_registry import model_registry
+from ai.prediction_cache import prediction_cache
+from ai.tiling import tiled_predictor
+from services.category_cache import category_cache
 from services.helper_log import logger
+from services.image_store import annotated_image_bytes
+from services.metrics_service import SIZE_BUCKETS, metrics
+
+
+def get_highest_confidence_predictions(predictions):
+    if not predictions:
+        return []
+
+    # Find the highest confidence level
+    highest_confidence = max(predictions, key=lambda x: x['confidence'])[
+        'confidence']
+
+    # Filter predictions that have the highest confidence level
+    highest_confidence_predictions = [
+        prediction for prediction in predictions if prediction['confidence'] == highest_confidence]
+
+    # Return the predictions inside a list
+    return highest_confidence_predictions
+
+
+def _extract_predictions(result):
+    """Turn the boxes of a single Ultralytics result into prediction dicts."""
+    predictions = []
+    for box in result.boxes:
+        class_id = int(box.cls)
+        class_name = AIConstants.CLASS_NAMES[class_id]
+        predictions.append({
+            "class_id": class_id,
+            "class_name": class_name,
+            "attributes": category_cache.get_attributes(class_name),
+            "confidence": float(box.conf),
+            "bbox": box.xyxy.tolist()  # Bounding box coordinates
+        })
+    return predictions
+
+
+def _format_result(result, sample):
+    """Turn a single Ultralytics result into the prediction list and its annotated image."""
+    predictions = _extract_predictions(result)
+    # The JPEG and path let a pickled annotation be rendered without the decoded frame
+    annotation = Annotation(predictions, result=result, data=sample.get("data"), path=sample["path"])
+    if InferenceConstants.ANNOTATION == "eager":
+        return predictions, annotation.render()
+    return predictions, annotation
+
+
+def to_base64(annotated_image):
+    """Base64 encode an annotated image for a JSON response, rendering it if needed."""
+    jpeg = annotated_image_bytes(annotated_image)
+    return base64.b64encode(jpeg).decode('utf-8') if jpeg else None
+
+
+def _read_image(path):
+    import cv2
+
+    image = cv2.imread(path)
+    if image is None:
+        raise ValueError(f"Could not decode image: {path}")
+    return image
+
+
+def decode_image(data):
+    """
+    Decode an encoded image held in memory.
+
+    Args:
+        data (bytes | bytearray | memoryview): The encoded image, read without copying it.
+
+    Returns:
+        numpy.ndarray: The BGR image, or None if it can't be decoded.
+    """
+    import cv2
+    import numpy as np
+
+    return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+
+INFERENCE_SECONDS = metrics.histogram(
+    "inference_seconds", "Duration of a forward pass, tiled captures include all of their tiles.", ("mode",))
+INFERENCE_BATCH_SIZE = metrics.histogram(
+    "inference_batch_size", "Samples scored per forward pass.", buckets=SIZE_BUCKETS)
+
+
+def predict_batch(samples):
+    """
+    Perform prediction on several image samples with a single batched forward pass.
+
+    Args:
+        samples (list): Sample dictionaries, see `predict`.
+
+    Returns:
+        list: One `(predictions, annotated_image)` tuple per sample, in input order.
+    """
+    outputs = [None] * len(samples)
+    paths = []
+    indexes = []
+    tiled_samples = []
+    tiled_indexes = []
+    cache_keys = {}
+    version = model_registry.weights_version() if prediction_cache.enabled else None
+    if version is not None and tiled_predictor.enabled:
+        # Tiled and untiled predictions of the same image differ
+        version = f"{version}-{tiled_predictor.signature()}"
+
+    for index, sample in enumerate(samples):
+        test_image_path = sample["path"]
+        image = sample.get("image")
+        data = sample.get("data")
+        if image is None and data is None and not os.path.exists(test_image_path):
+            logger.error(
+                f"FileNotFoundError: Image file not found at path: {test_image_path}")
+            outputs[index] = (
+                {"error": f"Image file not found at path: {test_image_path}"}, None)
+            continue
+
+        if version is not None:
+            # Resent frames are answered from the cache without running the model
+            try:
+                cached, cache_key = prediction_cache.lookup(test_image_path, version, data)
+            except Exception as e:
+                logger.error(f"Prediction cache lookup failed: {e}")
+                cached, cache_key = None, None
+            if cached is not None:
+                outputs[index] = cached
+                continue
+            cache_keys[index] = cache_key
+
+        if image is None and data is not None:
+            # Decoded only once the cache missed, resent frames never pay for it
+            image = decode_image(data)
+            if image is None:
+                logger.error(f"Could not decode the frame {sample['name']}.")
+                outputs[index] = ({"error": f"Could not decode image: {sample['name']}"}, None)
+                continue
+
+        # Only large captures are tiled, regular frames keep the single pass
+        if tiled_predictor.should_tile(test_image_path, image):
+            tiled_samples.append((test_image_path, image))
+            tiled_indexes.append(index)
+        else:
+            # Frames decoded in memory go to the model as arrays, files by path
+            paths.append(test_image_path if image is None else image)
+            indexes.append(index)
+
+    if not paths and not tiled_samples:
+        return outputs
+
+    try:
+        # Reuse the resident model instead of loading the weights per image
+        model = model_registry.get_model()
+
+        if any(not isinstance(source, str) for source in paths):
+            # Ultralytics can't mix paths and arrays in one batch, it would read the files the same way
+            paths = [_read_image(source) if isinstance(source, str) else source for source in paths]
+
+        # Perform prediction on the whole batch at once
+        with model_registry.inference_lock:
+            results = []
+            if paths:
+                INFERENCE_BATCH_SIZE.observe(len(paths))
+                with INFERENCE_SECONDS.labels("batch").time():
+                    results = model(paths, batch=len(paths), verbose=False)
+            # Every large capture is one batch of its own, the full frame and its tiles
+            for path, image in tiled_samples:
+                with INFERENCE_SECONDS.labels("tiled").time():
+                    results.append(tiled_predictor.predict(model, path, image))
+
+        for index, result in zip(indexes + tiled_indexes, results):
+            outputs[index] = _format_result(result, samples[index])
+
+    except Exception as e:
+        logger.error(f"An unexpected error occurred: {e}")
+        for index in indexes + tiled_indexes:
+            outputs[index] = (
+                {"error": "An error occurred during prediction. Check logs for details."}, None)
+
+    for index, cache_key in cache_keys.items():
+        if cache_key is None or outputs[index][1] is None:
+            continue
+        try:
+            prediction_cache.store(cache_key, outputs[index], version)
+        except Exception as e:
+            logger.error(f"Failed to cache prediction: {e}")
+
+    return outputs
 
 
 def predict(sample):
@@ -22,62 +209,13 @@ def predict(sample):
                 "is_deleted": false
             }
 
+            The serial path adds "data", the received JPEG, so the file doesn't have
+            to be read back. It is decoded only when the prediction cache misses,
+            callers that already decoded it can pass "image" as well.
+
     Returns:
-        tuple: A list of predictions and the base64-encoded annotated image.
+        tuple: A list of predictions and the annotated image, JPEG bytes or an `Annotation`
+        rendered on first use, see `ARMORY_ANNOTATION`, `annotated_image_bytes` and `to_base64`.
     """
-    try:
-        logger.info(sample)
-        # Define the model path
-        model_path = os.path.join(
-            os.path.dirname(__file__),
-            '..',
-            'data',
-            'ai',
-            'output',
-            'weights',
-            'best.pt'
-        )
-
-        # Load the YOLOv8 model
-        model = YOLO(model_path)
-
-        # Get the path to the test image from the sample
-        test_image_path = sample["path"]
-        logger.info(test_image_path)
-
-        if not os.path.exists(test_image_path):
-            raise FileNotFoundError(
-                f"Image file not found at path: {test_image_path}")
-
-        # Perform prediction
-        results = model(test_image_path)
-
-        predictions = []
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                class_id = int(box.cls)
-                class_name = AIConstants.CLASS_NAMES[class_id]
-                predictions.append({
-                    "class_id": class_id,
-                    "class_name": class_name,
-                    "attributes": get_category_attribute_data_by_name(class_name),
-                    "confidence": float(box.conf),
-                    "bbox": box.xyxy.tolist()  # Bounding box coordinates
-                })
-
-        # Generate an annotated image
-        annotated_image = results[0].plot()
-
-        # Encode the annotated image to base64
-        _, img_encoded = cv2.imencode('.jpg', annotated_image)
-        img_base64 = base64.b64encode(img_encoded).decode('utf-8')
-
-        return predictions, img_base64
-
-    except FileNotFoundError as e:
-        logger.error(f"FileNotFoundError: {e}")
-        return {"error": str(e)}, None
-    except Exception as e:
-        logger.error(f"An unexpected error occurred: {e}")
-        return {"error": "An error occurred during prediction. Check logs for details."}, None
+    logger.info(f"Predicting {sample['name']}")
+    return predict_batch([sample])[0]
@@ -0,0 +1,227 @@
+import json
+
+from constants import InferenceConstants
+from services.helper_log import logger
+
+
+# Smaller tiles multiply the forward passes per frame without helping the model
+MIN_TILE_SIZE = 32
+
+
+def check_tile_settings(size, overlap):
+    """
+    Validate a tile size and overlap.
+
+    Raises:
+        ValueError: When the size is negative or below `MIN_TILE_SIZE`, 0 being full frame
+            only, or the overlap is outside [0, 1) and the tiles would never advance.
+    """
+    if size != 0 and size < MIN_TILE_SIZE:
+        raise ValueError(f"tile size {size} must be 0 or at least {MIN_TILE_SIZE}")
+    if not 0 <= overlap < 1:
+        raise ValueError(f"tile overlap {overlap} must be in [0, 1)")
+    return size, overlap
+
+
+def load_category_settings(raw=InferenceConstants.TILE_CATEGORIES):
+    """
+    Parse the per-category tile settings.
+
+    Args:
+        raw (str): JSON object mapping class names to {"size": int, "overlap": float}.
+
+    Returns:
+        dict: Class name to `(size, overlap)`, size 0 means full frame only.
+    """
+    try:
+        categories = json.loads(raw) if raw else {}
+    except ValueError as e:
+        logger.error(f"Ignoring invalid ARMORY_TILE_CATEGORIES: {e}")
+        return {}
+    if not isinstance(categories, dict):
+        logger.error("Ignoring ARMORY_TILE_CATEGORIES, expected a JSON object of class names.")
+        return {}
+
+    settings = {}
+    for name, options in categories.items():
+        # A bad entry must not stop the app from starting, this runs at import time
+        try:
+            if not isinstance(options, dict):
+                raise ValueError("expected an object with size and overlap")
+            settings[name] = check_tile_settings(int(options.get("size", InferenceConstants.TILE_SIZE)),
+                                                 float(options.get("overlap", InferenceConstants.TILE_OVERLAP)))
+        except (TypeError, ValueError) as e:
+            logger.error(f"Ignoring the ARMORY_TILE_CATEGORIES entry of {name}: {e}")
+    return settings
+
+
+def tile_windows(width, height, size, overlap):
+    """
+    Cover an image with square tiles overlapping by `overlap` of their size.
+
+    The last tile of a row or column is aligned with the image border instead
+    of hanging over it, so every tile has the full size unless the image is smaller.
+
+    Returns:
+        list: `(x0, y0, x1, y1)` windows.
+    """
+    # At least one pixel, whatever the overlap, so the windows always advance
+    stride = max(1, int(size * (1 - overlap)))
+
+    def starts(length):
+        if length <= size:
+            return [0]
+        positions = list(range(0, length - size, stride))
+        positions.append(length - size)
+        return positions
+
+    return [(x, y, min(x + size, width), min(y + size, height))
+            for y in starts(height) for x in starts(width)]
+
+
+class TiledPredictor:
+    def __init__(self, threshold=InferenceConstants.TILE_THRESHOLD, tile_size=InferenceConstants.TILE_SIZE,
+                 overlap=InferenceConstants.TILE_OVERLAP, iou=InferenceConstants.TILE_NMS_IOU,
+                 batch_size=InferenceConstants.TILE_BATCH_SIZE, categories=None):
+        """
+        Score high-resolution images as overlapping tiles on top of the full frame.
+
+        The model letterboxes every input to its training size, which shrinks small
+        objects in large captures below what it can detect. Images whose longer side
+        exceeds `threshold` are also cut into tiles of about that training size. The
+        full frame and every tile go through the model as one batch and the detections
+        are merged back into image coordinates with class-aware NMS.
+
+        Args:
+            threshold (int): Longer side in pixels above which images are tiled, 0 disables tiling.
+            tile_size (int): Default tile side in pixels.
+            overlap (float): Default fraction of a tile shared with its neighbours.
+            iou (float): IoU above which two boxes of the same class are merged.
+            batch_size (int): Maximum number of tiles per forward pass.
+            categories (dict): Class name to `(size, overlap)`, see `load_category_settings`.
+        """
+        try:
+            self.default = check_tile_settings(tile_size, overlap)
+        except ValueError as e:
+            # Like a bad category entry, this runs at import time and must not stop the app
+            logger.error(f"Tiling disabled, invalid ARMORY_TILE_SIZE or ARMORY_TILE_OVERLAP: {e}")
+            threshold = 0
+            self.default = (InferenceConstants.TILE_SIZE, 0.0)
+        self.threshold = threshold
+        self.iou = iou
+        self.batch_size = max(1, batch_size)
+        self.categories = load_category_settings() if categories is None else categories
+        self.images_tiled = 0
+        self.tiles_scored = 0
+
+    @property
+    def enabled(self):
+        return self.threshold > 0
+
+    def signature(self):
+        """Identify the settings, predictions made with other settings must not be reused."""
+        categories = ",".join(f"{name}:{size}:{overlap}"
+                              for name, (size, overlap) in sorted(self.categories.items()))
+        return f"tiled{self.threshold}:{self.default[0]}:{self.default[1]}:{self.iou}[{categories}]"
+
+    def image_size(self, path):
+        """Read the image size from the file header, without decoding the pixels."""
+        from PIL import Image
+
+        with Image.open(path) as image:
+            return image.size
+
+    def should_tile(self, path, image=None):
+        if not self.enabled:
+            return False
+        if image is not None:
+            return max(image.shape[:2]) > self.threshold
+        try:
+            return max(self.image_size(path)) > self.threshold
+        except OSError:
+            # Unreadable here, the regular path reports the error
+            return False
+
+    def _passes(self, names):
+        """
+        Group the classes by the tile settings they are detected with.
+
+        Returns:
+            dict: `(size, overlap)` to the set of class ids kept from that pass.
+        """
+        passes = {}
+        for class_id, name in names.items():
+            settings = self.categories.get(name, self.default)
+            if settings[0] > 0:
+                passes.setdefault(settings, set()).add(class_id)
+        return passes
+
+    def predict(self, model, path, image=None):
+        """
+        Score one image as the full frame plus its tiles.
+
+        Args:
+            model (YOLO): The resident model, the caller holds `inference_lock`.
+            path (str): Path of the image.
+            image (numpy.ndarray): The image when already decoded, read from `path` otherwise.
+
+        Returns:
+            Results: A single Ultralytics result for the whole image, with the merged boxes.
+        """
+        import cv2
+        import torch
+        from torchvision.ops import batched_nms
+        from ultralytics.engine.results import Results
+
+        if image is None:
+            image = cv2.imread(path)
+        if image is None:
+            raise ValueError(f"Could not decode image: {path}")
+        height, width = image.shape[:2]
+
+        # The full frame keeps large objects that no tile contains whole
+        crops = [image]
+        windows = [(0, 0, width, height)]
+        keep = [None]
+        for (size, overlap), class_ids in self._passes(model.names).items():
+            for window in tile_windows(width, height, size, overlap):
+                x0, y0, x1, y1 = window
+                crops.append(image[y0:y1, x0:x1])
+                windows.append(window)
+                keep.append(class_ids)
+
+        results = model(crops, batch=min(len(crops), self.batch_size), verbose=False)
+
+        detections = []
+        for result, (x0, y0, _, _), class_ids in zip(results, windows, keep):
+            boxes = result.boxes.data.clone()
+            if class_ids is not None and len(boxes):
+                wanted = torch.tensor(sorted(class_ids), device=boxes.device)
+                boxes = boxes[torch.isin(boxes[:, 5].long(), wanted)]
+            # Back to image coordinates
+            boxes[:, [0, 2]] += x0
+            boxes[:, [1, 3]] += y0
+            detections.append(boxes)
+
+        merged = torch.cat(detections)
+        if len(merged):
+            merged = merged[batched_nms(merged[:, :4], merged[:, 4], merged[:, 5].long(), self.iou)]
+
+        self.images_tiled += 1
+        self.tiles_scored += len(crops) - 1
+        return Results(image, path=path, names=model.names, boxes=merged)
+
+    def get_stats(self):
+        return {
+            "enabled": self.enabled,
+            "threshold": self.threshold,
+            "tile_size": self.default[0],
+            "overlap": self.default[1],
+            "categories": {name: {"size": size, "overlap": overlap}
+                           for name, (size, overlap) in self.categories.items()},
+            "images_tiled": self.images_tiled,
+            "tiles_scored": self.tiles_scored,
+        }
+
+
+tiled_predictor = TiledPredictor()
@@ -0,0 +1,287 @@
+import csv
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from ai.model_registry import DEFAULT_MODEL_PATH, WEIGHTS_DIR, model_path_for, model_registry
+from constants import TrainingConstants
+from services.db_service import (get_promoted_training_metric, get_training_run, get_training_runs,
+                                 insert_training_run, interrupt_unfinished_training_runs,
+                                 update_training_run)
+from services.helper_log import logger
+
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Environment variables the BLAS/OpenMP runtimes under torch read their thread count from
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+def read_results(path):
+    """
+    Read the per-epoch metrics Ultralytics writes to results.csv.
+
+    Returns:
+        list: One dict per finished epoch, column names stripped and values as floats.
+    """
+    try:
+        with open(path, newline="") as results_file:
+            rows = list(csv.DictReader(results_file))
+    except OSError:
+        return []
+
+    epochs = []
+    for row in rows:
+        metrics = {}
+        for column, value in row.items():
+            try:
+                metrics[column.strip()] = float(value)
+            except (TypeError, ValueError):
+                continue
+        epochs.append(metrics)
+    return epochs
+
+
+def thread_limited_env(threads):
+    env = dict(os.environ)
+    for variable in THREAD_ENV_VARS:
+        env[variable] = str(threads)
+    return env
+
+
+def install_file(source, target):
+    """Copy next to the target and rename, a reader never sees a partial file."""
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+    os.close(fd)
+    try:
+        shutil.copyfile(source, temp_path)
+        os.replace(temp_path, target)
+    except OSError:
+        os.unlink(temp_path)
+        raise
+
+
+def best_metric(results, metric=TrainingConstants.PROMOTION_METRIC):
+    values = [row[metric] for row in results if metric in row]
+    return max(values) if values else None
+
+
+class TrainingRun:
+    def __init__(self, run_id, run_dir, process, log_file, epochs):
+        self.id = run_id
+        self.run_dir = run_dir
+        self.process = process
+        self.log_file = log_file
+        self.epochs = epochs
+        self.cancelled = False
+        self.epochs_seen = 0
+        self.best_metric = None
+
+    @property
+    def results_path(self):
+        return os.path.join(self.run_dir, "results.csv")
+
+    @property
+    def weights_path(self):
+        return os.path.join(self.run_dir, "weights", "best.pt")
+
+
+class TrainingManager:
+    def __init__(self, socket_manager=None, registry=model_registry, runs_dir=TrainingConstants.RUNS_DIR,
+                 threads=TrainingConstants.THREADS, progress_interval=TrainingConstants.PROGRESS_INTERVAL):
+        """
+        Train in a separate process and promote the weights when they beat the current model.
+
+        Only one run is active at a time. Its progress is read from results.csv,
+        stored in the training_runs table and published to WebSocket clients.
+
+        Args:
+            socket_manager (ConnectionManager): Receives the progress events, may be None.
+            registry (ModelRegistry): Serves the weights that may get replaced.
+            runs_dir (str): Directory holding one sub-directory per run.
+            threads (int): CPU threads the training process may use.
+            progress_interval (float): Seconds between two reads of results.csv.
+        """
+        self.socket_manager = socket_manager
+        self.registry = registry
+        self.runs_dir = os.path.abspath(runs_dir)
+        self.threads = max(1, threads)
+        self.progress_interval = progress_interval
+        self.active = None
+        self._lock = threading.Lock()
+
+    def recover(self):
+        """Record the runs killed together with the previous server process."""
+        interrupt_unfinished_training_runs()
+
+    def _publish(self, event):
+        if self.socket_manager is not None:
+            self.socket_manager.publish_threadsafe(json.dumps(event))
+
+    def start_run(self, epochs=TrainingConstants.EPOCHS, imgsz=TrainingConstants.IMGSZ,
+                  batch=TrainingConstants.BATCH):
+        """
+        Launch a training process.
+
+        Returns:
+            int: Id of the training run.
+
+        Raises:
+            RuntimeError: When a run is already active.
+        """
+        with self._lock:
+            if self.active is not None:
+                raise RuntimeError(f"Training run {self.active.id} is still active")
+
+            args = {"epochs": epochs, "imgsz": imgsz, "batch": batch, "threads": self.threads}
+            run_id = insert_training_run(args, epochs)
+            name = f"run_{run_id}"
+            run_dir = os.path.join(self.runs_dir, name)
+            os.makedirs(run_dir, exist_ok=True)
+
+            env = thread_limited_env(self.threads)
+            log_file = open(os.path.join(run_dir, "train.log"), "ab")
+            try:
+                process = subprocess.Popen(
+                    [sys.executable, "-m", "ai.classifier",
+                     "--epochs", str(epochs), "--imgsz", str(imgsz), "--batch", str(batch),
+                     "--name", name, "--project", self.runs_dir, "--threads", str(self.threads)],
+                    cwd=REPO_DIR, env=env, stdout=log_file, stderr=subprocess.STDOUT)
+            except OSError as e:
+                log_file.close()
+                update_training_run(run_id, status="failed", error=str(e),
+                                    finished_at=time.time())
+                raise
+
+            self.active = TrainingRun(run_id, run_dir, process, log_file, epochs)
+            update_training_run(run_id, status="running", run_dir=run_dir, pid=process.pid,
+                                started_at=time.time())
+
+        threading.Thread(target=self._monitor, args=(self.active,),
+                         name=f"training-{run_id}", daemon=True).start()
+        logger.info(f"Training run {run_id} started with {self.threads} threads (pid {process.pid}).")
+        self._publish({"type": "training_started", "run_id": run_id, "args": args})
+        return run_id
+
+    def cancel(self, run_id=None, timeout=10):
+        """
+        Stop the active run, or only if it is `run_id`.
+
+        Returns:
+            bool: False if that run wasn't active.
+        """
+        with self._lock:
+            run = self.active
+            if run is None or (run_id is not None and run.id != run_id):
+                return False
+            run.cancelled = True
+
+        run.process.terminate()
+        try:
+            run.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            run.process.kill()
+        return True
+
+    def get_run(self, run_id):
+        return get_training_run(run_id)
+
+    def get_runs(self, limit=50):
+        return get_training_runs(limit)
+
+    def _read_progress(self, run):
+        results = read_results(run.results_path)
+        if len(results) <= run.epochs_seen:
+            return results
+        run.epochs_seen = len(results)
+        latest = results[-1]
+        run.best_metric = best_metric(results)
+        update_training_run(run.id, epoch=int(latest.get("epoch", len(results))),
+                            metrics=latest, best_metric=run.best_metric)
+        self._publish({
+            "type": "training_progress",
+            "run_id": run.id,
+            "epoch": int(latest.get("epoch", len(results))),
+            "epochs": run.epochs,
+            "metrics": latest,
+        })
+        return results
+
+    def _monitor(self, run):
+        try:
+            while run.process.poll() is None:
+                self._read_progress(run)
+                time.sleep(self.progress_interval)
+            self._read_progress(run)
+            self._finish(run)
+        except Exception as e:
+            logger.exception(f"Monitoring training run {run.id} failed")
+            update_training_run(run.id, status="failed", error=str(e), finished_at=time.time())
+        finally:
+            run.log_file.close()
+            with self._lock:
+                if self.active is run:
+                    self.active = None
+
+    def _finish(self, run):
+        if run.cancelled:
+            status, error = "cancelled", None
+        elif run.process.returncode != 0:
+            status, error = "failed", f"Training process exited with code {run.process.returncode}"
+        else:
+            status, error = "succeeded", None
+
+        promoted = status == "succeeded" and self._promote(run)
+        update_training_run(run.id, status=status, error=error, promoted=int(promoted),
+                            finished_at=time.time())
+        logger.info(f"Training run {run.id} {status}.")
+        self._publish({"type": "training_finished", "run_id": run.id, "status": status,
+                       "best_metric": run.best_metric, "promoted": promoted})
+
+    def _export_backend(self, run, backend):
+        logger.info(f"Rebuilding the {backend} model for the promoted weights.")
+        with open(os.path.join(run.run_dir, "export.log"), "ab") as log_file:
+            returncode = subprocess.call(
+                [sys.executable, "-m", "ai.export_backends", backend],
+                cwd=REPO_DIR, env=thread_limited_env(self.threads),
+                stdout=log_file, stderr=subprocess.STDOUT)
+        if returncode != 0:
+            logger.error(f"Exporting the {backend} model failed, it still serves the previous weights.")
+
+    def _current_metric(self):
+        metric = get_promoted_training_metric()
+        if metric is None:
+            # Weights that weren't promoted by us, use the results.csv they were trained with
+            output_dir = os.path.dirname(WEIGHTS_DIR)
+            metric = best_metric(read_results(os.path.join(output_dir, "results.csv")))
+        return metric
+
+    def _promote(self, run):
+        """Replace the served weights by the run's best weights if they score higher."""
+        if run.best_metric is None or not os.path.exists(run.weights_path):
+            logger.warning(f"Training run {run.id} produced no weights or metrics, not promoting.")
+            return False
+
+        current = self._current_metric()
+        if current is not None and run.best_metric <= current:
+            logger.info(
+                f"Training run {run.id} scored {run.best_metric:.4f}, not better than {current:.4f}.")
+            return False
+
+        install_file(run.weights_path, DEFAULT_MODEL_PATH)
+        # The training process also exported ONNX, other backends are rebuilt from best.pt
+        exported_onnx = os.path.join(os.path.dirname(run.weights_path), "best.onnx")
+        if os.path.exists(exported_onnx):
+            install_file(exported_onnx, model_path_for("onnx"))
+        if self.registry.backend in ("onnx-int8", "openvino"):
+            self._export_backend(run, self.registry.backend)
+
+        self.registry.load()
+        logger.info(f"Promoted weights of training run {run.id} ({run.best_metric:.4f}).")
+        return True
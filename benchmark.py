@@ -0,0 +1,327 @@
+"""
+Benchmark the inference path and the serial-to-database pipeline on the bundled images.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --batch-sizes 1 4 8 --workers 1 2 4 --max-images 100
+    python benchmark.py --annotation eager --renderer light --output eager.json
+
+Runs against a throwaway database and image store unless --db is given, and with
+the prediction cache off so repeated images are really scored.
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import sys
+import tempfile
+import threading
+import time
+
+
+DEFAULT_IMAGES_DIR = os.path.join(os.path.dirname(__file__), 'data', 'ai', 'input', 'test', 'images')
+
+
+def percentiles(values):
+    """Summarize latencies in milliseconds."""
+    if not values:
+        return None
+    ordered = sorted(values)
+
+    def at(fraction):
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": at(0.50),
+        "p95": at(0.95),
+        "p99": at(0.99),
+        "max": ordered[-1],
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process."""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Kilobytes on Linux, bytes on macOS
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import psutil
+        memory = psutil.Process().memory_info()
+        return getattr(memory, "peak_wset", memory.rss) / (1024 * 1024)
+
+
+class FakeSerial:
+    def __init__(self, frames, chunk_size=4096, baudrate=None):
+        """
+        Stand-in for `serial.Serial` that plays back JPEG frames as one byte stream.
+
+        Args:
+            frames (list): Raw JPEG frames, sent back to back.
+            chunk_size (int): Bytes returned per read.
+            baudrate (int): Throttle to this line speed (10 bits per byte), unthrottled when None.
+        """
+        self._data = memoryview(b"".join(frames))
+        self._position = 0
+        self.chunk_size = chunk_size
+        self.bytes_per_second = baudrate / 10 if baudrate else None
+        self.is_open = True
+        self.acks = 0
+
+    @property
+    def in_waiting(self):
+        return min(self.chunk_size, len(self._data) - self._position)
+
+    def read(self, size):
+        if self._position >= len(self._data):
+            # Behave like a read timeout on an idle line
+            time.sleep(0.01)
+            return b""
+        chunk = bytes(self._data[self._position:self._position + size])
+        self._position += len(chunk)
+        if self.bytes_per_second:
+            time.sleep(len(chunk) / self.bytes_per_second)
+        return chunk
+
+    def write(self, data):
+        self.acks += 1
+
+    def close(self):
+        self.is_open = False
+
+
+def bench_stages(paths, batch_size):
+    """Time every stage of scoring, batch by batch, the way `predict_batch` runs them."""
+    import cv2
+
+    from ai.model_registry import model_registry
+    from ai.annotation import Annotation, encode_jpeg
+    from ai.predictor import _extract_predictions, get_highest_confidence_predictions
+    from services.write_behind_service import write_behind
+
+    model = model_registry.get_model()
+    stages = {name: [] for name in ("decode", "preprocess", "inference", "postprocess",
+                                    "annotation", "encode", "db_write")}
+
+    for start in range(0, len(paths), batch_size):
+        batch = paths[start:start + batch_size]
+
+        images = []
+        for path in batch:
+            started = time.perf_counter()
+            images.append(cv2.imread(path))
+            stages["decode"].append((time.perf_counter() - started) * 1000)
+
+        with model_registry.inference_lock:
+            results = model(images, batch=len(images), verbose=False)
+
+        outputs = []
+        for result in results:
+            # Ultralytics times its own preprocess/inference/postprocess per image
+            for name in ("preprocess", "inference", "postprocess"):
+                stages[name].append(result.speed[name])
+
+            started = time.perf_counter()
+            predictions = _extract_predictions(result)
+            annotated = Annotation(predictions, result=result).draw()
+            stages["annotation"].append((time.perf_counter() - started) * 1000)
+
+            started = time.perf_counter()
+            annotated_jpeg = encode_jpeg(annotated)
+            stages["encode"].append((time.perf_counter() - started) * 1000)
+            outputs.append((predictions, annotated_jpeg))
+
+        started = time.perf_counter()
+        for predictions, annotated_jpeg in outputs:
+            best = get_highest_confidence_predictions(predictions)
+            if best:
+                write_behind.save_prediction(prediction=best, annotated_image=annotated_jpeg)
+        write_behind.flush()
+        elapsed = (time.perf_counter() - started) * 1000
+        stages["db_write"].extend([elapsed / len(outputs)] * len(outputs))
+
+    return {name: percentiles(values) for name, values in stages.items()}
+
+
+def bench_predict(paths, batch_size):
+    """End-to-end `predict_batch` latency and throughput at one batch size."""
+    from ai.predictor import predict_batch
+
+    samples = [{"name": os.path.basename(path), "path": path} for path in paths]
+    latencies = []
+    started = time.perf_counter()
+    for start in range(0, len(samples), batch_size):
+        batch_started = time.perf_counter()
+        predict_batch(samples[start:start + batch_size])
+        latencies.append((time.perf_counter() - batch_started) * 1000)
+    elapsed = time.perf_counter() - started
+
+    return {
+        "batch_size": batch_size,
+        "images": len(samples),
+        "images_per_second": len(samples) / elapsed,
+        "batch_latency_ms": percentiles(latencies),
+    }
+
+
+def bench_pipeline(frames, workers, batch_size, work_dir, baudrate=None, timeout=600):
+    """Feed frames through a fake serial port into the full pipeline and time every frame."""
+    from ai.inference_scheduler import inference_scheduler
+    from services.frame_pipeline_service import FramePipeline
+    from services.serialport_service import SerialPortManager
+    from services.web_socket_service import ConnectionManager
+    from services.write_behind_service import write_behind
+
+    inference_scheduler.max_batch_size = batch_size
+    socket_manager = ConnectionManager()
+    pipeline = FramePipeline(socket_manager, num_workers=workers, queue_size=len(frames))
+
+    # Per-frame time from leaving the receive loop to the prediction being queued for the database
+    latencies = []
+    latencies_lock = threading.Lock()
+    submitted = {}
+    submit, process_frame = pipeline.submit, pipeline.process_frame
+
+    def timed_submit(data, source=None):
+        submitted[id(data)] = time.perf_counter()
+        return submit(data, source)
+
+    def timed_process_frame(data, source=None):
+        try:
+            return process_frame(data, source)
+        finally:
+            elapsed = (time.perf_counter() - submitted.pop(id(data))) * 1000
+            with latencies_lock:
+                latencies.append(elapsed)
+
+    pipeline.submit = timed_submit
+    pipeline.process_frame = timed_process_frame
+
+    # Sample names must be unique, give every run its own port name
+    manager = SerialPortManager(port=f"BENCH{workers}x{batch_size}", socket_manager=socket_manager,
+                                output_dir=os.path.join(work_dir, "received_images"),
+                                pipeline=pipeline, protocol="raw")
+    manager.serial_connection = FakeSerial(frames, baudrate=baudrate)
+    manager.running = True
+    manager.started_at = time.monotonic()
+
+    pipeline.start()
+    started = time.perf_counter()
+    reader = threading.Thread(target=manager.read_images, daemon=True)
+    reader.start()
+
+    deadline = started + timeout
+    while time.perf_counter() < deadline:
+        stats = pipeline.get_stats()
+        if stats["frames_processed"] + stats["frames_failed"] + stats["frames_dropped"] >= len(frames):
+            break
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+
+    manager.running = False
+    reader.join()
+    pipeline.stop()
+    write_behind.flush()
+
+    stats = pipeline.get_stats()
+    return {
+        "workers": workers,
+        "batch_size": batch_size,
+        "frames": len(frames),
+        "frames_received": manager.frames_received,
+        "frames_processed": stats["frames_processed"],
+        "frames_failed": stats["frames_failed"],
+        "frames_dropped": stats["frames_dropped"],
+        "frames_per_second": stats["frames_processed"] / elapsed,
+        "frame_latency_ms": percentiles(latencies),
+        "max_queue_depth": stats["max_queue_depth"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark inference and the frame pipeline.")
+    parser.add_argument("--images", default=DEFAULT_IMAGES_DIR)
+    parser.add_argument("--max-images", type=int, default=None)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--baudrate", type=int, default=None,
+                        help="Throttle the fake serial port, unthrottled by default")
+    parser.add_argument("--skip-pipeline", action="store_true")
+    parser.add_argument("--db", help="Database to write to, a temporary one by default")
+    parser.add_argument("--cache", action="store_true", help="Keep the prediction cache enabled")
+    parser.add_argument("--annotation", choices=["lazy", "eager"], default="lazy",
+                        help="Render annotated images for every frame (eager) or on demand (lazy)")
+    parser.add_argument("--renderer", choices=["ultralytics", "light"], default="ultralytics")
+    parser.add_argument("--output", help="Write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    paths = sorted(glob.glob(os.path.join(args.images, "*.jpg")))[:args.max_images]
+    if not paths:
+        raise SystemExit(f"No images in {args.images}")
+
+    # Configuration is read on import, set it up before importing the app modules
+    work_dir = tempfile.mkdtemp(prefix="armory-bench-")
+    os.environ["ARMORY_DB_PATH"] = args.db or os.path.join(work_dir, "bench.db")
+    os.environ.setdefault("ARMORY_ANNOTATED_IMAGES_DIR", os.path.join(work_dir, "annotated"))
+    if not args.cache:
+        os.environ["ARMORY_PREDICTION_CACHE"] = "off"
+    os.environ["ARMORY_ANNOTATION"] = args.annotation
+    os.environ["ARMORY_ANNOTATION_RENDERER"] = args.renderer
+
+    from ai.model_registry import model_registry
+    from constants import InferenceConstants
+    from services.db_migrations import run_migrations
+    from services.db_service import create_table
+    from services.write_behind_service import write_behind
+
+    create_table()
+    run_migrations()
+    model_registry.load()
+
+    report = {
+        "meta": {
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "backend": InferenceConstants.BACKEND,
+            "annotation": InferenceConstants.ANNOTATION,
+            "renderer": InferenceConstants.ANNOTATION_RENDERER,
+            "model": model_registry.model_path,
+            "images": len(paths),
+        },
+        "stages_ms": {},
+        "predict": [],
+        "pipeline": [],
+    }
+
+    for batch_size in args.batch_sizes:
+        report["stages_ms"][str(batch_size)] = bench_stages(paths, batch_size)
+        report["predict"].append(bench_predict(paths, batch_size))
+
+    if not args.skip_pipeline:
+        frames = []
+        for path in paths:
+            with open(path, "rb") as image_file:
+                frames.append(image_file.read())
+        for workers in args.workers:
+            for batch_size in args.batch_sizes:
+                report["pipeline"].append(
+                    bench_pipeline(frames, workers, batch_size, work_dir, args.baudrate))
+
+    write_behind.stop()
+    report["peak_rss_mb"] = peak_rss_mb()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as report_file:
+            report_file.write(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
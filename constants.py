@@ -1,4 +1,3 @@
-import yaml
 import os
 
 class BTBLEConstants:
@@ -11,12 +10,163 @@ class BTClassicConstants:
     SERVICE_UUID = "36b26241-4367-4cc3-94f4-d5a0bd52d9d1"
 
 
+class _LazyClassNames:
+    """Read the class names on first access instead of when constants is imported."""
+
+    def __get__(self, instance, owner):
+        names = owner.load_class_names()
+        # Replace the descriptor, later reads are plain attribute lookups
+        owner.CLASS_NAMES = names
+        return names
+
+
 class AIConstants:
 
     def load_class_names():
+        import yaml
+
         yaml_file = os.path.join(os.path.dirname(__file__), 'data', 'ai', 'data.yaml')  
         with open(yaml_file, 'r') as file:
             data = yaml.safe_load(file)
             return data['names']  # Return the list of class names
 
-    CLASS_NAMES = load_class_names()
+    CLASS_NAMES = _LazyClassNames()
+
+
+class StartupConstants:
+
+    # "background": serve right away and load the model in a warm-up task, /health/ready
+    # answers 503 until it is loaded. "blocking": load the model before serving requests
+    WARMUP = os.environ.get("ARMORY_WARMUP", "background")
+    # Budget for importing main, checked by `python profile_startup.py`
+    IMPORT_TARGET_MS = int(os.environ.get("ARMORY_IMPORT_TARGET_MS", 1000))
+
+
+class InferenceConstants:
+
+    # Micro-batching of samples coming from the serial port, uploads and the API
+    MAX_BATCH_SIZE = int(os.environ.get("ARMORY_MAX_BATCH_SIZE", 8))
+    MAX_WAIT_MS = int(os.environ.get("ARMORY_MAX_WAIT_MS", 25))
+    # "pytorch" (best.pt), "onnx" (ONNX Runtime), "onnx-int8" (statically quantized ONNX)
+    # or "openvino", the exported models are built with `python -m ai.export_backends`
+    BACKEND = os.environ.get("ARMORY_INFERENCE_BACKEND", "pytorch")
+    # Prediction cache: "off", "exact" (identical image bytes) or "perceptual" (near-duplicate frames)
+    CACHE_MODE = os.environ.get("ARMORY_PREDICTION_CACHE", "exact")
+    CACHE_MAX_ENTRIES = int(os.environ.get("ARMORY_PREDICTION_CACHE_MAX_ENTRIES", 4096))
+    CACHE_MAX_BYTES = int(os.environ.get("ARMORY_PREDICTION_CACHE_MAX_BYTES", 256 * 1024 * 1024))
+    # Perceptual mode: maximum number of differing bits out of the 64-bit difference hash
+    CACHE_MAX_DISTANCE = int(os.environ.get("ARMORY_PREDICTION_CACHE_MAX_DISTANCE", 4))
+    # Pending LRU updates are written together with the next new entry or after this many hits
+    CACHE_TOUCH_FLUSH = int(os.environ.get("ARMORY_PREDICTION_CACHE_TOUCH_FLUSH", 64))
+    # Tiled inference: images whose longer side exceeds TILE_THRESHOLD pixels are also scored
+    # as overlapping tiles so small objects survive the resize, 0 disables tiling
+    TILE_THRESHOLD = int(os.environ.get("ARMORY_TILE_THRESHOLD", 0))
+    TILE_SIZE = int(os.environ.get("ARMORY_TILE_SIZE", 640))
+    TILE_OVERLAP = float(os.environ.get("ARMORY_TILE_OVERLAP", 0.2))
+    TILE_NMS_IOU = float(os.environ.get("ARMORY_TILE_NMS_IOU", 0.5))
+    TILE_BATCH_SIZE = int(os.environ.get("ARMORY_TILE_BATCH_SIZE", 16))
+    # Per-category tile settings as JSON, e.g. {"pencil": {"size": 480, "overlap": 0.3}, "car": {"size": 0}},
+    # a size of 0 keeps the category to the full frame
+    TILE_CATEGORIES = os.environ.get("ARMORY_TILE_CATEGORIES", "")
+    # "lazy": annotated images are only rendered for live stream subscribers, the API or on
+    # request of a stored prediction. "eager": rendered for every scored frame
+    ANNOTATION = os.environ.get("ARMORY_ANNOTATION", "lazy")
+    # "ultralytics" (Ultralytics' plotting) or "light" (boxes and labels drawn with OpenCV)
+    ANNOTATION_RENDERER = os.environ.get("ARMORY_ANNOTATION_RENDERER", "ultralytics")
+
+
+class TrainingConstants:
+
+    EPOCHS = int(os.environ.get("ARMORY_TRAIN_EPOCHS", 120))
+    IMGSZ = int(os.environ.get("ARMORY_TRAIN_IMGSZ", 640))
+    BATCH = int(os.environ.get("ARMORY_TRAIN_BATCH", 32))
+    # CPU threads the training process may use, leaves the rest to the API and inference
+    THREADS = int(os.environ.get("ARMORY_TRAIN_THREADS", max(1, (os.cpu_count() or 2) // 2)))
+    RUNS_DIR = os.environ.get("ARMORY_TRAIN_RUNS_DIR", os.path.join('data', 'ai', 'runs'))
+    # Seconds between two reads of a run's results.csv
+    PROGRESS_INTERVAL = float(os.environ.get("ARMORY_TRAIN_PROGRESS_INTERVAL", 5))
+    # New weights replace the current ones only if they score higher on this results.csv column
+    PROMOTION_METRIC = os.environ.get("ARMORY_TRAIN_PROMOTION_METRIC", "metrics/mAP50-95(B)")
+
+
+class JobConstants:
+
+    # Analysis jobs handed to the inference scheduler at once, the rest wait in the jobs table
+    MAX_IN_FLIGHT = int(os.environ.get("ARMORY_JOB_MAX_IN_FLIGHT", 32))
+
+
+class SerialConstants:
+
+    PORT = os.environ.get("ARMORY_SERIAL_PORT", "COM5")
+    BAUDRATE = int(os.environ.get("ARMORY_SERIAL_BAUDRATE", 9600))
+
+    def load_ports(default_port=PORT, default_baudrate=BAUDRATE):
+        # e.g. ARMORY_SERIAL_PORTS="COM5:9600,COM6:115200", the baud rate is optional
+        value = os.environ.get("ARMORY_SERIAL_PORTS", default_port)
+        ports = []
+        for entry in value.split(","):
+            entry = entry.strip()
+            if not entry:
+                continue
+            port, _, baudrate = entry.rpartition(":")
+            if not port or not baudrate.isdigit():
+                port, baudrate = entry, ""
+            ports.append({"port": port, "baudrate": int(baudrate) if baudrate else default_baudrate})
+        return ports
+
+    PORTS = load_ports()
+    RECONNECT_DELAY = float(os.environ.get("ARMORY_SERIAL_RECONNECT_DELAY", 5))
+    # Seconds a read blocks waiting for bytes before the receive loop checks for shutdown
+    READ_TIMEOUT = float(os.environ.get("ARMORY_SERIAL_READ_TIMEOUT", 1))
+    MAX_FRAME_SIZE = int(os.environ.get("ARMORY_MAX_FRAME_SIZE", 2 * 1024 * 1024))
+    # "raw" expects bare JPEG bytes acked with IMAGE_RECEIVED, "framed" expects
+    # the checksummed chunk protocol from services/serial_protocol.py
+    PROTOCOL = os.environ.get("ARMORY_SERIAL_PROTOCOL", "raw")
+    WINDOW_SIZE = int(os.environ.get("ARMORY_SERIAL_WINDOW_SIZE", 16))
+    MAX_CHUNK_SIZE = int(os.environ.get("ARMORY_SERIAL_MAX_CHUNK_SIZE", 1024))
+    # Frames waiting for a worker; the receive loop drops frames once this is full
+    QUEUE_SIZE = int(os.environ.get("ARMORY_FRAME_QUEUE_SIZE", 32))
+    WORKERS = int(os.environ.get("ARMORY_FRAME_WORKERS", 2))
+    # "thread" scores frames through the shared batching scheduler,
+    # "process" runs `predict` in a pool of worker processes
+    WORKER_MODE = os.environ.get("ARMORY_FRAME_WORKER_MODE", "thread")
+
+
+class WebSocketConstants:
+
+    # Messages waiting to be sent to a single client
+    SEND_QUEUE_SIZE = int(os.environ.get("ARMORY_WS_SEND_QUEUE_SIZE", 64))
+    # What happens to a client whose queue is full: "drop_oldest", "drop_newest" or "disconnect"
+    SLOW_CLIENT_POLICY = os.environ.get("ARMORY_WS_SLOW_CLIENT_POLICY", "drop_oldest")
+    # A client that takes longer than this to accept a single message is disconnected
+    SEND_TIMEOUT = float(os.environ.get("ARMORY_WS_SEND_TIMEOUT", 10))
+    # Live stream preview variant: annotated frames scaled down to this width and JPEG quality
+    PREVIEW_WIDTH = int(os.environ.get("ARMORY_LIVE_PREVIEW_WIDTH", 320))
+    PREVIEW_QUALITY = int(os.environ.get("ARMORY_LIVE_PREVIEW_QUALITY", 60))
+
+
+class DatabaseConstants:
+
+    PATH = os.environ.get("ARMORY_DB_PATH", os.path.join('data', 'tiny.db'))
+    # Page cache per connection in KiB
+    CACHE_SIZE_KB = int(os.environ.get("ARMORY_DB_CACHE_SIZE_KB", 16 * 1024))
+    # Compiled statements kept per connection
+    STATEMENT_CACHE_SIZE = int(os.environ.get("ARMORY_DB_STATEMENT_CACHE_SIZE", 256))
+    BUSY_TIMEOUT_MS = int(os.environ.get("ARMORY_DB_BUSY_TIMEOUT_MS", 5000))
+    # Write-behind buffer: flush after this many rows or this long after the first queued row
+    WRITE_BATCH_ROWS = int(os.environ.get("ARMORY_DB_WRITE_BATCH_ROWS", 64))
+    WRITE_FLUSH_MS = int(os.environ.get("ARMORY_DB_WRITE_FLUSH_MS", 200))
+
+
+class StorageConstants:
+
+    # Content-addressed store of rendered annotated images
+    ANNOTATED_IMAGES_DIR = os.environ.get(
+        "ARMORY_ANNOTATED_IMAGES_DIR", os.path.join('data', 'annotated'))
+
+
+class MetricsConstants:
+
+    # "on" serves Prometheus metrics at /metrics, "off" turns every metric into a no-op
+    ENABLED = os.environ.get("ARMORY_METRICS", "on") != "off"
+    PREFIX = os.environ.get("ARMORY_METRICS_PREFIX", "armory_")
@@ -0,0 +1,6 @@
+from typing import List
+
+from pydantic import BaseModel
+
+class analyze_samples(BaseModel):
+    sample_ids: List[int]
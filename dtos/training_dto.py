@@ -0,0 +1,8 @@
+from pydantic import BaseModel
+
+from constants import TrainingConstants
+
+class train_options(BaseModel):
+    epochs: int = TrainingConstants.EPOCHS
+    imgsz: int = TrainingConstants.IMGSZ
+    batch: int = TrainingConstants.BATCH
@@ -1,15 +1,19 @@
 import asyncio
 import logging
-import threading
-from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, WebSocketDisconnect, WebSocket
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks, WebSocketDisconnect, WebSocket, Request, Query
 from contextlib import asynccontextmanager
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from db_helper import populate_database
 from services.db_service import (
+    close_all_connections,
     create_table,
     delete_all_predictions,
-    get_all_predictions,
-    get_all_samples,
+    get_predictions_page,
+    iter_prediction_export_rows,
+    get_samples_page,
     get_sample,
     getPredictionById,
     insert_sample,
@@ -21,66 +25,110 @@ from services.db_service import (
     insert_category_attributes
 )
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List
+from typing import List, Optional
 import os
 import shutil
 from datetime import datetime
 from dtos.category_dto import add_category
 from dtos.asset_dto import add_asset
+from dtos.job_dto import analyze_samples
+from dtos.training_dto import train_options
 # from services.bt_ble_service import BluetoothServer
-from ai.predictor import predict
-from ai.classifier import train
-# from services.web_socket_service import ConnectionManager
-from services.serialport_service import SerialPortManager
-
-
-class SocketManager:
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        # logger.info(f"New client connected. Total clients: {
-        #             len(self.active_connections)}")
-
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        # logger.info(f"Client disconnected. Total clients: {
-        #             len(self.active_connections)}")
-
-    async def broadcast(self, message: str):
-        for connection in self.active_connections:
-            try:
-                await connection.send_text(message)
-            except Exception as e:
-                logger.error(f"Error sending message to client: {e}")
-                self.active_connections.remove(connection)
-
-    async def broadcast_image(self, image_data: bytes):
-        """
-        Broadcasts the image data (binary) to all connected WebSocket clients.
-        """
-        for connection in self.active_connections:
-            logger.debug("******************BROADCAST IMAGE******************")
-            try:
-                await connection.send_bytes(image_data)
-            except Exception as e:
-                logger.error(f"Error sending image to client: {e}")
-                self.active_connections.remove(connection)
-
-
-create_table()
-# seed ?
-populate_database()
-
-
-socket_service = SocketManager()
-serial_manager = SerialPortManager(
-    port="COM5", socket_manager=socket_service, baudrate=9600, output_dir="received_images")
-
-
-app = FastAPI()
+from ai.annotation import render_stored_prediction
+from ai.predictor import get_highest_confidence_predictions, to_base64
+from ai.inference_scheduler import inference_scheduler
+from ai.model_registry import model_registry
+from ai.prediction_cache import prediction_cache
+from ai.tiling import tiled_predictor
+from ai.training_service import TrainingManager
+from services.web_socket_service import ConnectionManager
+from services.live_stream_service import VARIANTS, LiveStream
+from services.serial_ingestion_service import SerialIngestionManager
+from services.db_migrations import run_migrations
+from services.image_store import annotated_image_store
+from services.export_service import iter_csv, iter_gzip, iter_ndjson
+from services.category_cache import category_cache
+from services.write_behind_service import write_behind
+from services.job_service import job_manager
+from services.metrics_collectors import register_collectors
+from services.metrics_service import CONTENT_TYPE, metrics
+from constants import StartupConstants
+
+
+socket_service = ConnectionManager()
+live_stream = LiveStream(socket_service)
+training_manager = TrainingManager(socket_manager=socket_service)
+serial_ingestion = SerialIngestionManager(
+    socket_manager=socket_service, live_stream=live_stream)
+register_collectors(serial_ingestion, socket_service, live_stream)
+# Stores scored uploads, the inference scheduler thread only runs the model
+upload_results = ThreadPoolExecutor(max_workers=1, thread_name_prefix="upload-results")
+
+
+# Filled in by the lifespan hook, see /health/ready
+startup_state = {"database": False, "warmup_seconds": None, "warmup_error": None}
+
+
+async def warm_up():
+    """Import the ML stack and load the model off the event loop."""
+    started = time.perf_counter()
+    try:
+        await asyncio.to_thread(model_registry.load)
+    except Exception as e:
+        # The model is loaded again on first use, the error stays visible on /health/ready
+        startup_state["warmup_error"] = str(e)
+        logging.error(f"Failed to load the model at startup: {e}")
+    else:
+        startup_state["warmup_seconds"] = time.perf_counter() - started
+        logging.info(f"Model warmed up in {startup_state['warmup_seconds']:.1f}s.")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Schema and seed data, once per process and before any request is served
+    create_table()
+    run_migrations()
+    populate_database()
+    category_cache.load()
+    startup_state["database"] = True
+
+    # Load the model once so the first frame doesn't pay for it
+    if StartupConstants.WARMUP == "blocking":
+        await warm_up()
+        warmup_task = None
+    else:
+        warmup_task = asyncio.create_task(warm_up())
+
+    # Connect every configured port and read from each on its own thread,
+    # processing runs on the shared pipeline workers
+    serial_ingestion.start(asyncio.get_running_loop())
+    logging.info("Serial communication threads started.")
+
+    # Resume the analysis jobs interrupted by the last shutdown
+    job_manager.start()
+    training_manager.recover()
+
+    yield
+
+    if warmup_task is not None and not warmup_task.done():
+        warmup_task.cancel()
+    # Gracefully close the serial connections
+    serial_ingestion.stop()
+    await socket_service.close_all()
+    # A training process must not outlive the server
+    training_manager.cancel()
+    # Unfinished jobs stay in the jobs table and resume on the next start
+    job_manager.stop()
+    inference_scheduler.stop()
+    upload_results.shutdown(wait=True)
+    # Keep the LRU order of the cache entries hit since the last write
+    prediction_cache.flush()
+    # Make sure every queued sample and prediction reaches the database
+    write_behind.stop()
+    close_all_connections()
+
+
+app = FastAPI(lifespan=lifespan)
 logger = logging.getLogger(__name__)
 logging.basicConfig(filename='armory.log',
                     encoding='utf-8', level=logging.DEBUG)
@@ -100,29 +148,56 @@ app.add_middleware(
 )
 
 
-@app.on_event("startup")
-def startup_event():
-    # Establish the serial connection
-    serial_manager.connect()
+@app.get("/health/live")
+def liveness():
+    """The process is up and serving requests, whatever the state of the model."""
+    return {"status": "alive"}
 
-    # Start reading images in a separate thread
-    threading.Thread(target=lambda: asyncio.run(
-        serial_manager.run()), daemon=True).start()
-    logging.info("Serial communication thread started.")
 
+@app.get("/health/ready")
+def readiness():
+    """Ready once the database is set up and the model is loaded."""
+    ready = startup_state["database"] and model_registry.model is not None
+    content = {
+        "status": "ready" if ready else "warming_up",
+        "database": startup_state["database"],
+        "model": model_registry.model is not None,
+        "backend": model_registry.backend,
+        "warmup_seconds": startup_state["warmup_seconds"],
+        "warmup_error": startup_state["warmup_error"],
+    }
+    return JSONResponse(content=content, status_code=200 if ready else 503)
 
-# FastAPI shutdown event
-@app.on_event("shutdown")
-def shutdown_event():
-    # Gracefully close the serial connection
-    serial_manager.disconnect()
 
+@app.get("/metrics")
+def get_metrics():
+    """Counters and latency histograms in the Prometheus text format, 404 when ARMORY_METRICS=off."""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return Response(content=metrics.render(), media_type=CONTENT_TYPE)
 
-@app.get("/samples")
-def get_samples():
-    data = get_all_samples()
 
-    return data
+@app.get("/serial/stats")
+def get_serial_stats():
+    return serial_ingestion.get_stats()
+
+
+@app.get("/serial/ports")
+def get_serial_ports():
+    return serial_ingestion.get_stats()["ports"]
+
+
+@app.get("/serial/ports/{port:path}")
+def get_serial_port(port: str):
+    stats = serial_ingestion.get_port_stats(port)
+    if stats is None:
+        raise HTTPException(status_code=404, detail="Serial port not found")
+    return stats
+
+
+@app.get("/samples")
+def get_samples(limit: int = Query(50, ge=1, le=500), after_id: Optional[int] = None):
+    return get_samples_page(limit=limit, after_id=after_id)
 
 
 @app.post("/predictions/delete")
@@ -131,6 +206,29 @@ def predictions_deleted_all():
     return {"message": f"Successfully deleted all predictions"}
 
 
+def save_scored_sample(sample_id, sample, future):
+    """Store the prediction of an uploaded sample once its batch has been scored."""
+    try:
+        predictions_array, annotated_image = future.result()
+        if annotated_image is None:
+            logger.error(f"Prediction error: {predictions_array}")
+            return
+        predictions = get_highest_confidence_predictions(predictions_array)
+        if predictions:
+            # Publish first, an image rendered for live subscribers is stored with the prediction
+            live_stream.publish(predictions, annotated_image, sample)
+            write_behind.save_prediction(
+                prediction=predictions, annotated_image=annotated_image, sample_id=sample_id,
+                detections=predictions_array)
+    except Exception as e:
+        logger.error(f"Failed to score uploaded sample: {e}")
+
+
+def hand_off_scored_sample(sample_id, sample, future):
+    """Done callback of an upload, it runs on the scheduler thread so the storing is handed off."""
+    upload_results.submit(save_scored_sample, sample_id, sample, future)
+
+
 @app.post("/samples/upload")
 async def upload(files: List[UploadFile] = File(...)):
     for file in files:
@@ -139,12 +237,25 @@ async def upload(files: List[UploadFile] = File(...)):
             if not os.path.exists(tempFolder):
                 os.makedirs(tempFolder)
 
-            tempPath = tempFolder + file.filename
+            # Every upload gets its own file, a re-upload must not replace the image
+            # that the predictions of the previous sample were drawn on
+            upload_date = datetime.now()
+            tempPath = f"{tempFolder}{upload_date:%Y%m%d%H%M%S%f}_{file.filename}"
             with open(tempPath, "wb") as buffer:
                 shutil.copyfileobj(file.file, buffer)
 
-            insert_sample(file.filename, tempFolder +
-                          file.filename, datetime.now(), False)
+            sample_id = insert_sample(
+                file.filename, tempPath, upload_date, False)
+
+            # Score the sample in the background, batched with the other uploads
+            sample = {
+                "name": file.filename,
+                "path": tempPath,
+                "upload_date": upload_date,
+                "is_deleted": False
+            }
+            inference_scheduler.submit(sample).add_done_callback(
+                partial(hand_off_scored_sample, sample_id, sample))
 
         except Exception as e:
             raise HTTPException(status_code=500, detail='Something went wrong')
@@ -154,10 +265,33 @@ async def upload(files: List[UploadFile] = File(...)):
     return {"message": f"Successfully uploaded samples {[file.filename for file in files]}"}
 
 
-@app.post("/samples/{sampleId}/analyze")
-async def analyze_sample(sampleId: int, backgroundTasks: BackgroundTasks):
+@app.post("/samples/analyze", status_code=202)
+def analyze_samples_bulk(analyzeObj: analyze_samples):
+    job_ids = job_manager.submit(analyzeObj.sample_ids)
+    return {"message": "Accepted", "jobIds": job_ids}
+
+
+@app.post("/samples/analyze-unscored", status_code=202)
+def analyze_unscored_samples():
+    job_ids = job_manager.analyze_unscored()
+    return {"message": "Accepted", "jobIds": job_ids}
+
+
+@app.post("/samples/{sampleId}/analyze", status_code=202)
+def analyze_sample(sampleId: int):
+    if get_sample(sampleId) is None:
+        raise HTTPException(status_code=404, detail="Sample not found")
+
+    (job_id,) = job_manager.submit([sampleId])
+    return {"message": "Accepted", "sampleId": sampleId, "jobId": job_id}
 
-    return {"message": "Accepted", "sampleId": sampleId}
+
+@app.get("/jobs/{jobId}")
+def get_job(jobId: int):
+    job = job_manager.get_job(jobId)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 
 @app.get("/assets")
@@ -184,12 +318,21 @@ def get_categories():
 async def add_category(addCategoryObj: add_category):
 
     added_date = datetime.now().timestamp()
-    insert_category(addCategoryObj.name, addCategoryObj.description,
-                    added_date, addCategoryObj.is_active)
+    category_id = insert_category(addCategoryObj.name, addCategoryObj.description,
+                                  added_date, addCategoryObj.is_active)
+    if category_id is None:
+        raise HTTPException(
+            status_code=409, detail="A category with this name already exists")
+    category_cache.invalidate()
 
     return {"message": "Successfully added category"}
 
 
+@app.get("/categories/cache")
+def get_category_cache_stats():
+    return category_cache.get_stats()
+
+
 @app.get("/categories/{categoryId}/attributes")
 def get_attributes(categoryId: int):
     return get_category_attributes(categoryId)
@@ -199,22 +342,76 @@ def get_attributes(categoryId: int):
 async def add_attributes(categoryId: int, addAttributesObj: dict):
 
     insert_category_attributes(categoryId, addAttributesObj)
+    category_cache.invalidate()
 
     return {"message": "Successfully added category attributes"}
 
 
-@app.post("/ai/train")
-async def train_model():
-    train()
+@app.post("/ai/train", status_code=202)
+def train_model(trainObj: Optional[train_options] = None):
+    options = trainObj or train_options()
+    try:
+        run_id = training_manager.start_run(
+            epochs=options.epochs, imgsz=options.imgsz, batch=options.batch)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"message": "Training started", "runId": run_id}
+
+
+@app.get("/ai/train/runs")
+def get_training_runs(limit: int = Query(50, ge=1, le=500)):
+    return training_manager.get_runs(limit)
+
+
+@app.get("/ai/train/runs/{runId}")
+def get_training_run(runId: int):
+    run = training_manager.get_run(runId)
+    if run is None:
+        raise HTTPException(status_code=404, detail="Training run not found")
+    return run
+
+
+@app.post("/ai/train/runs/{runId}/cancel")
+def cancel_training_run(runId: int):
+    if not training_manager.cancel(runId):
+        raise HTTPException(status_code=409, detail="Training run is not active")
+    return {"message": "Training cancelled"}
+
+
+@app.post("/ai/model/reload")
+def reload_model():
+    model_registry.load()
+    return {"message": "Model reloaded"}
+
+
+@app.get("/ai/cache")
+def get_prediction_cache_stats():
+    return prediction_cache.get_stats()
+
+
+@app.delete("/ai/cache")
+def clear_prediction_cache():
+    prediction_cache.clear()
+    return {"message": "Prediction cache cleared"}
+
+
+@app.get("/ai/tiling")
+def get_tiling_stats():
+    return tiled_predictor.get_stats()
 
 
 @app.post("/ai/predict")
-async def predict_image():
-    predictions, img_base64 = predict()
+async def predict_image(sampleId: int):
+    sample = get_sample(sampleId)
+    if sample is None:
+        raise HTTPException(status_code=404, detail="Sample not found")
+
+    predictions, annotated_image = await asyncio.wrap_future(
+        inference_scheduler.submit(dict(sample)))
 
     return JSONResponse(content={
         "predictions": predictions,
-        "annotated_image_base64": img_base64
+        "annotated_image_base64": to_base64(annotated_image)
     })
 
 
@@ -238,10 +435,39 @@ async def websocket_endpoint(websocket: WebSocket):
         while True:
             data = await websocket.receive_text()
             # Broadcast message to all clients
-            await socket_service.broadcast(f"Client said: {data}")
+            socket_service.publish(f"Client said: {data}")
     except WebSocketDisconnect:
+        socket_service.publish("A client disconnected.")
+    finally:
         socket_service.disconnect(websocket)  # Disconnect WebSocket client
-        await socket_service.broadcast("A client disconnected.")
+
+
+@app.websocket("/ws/live")
+async def live_websocket_endpoint(websocket: WebSocket, variant: str = "full"):
+    """
+    Stream every scored frame as one binary message per frame: a 4-byte big-endian
+    header length, the JSON header, then the annotated JPEG.
+    Connect with ?variant=preview for the downscaled frames.
+    """
+    topic = VARIANTS.get(variant)
+    if topic is None:
+        await websocket.close(code=1008)
+        return
+
+    await socket_service.connect(websocket, topics=(topic,))
+    try:
+        while True:
+            # Nothing is expected from the client, this only notices the disconnect
+            await websocket.receive_text()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        socket_service.disconnect(websocket)
+
+
+@app.get("/ws/stats")
+def get_websocket_stats():
+    return {**socket_service.get_stats(), "live": live_stream.get_stats()}
 
 
 @app.get("/samples/{sampleId}/image")
@@ -266,9 +492,25 @@ async def get_image(sampleId):
 
 
 @app.get("/predictions")
-async def get_all_predictions_api():
+def get_all_predictions_api(
+        limit: int = Query(50, ge=1, le=500),
+        after_id: Optional[int] = None,
+        class_name: Optional[str] = None,
+        min_confidence: Optional[float] = Query(None, ge=0, le=1),
+        max_confidence: Optional[float] = Query(None, ge=0, le=1),
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+        include_details: bool = True):
     try:
-        predictions = get_all_predictions()
+        predictions = get_predictions_page(
+            limit=limit,
+            after_id=after_id,
+            class_name=class_name,
+            min_confidence=min_confidence,
+            max_confidence=max_confidence,
+            created_from=created_from.timestamp() if created_from else None,
+            created_to=created_to.timestamp() if created_to else None,
+            include_details=include_details)
         return JSONResponse(predictions)
     except Exception as e:
         return JSONResponse(
@@ -277,6 +519,21 @@ async def get_all_predictions_api():
         )
 
 
+@app.get("/predictions/export")
+def export_predictions(format: str = Query("ndjson", pattern="^(ndjson|csv)$"), gzip: bool = False):
+    rows = iter_prediction_export_rows()
+    if format == "csv":
+        chunks, media_type, filename = iter_csv(rows), "text/csv", "predictions.csv"
+    else:
+        chunks, media_type, filename = iter_ndjson(rows), "application/x-ndjson", "predictions.ndjson"
+
+    if gzip:
+        chunks, media_type, filename = iter_gzip(chunks), "application/gzip", filename + ".gz"
+
+    return StreamingResponse(chunks, media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="{filename}"'})
+
+
 @app.get("/prediction/{prediction_id}")
 def get_prediction_by_id(prediction_id: int):
     prediction = getPredictionById(prediction_id)
@@ -287,3 +544,33 @@ def get_prediction_by_id(prediction_id: int):
     result = dict(prediction)
 
     return result
+
+
+@app.get("/predictions/{prediction_id}/annotated-image")
+def get_annotated_image(prediction_id: int, request: Request):
+    prediction = getPredictionById(prediction_id)
+    if not prediction:
+        raise HTTPException(
+            status_code=404, detail="Annotated image not found")
+
+    image_hash = prediction["annotated_image_hash"]
+    if not image_hash:
+        # Not rendered when the frame was scored, render it once and keep it in the store.
+        # A sync handler runs in the threadpool, the rendering doesn't block the event loop
+        image_hash = render_stored_prediction(prediction)
+        if not image_hash:
+            raise HTTPException(
+                status_code=404, detail="Annotated image not found")
+    image_path = annotated_image_store.path_for(image_hash)
+    if not os.path.exists(image_path):
+        raise HTTPException(
+            status_code=404, detail="Annotated image not found")
+
+    # Stored images never change, so the content hash is a strong ETag
+    etag = f'"{image_hash}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+
+    # FileResponse streams the file and answers Range requests
+    return FileResponse(image_path, media_type="image/jpeg", headers=headers)
@@ -0,0 +1,109 @@
+"""
+Profile the cold start of the API: how long `import main` takes and which modules it pulls in.
+
+    python profile_startup.py
+    python profile_startup.py --target-ms 800 --json data/startup.json
+
+Runs `python -X importtime -c "import main"` in a fresh interpreter and exits with
+status 1 when the import exceeds the target or loads one of the heavy ML modules,
+those must only be imported by the warm-up task.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from constants import StartupConstants
+
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Importing any of these costs seconds, they belong to the model warm-up
+HEAVY_MODULES = ("torch", "ultralytics", "cv2", "onnxruntime", "openvino", "PIL", "yaml")
+
+
+def parse_importtime(output):
+    """
+    Parse the `-X importtime` report.
+
+    Returns:
+        list: One dict per imported module with its self and cumulative time in ms
+        and its nesting depth, 0 for the modules imported directly by `-c`.
+    """
+    imports = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        stripped = name.lstrip()
+        imports.append({
+            "module": stripped.rstrip(),
+            "self_ms": int(self_us) / 1000,
+            "cumulative_ms": int(cumulative_us) / 1000,
+            "depth": (len(name) - len(stripped) - 1) // 2,
+        })
+    return imports
+
+
+def profile(module="main"):
+    started = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR, capture_output=True, text=True)
+    wall_ms = (time.perf_counter() - started) * 1000
+    if completed.returncode != 0:
+        raise SystemExit(f"Importing {module} failed:\n{completed.stderr}")
+
+    imports = parse_importtime(completed.stderr)
+    # Children are reported before their parent, keep the module's own subtree and
+    # leave out what the interpreter imports at startup
+    end = max(index for index, entry in enumerate(imports)
+              if entry["depth"] == 0 and entry["module"] == module)
+    start = end
+    while start > 0 and imports[start - 1]["depth"] > 0:
+        start -= 1
+    imports = imports[start:end + 1]
+
+    loaded = {entry["module"].split(".")[0] for entry in imports}
+    return {
+        "module": module,
+        "wall_ms": wall_ms,
+        "import_ms": imports[-1]["cumulative_ms"],
+        "modules": len(imports),
+        "heavy_modules": sorted(loaded.intersection(HEAVY_MODULES)),
+        "imports": imports,
+    }
+
+
+def print_report(report, top, target_ms):
+    print(f"import {report['module']}: {report['import_ms']:.0f} ms "
+          f"({report['modules']} modules, {report['wall_ms']:.0f} ms with interpreter start), "
+          f"target {target_ms} ms")
+    if report["heavy_modules"]:
+        print(f"Heavy modules imported eagerly: {', '.join(report['heavy_modules'])}")
+
+    print(f"\n{'cumulative ms':>14} {'self ms':>9}  module")
+    slowest = sorted(report["imports"], key=lambda entry: entry["cumulative_ms"], reverse=True)
+    for entry in slowest[:top]:
+        print(f"{entry['cumulative_ms']:>14.1f} {entry['self_ms']:>9.1f}  "
+              f"{'  ' * entry['depth']}{entry['module']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile the import time of the API.")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--target-ms", type=int, default=StartupConstants.IMPORT_TARGET_MS)
+    parser.add_argument("--top", type=int, default=25, help="Number of slowest imports to list")
+    parser.add_argument("--json", help="Also write the full report to this file")
+    args = parser.parse_args()
+
+    report = profile(args.module)
+    print_report(report, args.top, args.target_ms)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump({**report, "target_ms": args.target_ms}, report_file, indent=2)
+
+    if report["import_ms"] > args.target_ms or report["heavy_modules"]:
+        sys.exit(1)
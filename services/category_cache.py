@@ -0,0 +1,101 @@
+import json
+import threading
+
+from services.db_service import get_categories_with_attributes
+from .helper_log import logger
+
+
+class CategoryCache:
+    def __init__(self):
+        """Categories and their parsed attributes, keyed by name and by id."""
+        self._by_name = {}
+        self._by_id = {}
+        self._loaded = False
+        # Bumped by every invalidation, a load that started before one is stale
+        self._generation = 0
+        self._lock = threading.Lock()
+        # Only one thread reads the database, the others wait for its result
+        self._load_lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    def load(self):
+        """(Re)load every category and its attributes from the database."""
+        with self._load_lock:
+            self._load()
+
+    def _load(self):
+        while True:
+            with self._lock:
+                generation = self._generation
+
+            by_name = {}
+            by_id = {}
+            for row in get_categories_with_attributes():
+                category = {
+                    "id": row["id"],
+                    "name": row["name"],
+                    "description": row["description"],
+                    "is_active": bool(row["is_active"]),
+                    "attributes": json.loads(row["data"]) if row["data"] else None,
+                }
+                by_name[category["name"]] = category
+                by_id[category["id"]] = category
+
+            with self._lock:
+                if generation != self._generation:
+                    # Invalidated while reading, the snapshot may miss that change
+                    continue
+                self._by_name = by_name
+                self._by_id = by_id
+                self._loaded = True
+                self.loads += 1
+            break
+        logger.info(f"Category cache loaded with {len(by_name)} categories.")
+
+    def invalidate(self):
+        """Drop the cached categories, they are reloaded on the next lookup."""
+        with self._lock:
+            self._generation += 1
+            self._loaded = False
+
+    def _lookup(self, index, key):
+        if not self._loaded:
+            with self._load_lock:
+                # Another thread may have reloaded while we waited
+                if not self._loaded:
+                    self._load()
+        category = index().get(key)
+        # Counters are best effort, no lock on the hot path
+        if category is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return category
+
+    def get_by_name(self, name):
+        return self._lookup(lambda: self._by_name, name)
+
+    def get_by_id(self, category_id):
+        return self._lookup(lambda: self._by_id, category_id)
+
+    def get_attributes(self, name):
+        """Return the parsed attribute dict of a category, or None."""
+        category = self.get_by_name(name)
+        return category["attributes"] if category else None
+
+    def get_stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "categories": len(self._by_name),
+            "loaded": self._loaded,
+            "loads": self.loads,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+category_cache = CategoryCache()
@@ -0,0 +1,253 @@
+import os
+
+from services.db_service import get_db_connection
+from services.image_store import store_annotated_image
+from .helper_log import logger
+
+
+def _deduplicate_sample_names(cursor):
+    """Rename samples sharing a name, e.g. "image_1.jpg" -> "image_1_42.jpg"."""
+    cursor.execute('''
+        SELECT id, name FROM samples
+        WHERE id NOT IN (SELECT MIN(id) FROM samples GROUP BY name)
+    ''')
+    for sample_id, name in cursor.fetchall():
+        stem, ext = os.path.splitext(name)
+        cursor.execute('UPDATE samples SET name = ? WHERE id = ?',
+                       (f"{stem}_{sample_id}{ext}", sample_id))
+
+
+def _deduplicate_categories(cursor):
+    """Merge categories sharing a name into the oldest one."""
+    cursor.execute('''
+        SELECT c.id, keep.id FROM categories c
+        JOIN (SELECT name, MIN(id) AS id FROM categories GROUP BY name) keep
+            ON keep.name = c.name
+        WHERE c.id != keep.id
+    ''')
+    for duplicate_id, keep_id in cursor.fetchall():
+        cursor.execute('UPDATE assets SET category_id = ? WHERE category_id = ?',
+                       (keep_id, duplicate_id))
+        cursor.execute('UPDATE category_attributes SET category_id = ? WHERE category_id = ?',
+                       (keep_id, duplicate_id))
+        cursor.execute('DELETE FROM categories WHERE id = ?', (duplicate_id,))
+
+
+def add_lookup_indexes(cursor):
+    _deduplicate_sample_names(cursor)
+    cursor.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_samples_name ON samples (name)')
+
+    _deduplicate_categories(cursor)
+    cursor.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_categories_name ON categories (name)')
+
+    # Only the first attributes row of a category was ever read back
+    cursor.execute('''
+        DELETE FROM category_attributes
+        WHERE id NOT IN (SELECT MIN(id) FROM category_attributes GROUP BY category_id)
+    ''')
+    cursor.execute(
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_category_attributes_category_id ON category_attributes (category_id)')
+
+
+def add_prediction_sample_link(cursor):
+    cursor.execute('ALTER TABLE predictions ADD COLUMN created_at REAL')
+    cursor.execute(
+        'ALTER TABLE predictions ADD COLUMN sample_id INTEGER REFERENCES samples (id)')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_predictions_sample_id ON predictions (sample_id)')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_predictions_created_at ON predictions (created_at)')
+
+
+def move_annotated_images_to_files(cursor):
+    """Rebuild predictions with the annotated image in the file store and only its hash in the row."""
+    cursor.execute('''
+    CREATE TABLE predictions_new (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        class_id INTEGER NOT NULL,
+        class_name TEXT NOT NULL,
+        attributes TEXT,
+        confidence REAL NOT NULL,
+        bbox TEXT NOT NULL,
+        annotated_image_hash TEXT,
+        created_at REAL,
+        sample_id INTEGER REFERENCES samples (id)
+        );
+    ''')
+
+    reader = cursor.connection.cursor()
+    reader.execute('''
+        SELECT id, class_id, class_name, attributes, confidence, bbox, annotated_image, created_at, sample_id
+        FROM predictions
+    ''')
+    while True:
+        rows = reader.fetchmany(100)
+        if not rows:
+            break
+        for row in rows:
+            cursor.execute('''
+                INSERT INTO predictions_new (id, class_id, class_name, attributes, confidence, bbox,
+                    annotated_image_hash, created_at, sample_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (*row[:6], store_annotated_image(row[6]), row[7], row[8]))
+
+    cursor.execute('DROP TABLE predictions')
+    cursor.execute('ALTER TABLE predictions_new RENAME TO predictions')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_predictions_sample_id ON predictions (sample_id)')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_predictions_created_at ON predictions (created_at)')
+
+
+def add_row_counters(cursor):
+    """Keep row counts of the big tables up to date with triggers, so totals don't need COUNT(*)."""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS row_counts (
+        name TEXT PRIMARY KEY,
+        count INTEGER NOT NULL
+    );
+    ''')
+    for table in ('samples', 'predictions'):
+        cursor.execute(
+            f'INSERT OR REPLACE INTO row_counts (name, count) SELECT ?, COUNT(*) FROM {table}', (table,))
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_count_insert AFTER INSERT ON {table}
+        BEGIN
+            UPDATE row_counts SET count = count + 1 WHERE name = '{table}';
+        END;
+        ''')
+        cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_count_delete AFTER DELETE ON {table}
+        BEGIN
+            UPDATE row_counts SET count = count - 1 WHERE name = '{table}';
+        END;
+        ''')
+
+
+def add_prediction_class_index(cursor):
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_predictions_class_name ON predictions (class_name, id)')
+
+
+def add_prediction_cache(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS prediction_cache (
+        image_hash TEXT PRIMARY KEY,
+        perceptual_hash TEXT,
+        model_version TEXT NOT NULL,
+        predictions TEXT NOT NULL,
+        annotated_image_hash TEXT,
+        size INTEGER NOT NULL,
+        last_used REAL NOT NULL
+    );
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_prediction_cache_version ON prediction_cache (model_version, last_used)')
+
+
+def add_jobs(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sample_id INTEGER NOT NULL REFERENCES samples (id),
+        status TEXT NOT NULL,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        prediction_id INTEGER REFERENCES predictions (id),
+        result TEXT,
+        error TEXT
+    );
+    ''')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, id)')
+    cursor.execute(
+        'CREATE INDEX IF NOT EXISTS idx_jobs_sample_id ON jobs (sample_id)')
+
+
+def add_training_runs(cursor):
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS training_runs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        status TEXT NOT NULL,
+        args TEXT NOT NULL,
+        run_dir TEXT,
+        pid INTEGER,
+        created_at REAL NOT NULL,
+        started_at REAL,
+        finished_at REAL,
+        epoch INTEGER,
+        epochs INTEGER,
+        metrics TEXT,
+        best_metric REAL,
+        promoted INTEGER NOT NULL DEFAULT 0,
+        error TEXT
+    );
+    ''')
+
+
+def add_prediction_detections(cursor):
+    cursor.execute('ALTER TABLE predictions ADD COLUMN detections TEXT')
+
+
+def add_sample_source(cursor):
+    # Serial port a frame was received on, NULL for uploaded samples
+    cursor.execute('ALTER TABLE samples ADD COLUMN source TEXT')
+
+
+# Append new migrations at the end, never change or reorder the existing ones.
+# The version of a database is stored in PRAGMA user_version.
+MIGRATIONS = [
+    (1, "Add lookup indexes on samples, categories and category_attributes", add_lookup_indexes),
+    (2, "Add created_at and sample_id to predictions", add_prediction_sample_link),
+    (3, "Move annotated images from predictions to the file store", move_annotated_images_to_files),
+    (4, "Add trigger-maintained row counters", add_row_counters),
+    (5, "Add class_name index for filtered prediction pages", add_prediction_class_index),
+    (6, "Add the persistent prediction cache", add_prediction_cache),
+    (7, "Add the analysis jobs table", add_jobs),
+    (8, "Add the training runs table", add_training_runs),
+    (9, "Store every detection of a prediction to render it on demand", add_prediction_detections),
+    (10, "Add the source port of samples", add_sample_source),
+]
+
+# Versions after which the database file is compacted
+VACUUM_AFTER = {3}
+
+
+def get_schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def run_migrations():
+    """Upgrade the database in place to the latest schema version."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    version = start_version = get_schema_version(conn)
+
+    for target, description, migrate in MIGRATIONS:
+        if target <= version:
+            continue
+
+        logger.info(f"Migrating database to version {target}: {description}")
+        try:
+            # Each migration and its version bump are applied atomically
+            cursor.execute('BEGIN')
+            migrate(cursor)
+            cursor.execute(f'PRAGMA user_version = {target}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logger.exception(f"Database migration to version {target} failed")
+            raise
+        version = target
+
+    # Reclaim the space freed by migrations that dropped large data,
+    # VACUUM can't run inside a transaction
+    if any(start_version < target <= version for target in VACUUM_AFTER):
+        logger.info("Compacting the database.")
+        conn.execute('VACUUM')
+
+    conn.close()
+    return version
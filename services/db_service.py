@@ -2,23 +2,112 @@ import logging
 import sqlite3
 import json
 import os
+import functools
+import threading
+import weakref
+from datetime import datetime
+from constants import DatabaseConstants
+from services.image_store import store_annotated_image
 from .helper_log import logger
 
 
-def get_db_connection():
+class PooledConnection(sqlite3.Connection):
+    """A connection owned by one thread and reused across calls."""
+
+    def close(self):
+        # Helpers call close() when they are done, keep the connection open for
+        # the next call and only drop work that was never committed
+        if self.in_transaction:
+            self.rollback()
+
+    def close_connection(self):
+        super().close()
 
-    data_dir = 'data'
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
 
-    db_path = os.path.join(data_dir, 'tiny.db')
+_local = threading.local()
+_connections = weakref.WeakSet()
+_connections_lock = threading.Lock()
+# Bumped by close_all_connections, threads holding an older connection open a new one
+_pool_generation = 0
 
-    conn = sqlite3.connect(db_path)
+
+def open_db_connection(check_same_thread=True, factory=sqlite3.Connection):
+    """Open a new, tuned connection to the database."""
+    data_dir = os.path.dirname(DatabaseConstants.PATH)
+    if data_dir and not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+
+    conn = sqlite3.connect(
+        DatabaseConstants.PATH,
+        factory=factory,
+        check_same_thread=check_same_thread,
+        cached_statements=DatabaseConstants.STATEMENT_CACHE_SIZE,
+        timeout=DatabaseConstants.BUSY_TIMEOUT_MS / 1000)
     conn.row_factory = sqlite3.Row  # Allows column access by name
 
+    # Readers don't block the writer and commits don't fsync every time
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute(f'PRAGMA cache_size=-{DatabaseConstants.CACHE_SIZE_KB}')
+    conn.execute('PRAGMA temp_store=MEMORY')
+
     return conn
 
 
+def get_db_connection():
+    """Return this thread's pooled connection, opening it on first use or after the pool was closed."""
+    conn = getattr(_local, 'conn', None)
+    if conn is not None and _local.generation == _pool_generation and conn.in_transaction:
+        # Left open by a caller that failed without rolling back, don't keep holding the write lock
+        conn.rollback()
+    if conn is None or _local.generation != _pool_generation:
+        # Not bound to the thread so close_all_connections can close it at shutdown
+        conn = open_db_connection(
+            check_same_thread=False, factory=PooledConnection)
+        with _connections_lock:
+            _local.conn = conn
+            _local.generation = _pool_generation
+            _connections.add(conn)
+
+    return conn
+
+
+def rollback_on_error(helper):
+    """
+    Roll back the thread's pooled connection when a helper raises before committing.
+
+    The connection outlives the helper, an open transaction would hold the
+    database write lock and make every other thread time out.
+    """
+    @functools.wraps(helper)
+    def wrapper(*args, **kwargs):
+        try:
+            return helper(*args, **kwargs)
+        except Exception:
+            conn = getattr(_local, 'conn', None)
+            if conn is not None and conn.in_transaction:
+                conn.rollback()
+            raise
+    return wrapper
+
+
+def close_all_connections():
+    """Close every pooled connection, e.g. on application shutdown or after a restore."""
+    global _pool_generation
+    with _connections_lock:
+        _pool_generation += 1
+        connections = list(_connections)
+        _connections.clear()
+
+    for conn in connections:
+        try:
+            conn.close_connection()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to close database connection: {e}")
+    _local.__dict__.pop('conn', None)
+
+
+@rollback_on_error
 def create_table():
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -104,6 +193,52 @@ def get_all_samples():
             conn.close()
 
 
+def count_rows(table):
+    """Return the row count of a table from the trigger-maintained counters."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT count FROM row_counts WHERE name = ?', (table,))
+    row = cursor.fetchone()
+
+    conn.close()
+    return row['count'] if row else None
+
+
+def _page(items, limit):
+    return {
+        "items": items,
+        # Pass as after_id to get the next page, None on the last page
+        "next_after_id": items[-1]["id"] if len(items) == limit else None,
+    }
+
+
+def get_samples_page(limit=50, after_id=None):
+    """
+    Return one page of samples ordered by id, soft-deleted samples included.
+
+    Args:
+        limit (int): Maximum number of samples.
+        after_id (int): Only return samples with a greater id.
+
+    Returns:
+        dict: The page, see `_page`, and "total", the number of samples including the soft-deleted ones.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT id, name, path, upload_date, is_deleted, source FROM samples
+        WHERE id > ?
+        ORDER BY id
+        LIMIT ?
+    ''', (after_id or 0, limit))
+    samples = [dict(row) for row in cursor.fetchall()]
+
+    conn.close()
+    return {**_page(samples, limit), "total": count_rows('samples')}
+
+
 def get_sample(sample_id):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -115,17 +250,35 @@ def get_sample(sample_id):
     return sample
 
 
-def insert_sample(name, path, upload_date, is_deleted=False):
+def insert_sample_row(cursor, name, path, upload_date, is_deleted=False, source=None):
+    # Sample names are unique. A re-upload is a new sample, the previous one is renamed
+    # like the name migration does, e.g. "image_1.jpg" -> "image_1_42.jpg", and its
+    # predictions keep pointing at its own image
+    cursor.execute('SELECT id FROM samples WHERE name = ?', (name,))
+    previous = cursor.fetchone()
+    if previous is not None:
+        stem, ext = os.path.splitext(name)
+        cursor.execute('UPDATE samples SET name = ? WHERE id = ?',
+                       (f"{stem}_{previous[0]}{ext}", previous[0]))
+
+    cursor.execute('''
+    INSERT INTO samples (name, path, upload_date, is_deleted, source)
+    VALUES (?, ?, ?, ?, ?)
+    ''', (name, path, upload_date, is_deleted, source))
+
+    return cursor.lastrowid
+
+
+@rollback_on_error
+def insert_sample(name, path, upload_date, is_deleted=False, source=None):
     conn = get_db_connection()
     cursor = conn.cursor()
 
-    cursor.execute('''
-    INSERT INTO samples (name, path, upload_date, is_deleted)
-    VALUES (?, ?, ?, ?)
-    ''', (name, path, upload_date, is_deleted))
+    sample_id = insert_sample_row(cursor, name, path, upload_date, is_deleted, source)
 
     conn.commit()
     conn.close()
+    return sample_id
 
 
 def get_sample_details_by_name(image_name):
@@ -160,56 +313,169 @@ def get_sample_details_by_name(image_name):
         conn.close()
 
 
-def save_prediction_to_db(prediction, annotated_image):
+def _attributes_json(attributes):
+    if attributes is None or isinstance(attributes, str):
+        return attributes
+    return json.dumps(attributes)
+
+
+def _detections_json(detections):
+    """Every box of the frame, enough to render its annotated image later."""
+    if detections is None:
+        return None
+    return json.dumps([{key: detection[key] for key in ("class_id", "class_name", "confidence", "bbox")}
+                       for detection in detections])
+
+
+def insert_prediction_row(cursor, prediction, annotated_image_hash, sample_id=None, detections=None):
+    cursor.execute('''
+        INSERT INTO predictions (class_id, class_name, attributes, confidence, bbox, annotated_image_hash, created_at, sample_id, detections)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        prediction[0]['class_id'] if prediction and 'class_id' in prediction[0] else None,
+        prediction[0]['class_name'] if prediction and 'class_name' in prediction[0] else None,
+        # Serialize attributes to JSON (ensure attributes is serializable)
+        _attributes_json(prediction[0]['attributes']) if prediction and 'attributes' in prediction[0] else None,
+        prediction[0]['confidence'] if prediction and 'confidence' in prediction[0] else None,
+        # Serialize bbox to JSON
+        json.dumps(
+            prediction[0]['bbox']) if prediction and 'bbox' in prediction[0] else None,
+        annotated_image_hash,
+        datetime.now().timestamp(),
+        sample_id,
+        _detections_json(detections)
+    ))
+
+    return cursor.lastrowid
+
+
+@rollback_on_error
+def set_prediction_annotated_image(prediction_id, annotated_image_hash):
+    """Record the annotated image rendered for a prediction after it was stored."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('UPDATE predictions SET annotated_image_hash = ? WHERE id = ?',
+                   (annotated_image_hash, prediction_id))
+
+    conn.commit()
+    conn.close()
+
+
+@rollback_on_error
+def save_prediction_to_db(prediction, annotated_image, sample_id=None):
+    conn = None
     try:
         # Establish database connection
         conn = get_db_connection()
         cursor = conn.cursor()
 
+        # The image goes to the file store, the row only keeps its hash
+        annotated_image_hash = store_annotated_image(annotated_image)
+
         # Execute the insert query
-        cursor.execute('''
-            INSERT INTO predictions (class_id, class_name, attributes, confidence, bbox, annotated_image)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            prediction[0]['class_id'] if prediction and 'class_id' in prediction[0] else None,
-            prediction[0]['class_name'] if prediction and 'class_name' in prediction[0] else None,
-            # Serialize attributes to JSON (ensure attributes is serializable)
-            prediction[0]['attributes'] if prediction and 'attributes' in prediction[0] else None,
-            prediction[0]['confidence'] if prediction and 'confidence' in prediction[0] else None,
-            # Serialize bbox to JSON
-            json.dumps(
-                prediction[0]['bbox']) if prediction and 'bbox' in prediction[0] else None,
-            annotated_image
-        ))
+        prediction_id = insert_prediction_row(
+            cursor, prediction, annotated_image_hash, sample_id)
 
         # INFO: root: Prediction: [{'class_id': 2, 'class_name': 'car', 'attributes': None, 'confidence': 0.3884711265563965, 'bbox': [[0.0, 428.875244140625, 715.8741455078125, 850.5654296875]]}]
-        # data = {
-        #     'class_id': prediction[0]['class_id'],
-        #     'class_name': prediction[0]['class_name'],
-        #     'attributes': prediction[0]['attributes'],
-        #     'confidence': prediction[0]['confidence'],
-        #     'bbox': prediction[0]['bbox'],
-        #     'annotated_image': annotated_image
-        # }
 
         # Commit changes and close connection
-
-        # logger.critical(data)
         conn.commit()
-        # logger.info(f"Prediction saved to database: {
-        #             prediction[0]['class_name']} - {prediction[0]['confidence']}")
+        return prediction_id
 
     except Exception as e:
         # Log any database-related errors
         logger.error(f"Database error while saving prediction: {e}")
-    except Exception as e:
-        # Log any other exceptions
-        logger.error(f"Error occurred while saving prediction: {e}")
     finally:
         # Ensure the database connection is closed
         if conn:
             conn.close()
-            logger.info("Database connection closed.")
+
+
+def format_prediction_summary(row):
+    """Turn a predictions row into a JSON-serializable dictionary without the JSON columns."""
+    image_hash = row["annotated_image_hash"]
+    return {
+        "id": row["id"],
+        "class_id": row["class_id"],
+        "class_name": row["class_name"],
+        "confidence": row["confidence"],
+        "created_at": row["created_at"],
+        "sample_id": row["sample_id"],
+        # The image itself is served by GET /predictions/{id}/annotated-image,
+        # which renders it from the sample when it wasn't rendered at prediction time
+        "annotated_image_hash": image_hash,
+        "annotated_image_url": f"/predictions/{row['id']}/annotated-image"
+        if image_hash or row["sample_id"] else None
+    }
+
+
+def format_prediction(row):
+    """Turn a predictions row into a JSON-serializable dictionary."""
+    return {
+        **format_prediction_summary(row),
+        # Deserialize JSON if present
+        "attributes": json.loads(row["attributes"]) if row["attributes"] else None,
+        "bbox": json.loads(row["bbox"]),  # Deserialize JSON bounding box
+    }
+
+
+def get_predictions_page(limit=50, after_id=None, class_name=None, min_confidence=None,
+                         max_confidence=None, created_from=None, created_to=None, include_details=True):
+    """
+    Return one page of predictions ordered by id, filtered in SQL.
+
+    Args:
+        limit (int): Maximum number of predictions.
+        after_id (int): Only return predictions with a greater id.
+        class_name (str): Only return predictions of this class.
+        min_confidence (float): Minimum confidence, inclusive.
+        max_confidence (float): Maximum confidence, inclusive.
+        created_from (float): Earliest creation timestamp, inclusive.
+        created_to (float): Latest creation timestamp, inclusive.
+        include_details (bool): Include the attributes and bbox JSON columns.
+
+    Returns:
+        dict: The page, see `_page`, and "total", the number of predictions. Counting
+        a filtered query would scan the table, so "total" is None when any filter is set.
+    """
+    conditions = ['id > ?']
+    params = [after_id or 0]
+    for condition, value in (
+        ('class_name = ?', class_name),
+        ('confidence >= ?', min_confidence),
+        ('confidence <= ?', max_confidence),
+        ('created_at >= ?', created_from),
+        ('created_at <= ?', created_to),
+    ):
+        if value is not None:
+            conditions.append(condition)
+            params.append(value)
+    params.append(limit)
+
+    columns = 'id, class_id, class_name, confidence, annotated_image_hash, created_at, sample_id'
+    if include_details:
+        columns += ', attributes, bbox'
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(f'''
+        SELECT {columns} FROM predictions
+        WHERE {' AND '.join(conditions)}
+        ORDER BY id
+        LIMIT ?
+    ''', params)
+    rows = cursor.fetchall()
+    conn.close()
+
+    if include_details:
+        predictions = [format_prediction(row) for row in rows]
+    else:
+        predictions = [format_prediction_summary(row) for row in rows]
+    # The row counter ignores the filters, it is only the total of an unfiltered query
+    filtered = len(conditions) > 1
+    return {**_page(predictions, limit), "total": None if filtered else count_rows('predictions')}
 
 
 def get_all_predictions():
@@ -223,22 +489,48 @@ def get_all_predictions():
     # Format the results into a JSON-serializable list
     predictions = []
     for row in rows:
-        predictions.append({
-            "id": row[0],
-            "class_id": row[1],
-            "class_name": row[2],
-            # Deserialize JSON if present
-            "attributes": json.loads(row[3]) if row[3] else None,
-            "confidence": row[4],
-            "bbox": json.loads(row[5]),  # Deserialize JSON bounding box
-            # Base64 string is already JSON-serializable
-            "annotated_image": row[6]
-        })
+        predictions.append(format_prediction(row))
 
     conn.close()
     return predictions
 
 
+def iter_prediction_export_rows(batch_size=500):
+    """
+    Yield every prediction joined with its sample and category attributes, in id order.
+
+    Rows are fetched in batches from a dedicated connection, so memory stays
+    constant and the generator can be consumed from any thread.
+    """
+    conn = open_db_connection(check_same_thread=False)
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT p.id, p.class_id, p.class_name, p.confidence, p.bbox, p.attributes,
+                   p.created_at, p.sample_id, p.annotated_image_hash,
+                   s.name AS sample_name, s.path AS sample_path, s.upload_date AS sample_upload_date,
+                   c.id AS category_id, ca.data AS category_attributes
+            FROM predictions p
+            LEFT JOIN samples s ON s.id = p.sample_id
+            LEFT JOIN categories c ON c.name = p.class_name
+            LEFT JOIN category_attributes ca ON ca.category_id = c.id
+            ORDER BY p.id
+        ''')
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                export_row = dict(row)
+                for column in ('bbox', 'attributes', 'category_attributes'):
+                    if export_row[column]:
+                        export_row[column] = json.loads(export_row[column])
+                yield export_row
+    finally:
+        conn.close()
+
+
+@rollback_on_error
 def delete_all_predictions():
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -281,6 +573,7 @@ def get_all_assets():
     return assets
 
 
+@rollback_on_error
 def insert_asset(name, description, added_date, category_id, is_active=False):
     conn = get_db_connection()
     cursor = conn.cursor()
@@ -306,17 +599,42 @@ def get_all_categories():
     return categories
 
 
+@rollback_on_error
 def insert_category(name, description, added_date, is_active=False):
+    """
+    Insert a category unless one with the same name exists.
+
+    Returns:
+        int: Id of the new category, or None when the name is taken.
+    """
     conn = get_db_connection()
     cursor = conn.cursor()
 
     cursor.execute('''
     INSERT INTO categories (name, description, added_date, is_active)
     VALUES (?, ?, ?, ?)
+    ON CONFLICT (name) DO NOTHING
     ''', (name, description, added_date, is_active))
+    category_id = cursor.lastrowid if cursor.rowcount == 1 else None
 
     conn.commit()
     conn.close()
+    return category_id
+
+
+def get_categories_with_attributes():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT c.id, c.name, c.description, c.is_active, ca.data
+        FROM categories c
+        LEFT JOIN category_attributes ca ON ca.category_id = c.id
+    ''')
+    categories = cursor.fetchall()
+
+    conn.close()
+    return categories
 
 
 def get_category_attribute_data_by_name(category_name):
@@ -347,16 +665,324 @@ def get_category_attributes(category_id):
     return sample
 
 
+@rollback_on_error
 def insert_category_attributes(categoryId, data):
     conn = get_db_connection()
     cursor = conn.cursor()
 
     data_json = json.dumps(data)
 
+    # A category has a single attributes row, posting again replaces it
     cursor.execute('''
     INSERT INTO category_attributes (category_id, data)
     VALUES (?, ?)
+    ON CONFLICT (category_id) DO UPDATE SET data = excluded.data
     ''', (categoryId, data_json))
 
     conn.commit()
     conn.close()
+
+
+def get_prediction_cache_rows(model_version, limit):
+    """Return the most recently used cache entries of a model version, oldest first."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT * FROM (
+            SELECT image_hash, perceptual_hash, predictions, annotated_image_hash, size, last_used
+            FROM prediction_cache
+            WHERE model_version = ?
+            ORDER BY last_used DESC
+            LIMIT ?
+        ) ORDER BY last_used
+    ''', (model_version, limit))
+    rows = cursor.fetchall()
+
+    conn.close()
+    return rows
+
+
+@rollback_on_error
+def delete_stale_prediction_cache_rows(model_version):
+    """Delete cache entries computed by any other model version."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        'DELETE FROM prediction_cache WHERE model_version IS NOT ?', (model_version,))
+    deleted = cursor.rowcount
+
+    conn.commit()
+    conn.close()
+    return deleted
+
+
+@rollback_on_error
+def write_prediction_cache_rows(model_version, inserts=(), touches=(), deletes=()):
+    """
+    Apply pending prediction cache changes in a single transaction.
+
+    Args:
+        model_version (str): Version of the weights the entries were computed with.
+        inserts (list): `(image_hash, perceptual_hash, predictions, annotated_image_hash, size, last_used)` tuples.
+        touches (list): `(last_used, image_hash)` tuples.
+        deletes (list): Image hashes of evicted entries.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        cursor.executemany('''
+            INSERT INTO prediction_cache (image_hash, perceptual_hash, model_version, predictions,
+                annotated_image_hash, size, last_used)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (image_hash) DO UPDATE SET
+                perceptual_hash = excluded.perceptual_hash,
+                model_version = excluded.model_version,
+                predictions = excluded.predictions,
+                annotated_image_hash = excluded.annotated_image_hash,
+                size = excluded.size,
+                last_used = excluded.last_used
+        ''', [(image_hash, perceptual_hash, model_version, json.dumps(predictions),
+               annotated_image_hash, size, last_used)
+              for image_hash, perceptual_hash, predictions, annotated_image_hash, size, last_used in inserts])
+        cursor.executemany(
+            'UPDATE prediction_cache SET last_used = ? WHERE image_hash = ?', touches)
+        cursor.executemany(
+            'DELETE FROM prediction_cache WHERE image_hash = ?', [(image_hash,) for image_hash in deletes])
+        conn.commit()
+    except sqlite3.Error as e:
+        conn.rollback()
+        logger.error(f"Database error while writing the prediction cache: {e}")
+    finally:
+        conn.close()
+
+
+@rollback_on_error
+def clear_prediction_cache():
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('DELETE FROM prediction_cache')
+
+    conn.commit()
+    conn.close()
+
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+
+@rollback_on_error
+def insert_jobs(sample_ids):
+    """Queue one analysis job per sample and return the job ids, in order."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    created_at = datetime.now().timestamp()
+    job_ids = []
+    for sample_id in sample_ids:
+        cursor.execute(
+            'INSERT INTO jobs (sample_id, status, created_at) VALUES (?, ?, ?)',
+            (sample_id, JOB_QUEUED, created_at))
+        job_ids.append(cursor.lastrowid)
+
+    conn.commit()
+    conn.close()
+    return job_ids
+
+
+def get_job(job_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT * FROM jobs WHERE id = ?', (job_id,))
+    row = cursor.fetchone()
+
+    conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    return job
+
+
+def get_job_samples(job_ids):
+    """Return each job id with the sample it analyzes, the sample columns are NULL if it is gone."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(f'''
+        SELECT j.id AS job_id, j.sample_id, s.name, s.path, s.upload_date, s.is_deleted
+        FROM jobs j
+        LEFT JOIN samples s ON s.id = j.sample_id
+        WHERE j.id IN ({",".join("?" * len(job_ids))})
+        ORDER BY j.id
+    ''', job_ids)
+    rows = cursor.fetchall()
+
+    conn.close()
+    return rows
+
+
+@rollback_on_error
+def requeue_unfinished_jobs():
+    """Put jobs interrupted by a shutdown back in the queue and return every queued job id."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('UPDATE jobs SET status = ?, started_at = NULL WHERE status = ?',
+                   (JOB_QUEUED, JOB_RUNNING))
+    cursor.execute('SELECT id FROM jobs WHERE status = ? ORDER BY id', (JOB_QUEUED,))
+    job_ids = [row['id'] for row in cursor.fetchall()]
+
+    conn.commit()
+    conn.close()
+    return job_ids
+
+
+@rollback_on_error
+def mark_jobs_running(job_ids):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.executemany('UPDATE jobs SET status = ?, started_at = ? WHERE id = ?',
+                       [(JOB_RUNNING, datetime.now().timestamp(), job_id) for job_id in job_ids])
+
+    conn.commit()
+    conn.close()
+
+
+def finish_job_row(cursor, job_id, status, result=None, prediction_id=None, error=None):
+    cursor.execute('''
+        UPDATE jobs SET status = ?, finished_at = ?, result = ?, prediction_id = ?, error = ?
+        WHERE id = ?
+    ''', (status, datetime.now().timestamp(), json.dumps(result) if result is not None else None,
+          prediction_id, error, job_id))
+
+    return job_id
+
+
+def get_unscored_sample_ids():
+    """Return the samples that have neither a prediction nor a pending or successful job."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT s.id FROM samples s
+        WHERE NOT s.is_deleted
+          AND NOT EXISTS (SELECT 1 FROM predictions p WHERE p.sample_id = s.id)
+          AND NOT EXISTS (SELECT 1 FROM jobs j WHERE j.sample_id = s.id AND j.status != ?)
+        ORDER BY s.id
+    ''', (JOB_FAILED,))
+    sample_ids = [row['id'] for row in cursor.fetchall()]
+
+    conn.close()
+    return sample_ids
+
+
+TRAINING_COLUMNS = ('status', 'run_dir', 'pid', 'started_at', 'finished_at', 'epoch',
+                    'metrics', 'best_metric', 'promoted', 'error')
+
+
+def _format_training_run(row):
+    run = dict(row)
+    for column in ('args', 'metrics'):
+        run[column] = json.loads(run[column]) if run[column] else None
+    run['promoted'] = bool(run['promoted'])
+    return run
+
+
+@rollback_on_error
+def insert_training_run(args, epochs):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        INSERT INTO training_runs (status, args, created_at, epochs)
+        VALUES (?, ?, ?, ?)
+    ''', ('queued', json.dumps(args), datetime.now().timestamp(), epochs))
+    run_id = cursor.lastrowid
+
+    conn.commit()
+    conn.close()
+    return run_id
+
+
+@rollback_on_error
+def update_training_run(run_id, **fields):
+    """
+    Update some columns of a training run.
+
+    Args:
+        run_id (int): Id of the run.
+        **fields: New column values, see `TRAINING_COLUMNS`. `metrics` is serialized to JSON.
+    """
+    unknown = set(fields) - set(TRAINING_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown training run columns: {sorted(unknown)}")
+    if 'metrics' in fields and fields['metrics'] is not None:
+        fields['metrics'] = json.dumps(fields['metrics'])
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    assignments = ", ".join(f"{column} = ?" for column in fields)
+    cursor.execute(f'UPDATE training_runs SET {assignments} WHERE id = ?',
+                   (*fields.values(), run_id))
+
+    conn.commit()
+    conn.close()
+
+
+def get_training_run(run_id):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT * FROM training_runs WHERE id = ?', (run_id,))
+    row = cursor.fetchone()
+
+    conn.close()
+    return _format_training_run(row) if row else None
+
+
+def get_training_runs(limit=50):
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('SELECT * FROM training_runs ORDER BY id DESC LIMIT ?', (limit,))
+    runs = [_format_training_run(row) for row in cursor.fetchall()]
+
+    conn.close()
+    return runs
+
+
+def get_promoted_training_metric():
+    """Return the promotion metric of the run whose weights are currently in use, or None."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute(
+        'SELECT best_metric FROM training_runs WHERE promoted ORDER BY finished_at DESC LIMIT 1')
+    row = cursor.fetchone()
+
+    conn.close()
+    return row['best_metric'] if row else None
+
+
+@rollback_on_error
+def interrupt_unfinished_training_runs():
+    """Mark runs whose process died with the previous server process, they can't be resumed."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        UPDATE training_runs SET status = 'interrupted', finished_at = ?
+        WHERE status IN ('queued', 'running')
+    ''', (datetime.now().timestamp(),))
+
+    conn.commit()
+    conn.close()
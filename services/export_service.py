@@ -0,0 +1,58 @@
+import csv
+import io
+import json
+import zlib
+
+
+EXPORT_COLUMNS = [
+    "id", "class_id", "class_name", "confidence", "bbox", "attributes", "created_at",
+    "sample_id", "annotated_image_hash", "sample_name", "sample_path", "sample_upload_date",
+    "category_id", "category_attributes",
+]
+
+
+def _batched(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def iter_ndjson(rows, batch_size=200):
+    """Encode rows as newline-delimited JSON, one chunk per batch of rows."""
+    for batch in _batched(rows, batch_size):
+        yield "".join(json.dumps(row, default=str) + "\n" for row in batch).encode("utf-8")
+
+
+def iter_csv(rows, batch_size=200):
+    """Encode rows as CSV with a header line, nested values are written as JSON."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in _batched(rows, batch_size):
+        for row in batch:
+            writer.writerow([
+                json.dumps(row.get(column)) if isinstance(row.get(column), (dict, list)) else row.get(column)
+                for column in EXPORT_COLUMNS
+            ])
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+
+    # Header only when there were no rows
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def iter_gzip(chunks, level=6):
+    """Compress a stream of byte chunks into a gzip stream on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip container
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
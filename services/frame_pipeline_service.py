@@ -0,0 +1,287 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+from ai.inference_scheduler import inference_scheduler
+from ai.predictor import get_highest_confidence_predictions, predict
+from constants import SerialConstants
+from services.live_stream_service import LiveStream
+from services.metrics_service import metrics
+from services.write_behind_service import write_behind
+from .helper_log import logger
+
+
+FRAME_SECONDS = metrics.histogram(
+    "frame_processing_seconds", "Time a pipeline worker spends on a received frame, from decode to persistence.",
+    ("outcome",))
+
+
+class FramePipeline:
+    def __init__(self, socket_manager, num_workers=SerialConstants.WORKERS,
+                 queue_size=SerialConstants.QUEUE_SIZE, worker_mode=SerialConstants.WORKER_MODE,
+                 live_stream=None):
+        """
+        Process received frames on a pool of workers, away from the serial receive loop.
+
+        Args:
+            socket_manager (ConnectionManager): Used to notify WebSocket clients.
+            live_stream (LiveStream): Pushes scored frames to live stream subscribers.
+            num_workers (int): Number of frame processing workers.
+            queue_size (int): Maximum number of frames waiting for a worker.
+            worker_mode (str): "thread" or "process", see `SerialConstants.WORKER_MODE`.
+        """
+        if worker_mode not in ("thread", "process"):
+            raise ValueError(f"Unknown worker mode: {worker_mode}")
+
+        self.socket_manager = socket_manager
+        self.live_stream = live_stream or LiveStream(socket_manager)
+        self.num_workers = max(1, num_workers)
+        self.worker_mode = worker_mode
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.file_counter = 1  # Counter to generate unique filenames
+        self.started_at = datetime.now().strftime("%Y%m%d%H%M%S")
+        self.running = False
+        self.loop = None
+        self._workers = []
+        self._executor = None
+        self._persist_executor = None
+        self._lock = threading.Lock()
+        # Set when the queue couldn't take the stop sentinels, workers leave without draining it
+        self._abort = threading.Event()
+
+        # Backpressure metrics
+        self.frames_enqueued = 0
+        self.frames_dropped = 0
+        self.frames_processed = 0
+        self.frames_failed = 0
+        self.max_queue_depth = 0
+        self.busy_workers = 0
+        self.total_processing_time = 0.0
+        self.last_processing_time = 0.0
+
+    def start(self, loop=None):
+        """
+        Start the workers.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): Event loop owning the WebSocket connections.
+        """
+        if self.running:
+            return
+        self.loop = loop
+        self.running = True
+        self._abort.clear()
+        if self.worker_mode == "process":
+            self._executor = ProcessPoolExecutor(max_workers=self.num_workers)
+        # Frames are scored from memory, their files are written on this thread meanwhile
+        self._persist_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="frame-persist")
+
+        for index in range(self.num_workers):
+            worker = threading.Thread(
+                target=self._work, name=f"frame-worker-{index}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        logger.info(
+            f"Frame pipeline started with {self.num_workers} {self.worker_mode} workers.")
+
+    def stop(self, timeout=5):
+        """
+        Stop the workers once the frames already queued are processed.
+
+        When the queue stays full for `timeout`, e.g. workers stuck waiting on the
+        model, the queued frames are abandoned instead of blocking the shutdown.
+        """
+        if not self.running:
+            return
+        self.running = False
+        deadline = time.monotonic() + timeout
+        for _ in self._workers:
+            try:
+                self.queue.put(None, timeout=max(0, deadline - time.monotonic()))
+            except queue.Full:
+                logger.warning(
+                    f"Frame queue still full, abandoning {self.queue.qsize()} queued frames.")
+                self._abort.set()
+                break
+        for worker in self._workers:
+            worker.join(max(0, deadline - time.monotonic()))
+        self._workers = []
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._persist_executor:
+            # Every stored sample row must have its file
+            self._persist_executor.shutdown(wait=True)
+            self._persist_executor = None
+
+    def submit(self, data, source=None):
+        """
+        Queue a received frame without blocking the caller.
+
+        Args:
+            data (bytes): The raw JPEG frame.
+            source (str): Serial port the frame was received on.
+
+        Returns:
+            bool: False if the queue was full and the frame was dropped.
+        """
+        try:
+            self.queue.put_nowait((data, source))
+        except queue.Full:
+            with self._lock:
+                self.frames_dropped += 1
+            logger.warning(
+                f"Frame queue full ({self.queue.maxsize}), dropping frame.")
+            return False
+
+        with self._lock:
+            self.frames_enqueued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return True
+
+    def get_stats(self):
+        """Return backpressure metrics of the pipeline."""
+        with self._lock:
+            finished = self.frames_processed + self.frames_failed
+            return {
+                "worker_mode": self.worker_mode,
+                "workers": self.num_workers,
+                "busy_workers": self.busy_workers,
+                "queue_depth": self.queue.qsize(),
+                "queue_capacity": self.queue.maxsize,
+                "max_queue_depth": self.max_queue_depth,
+                "frames_enqueued": self.frames_enqueued,
+                "frames_dropped": self.frames_dropped,
+                "frames_processed": self.frames_processed,
+                "frames_failed": self.frames_failed,
+                "avg_processing_ms": (self.total_processing_time / finished * 1000) if finished else 0.0,
+                "last_processing_ms": self.last_processing_time * 1000,
+            }
+
+    @staticmethod
+    def _write_file(path, data):
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as buffer:
+                buffer.write(data)
+        except Exception as e:
+            logger.exception(f"Error saving image to {path}", exc_info=e)
+
+    def save_image_to_file(self, data, source=None):
+        """
+        Queue the write of binary image data to a file and the insert of its sample row.
+
+        Nothing reads the file back while the frame is processed, so it is written
+        in the background when the pipeline runs and right away otherwise.
+
+        Returns:
+            tuple: The sample dictionary and a future resolving to its row id.
+        """
+        try:
+            temp_folder = 'data/temp/'
+
+            with self._lock:
+                # Sample names are unique, so don't reuse names across restarts
+                file_name = f"image_{self.started_at}_{self.file_counter}.jpg"
+                self.file_counter += 1
+            if source:
+                # Keep images from different ports apart, e.g. "COM5_image_20250105103000_1.jpg"
+                prefix = "".join(c if c.isalnum() else "_" for c in source).strip("_")
+                file_name = f"{prefix}_{file_name}"
+
+            temp_path = temp_folder + file_name
+            persist_executor = self._persist_executor
+            if persist_executor is not None:
+                persist_executor.submit(self._write_file, temp_path, data)
+            else:
+                self._write_file(temp_path, data)
+
+            # The row is written by the write-behind buffer, we already know its content
+            upload_date = datetime.now()
+            sample_id = write_behind.insert_sample(
+                file_name, temp_path, upload_date, False, source)
+            sample = {
+                "name": file_name,
+                "path": temp_path,
+                "upload_date": upload_date,
+                "is_deleted": False,
+                "source": source
+            }
+
+            logger.info(f"Image queued for {temp_path}.")
+            return sample, sample_id
+        except Exception as e:
+            logger.exception("Error saving image to file", exc_info=e)
+            return None, None
+
+    def _infer(self, sample):
+        if self._executor:
+            return self._executor.submit(predict, sample).result()
+        return inference_scheduler.submit(sample).result()
+
+    def _broadcast(self, message):
+        # Only enqueues on the event loop, never waits for the clients
+        self.socket_manager.publish_threadsafe(message)
+
+    def process_frame(self, data, source=None):
+        """Save, score and store a single frame, then notify the clients."""
+        # Save the image to a file and get its metadata
+        sample, sample_id = self.save_image_to_file(data, source)
+
+        if not sample:
+            logger.error("Failed to save the image.")
+            return False
+
+        # Score the received bytes from memory, not from the file. Only the JPEG is
+        # sent, a process worker would otherwise receive a pickled copy of the decoded frame
+        predictions_array, annotated_image = self._infer({**sample, "data": data})
+        if annotated_image is None:
+            logger.error(f"Prediction error: {predictions_array}")
+            return False
+
+        predictions = get_highest_confidence_predictions(predictions_array)
+        logger.info(predictions)
+        if len(predictions) == 0:
+            logger.info("*************PPP NO PREDICTION ****************")
+        else:
+            # Publish first, an image rendered for live subscribers is stored with the prediction
+            self.live_stream.publish(predictions, annotated_image, sample)
+            write_behind.save_prediction(
+                prediction=predictions, annotated_image=annotated_image, sample_id=sample_id,
+                detections=predictions_array)
+
+        self._broadcast("Hello mr. how do you do.")
+        return True
+
+    def _work(self):
+        while not self._abort.is_set():
+            try:
+                # Wake up now and then to notice an aborted stop
+                item = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+
+            with self._lock:
+                self.busy_workers += 1
+            started = time.perf_counter()
+            try:
+                ok = self.process_frame(*item)
+            except Exception as e:
+                logger.error(f"Error during image processing: {e}")
+                ok = False
+            elapsed = time.perf_counter() - started
+            FRAME_SECONDS.labels("ok" if ok else "failed").observe(elapsed)
+
+            with self._lock:
+                self.busy_workers -= 1
+                self.total_processing_time += elapsed
+                self.last_processing_time = elapsed
+                if ok:
+                    self.frames_processed += 1
+                else:
+                    self.frames_failed += 1
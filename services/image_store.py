@@ -0,0 +1,99 @@
+import base64
+import hashlib
+import os
+import tempfile
+
+from constants import StorageConstants
+
+
+class ImageStore:
+    def __init__(self, root=StorageConstants.ANNOTATED_IMAGES_DIR, extension=".jpg"):
+        """
+        Store images on disk under the SHA-256 of their content.
+
+        Args:
+            root (str): Directory holding the images.
+            extension (str): File extension of the stored images.
+        """
+        self.root = root
+        self.extension = extension
+
+    def path_for(self, image_hash):
+        """Return the file path of an image, e.g. data/annotated/ab/abcdef....jpg."""
+        return os.path.join(self.root, image_hash[:2], image_hash + self.extension)
+
+    def exists(self, image_hash):
+        return os.path.exists(self.path_for(image_hash))
+
+    def put(self, data):
+        """
+        Write image bytes to the store unless an identical image is already there.
+
+        Returns:
+            str: The content hash identifying the image.
+        """
+        image_hash = hashlib.sha256(data).hexdigest()
+        path = self.path_for(image_hash)
+        if os.path.exists(path):
+            return image_hash
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Write to a temporary file first so readers never see a partial image
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as buffer:
+                buffer.write(data)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return image_hash
+
+    def get(self, image_hash):
+        with open(self.path_for(image_hash), "rb") as image_file:
+            return image_file.read()
+
+
+annotated_image_store = ImageStore()
+
+
+def annotated_image_bytes(annotated_image, render=True):
+    """
+    Get the JPEG bytes of an annotated image.
+
+    Args:
+        annotated_image (bytes | str | Annotation): JPEG bytes, their base64 encoding or
+            a lazy `ai.annotation.Annotation`, may be None.
+        render (bool): Render a lazy annotation if nothing did yet, otherwise return None for it.
+
+    Returns:
+        bytes: The JPEG, or None.
+    """
+    if not annotated_image:
+        return None
+    if isinstance(annotated_image, str):
+        return base64.b64decode(annotated_image)
+    if isinstance(annotated_image, (bytes, bytearray, memoryview)):
+        return annotated_image
+    return annotated_image.render() if render else annotated_image.jpeg
+
+
+def store_annotated_image(annotated_image):
+    """
+    Store an annotated image and return its hash.
+
+    A lazy annotation is only stored once something rendered it, it is rendered
+    on request from the sample otherwise.
+
+    Args:
+        annotated_image (bytes | str | Annotation): See `annotated_image_bytes`, may be None.
+
+    Returns:
+        str: The content hash, or None when there was no image.
+    """
+    annotated_image = annotated_image_bytes(annotated_image, render=False)
+    if not annotated_image:
+        return None
+    return annotated_image_store.put(annotated_image)
@@ -0,0 +1,161 @@
+import queue
+import threading
+
+from ai.inference_scheduler import inference_scheduler
+from ai.predictor import get_highest_confidence_predictions
+from constants import JobConstants
+from services.db_service import (JOB_FAILED, JOB_SUCCEEDED, get_job, get_job_samples,
+                                 get_unscored_sample_ids, insert_jobs, mark_jobs_running,
+                                 requeue_unfinished_jobs)
+from services.write_behind_service import write_behind
+from .helper_log import logger
+
+
+class JobManager:
+    def __init__(self, scheduler=inference_scheduler, max_in_flight=JobConstants.MAX_IN_FLIGHT):
+        """
+        Run sample analysis jobs persisted in the jobs table on a background thread.
+
+        Jobs are handed to the inference scheduler in groups of up to `max_in_flight`
+        so they are batched together. Jobs still queued or running at shutdown are
+        picked up again by the next `start`.
+
+        Args:
+            scheduler (InferenceScheduler): Scores the samples.
+            max_in_flight (int): Maximum number of jobs waiting on the scheduler at once.
+        """
+        self.scheduler = scheduler
+        self.max_in_flight = max(1, max_in_flight)
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.running = False
+
+        self.jobs_succeeded = 0
+        self.jobs_failed = 0
+
+    def start(self):
+        """Start the runner thread and resume the jobs left over by the previous run."""
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            job_ids = requeue_unfinished_jobs()
+            for job_id in job_ids:
+                self._queue.put(job_id)
+            self._thread = threading.Thread(
+                target=self._run, name="job-runner", daemon=True)
+            self._thread.start()
+        if job_ids:
+            logger.info(f"Resuming {len(job_ids)} analysis jobs.")
+
+    def stop(self, timeout=10):
+        """Stop after the jobs in flight, the others stay queued in the database."""
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def submit(self, sample_ids):
+        """
+        Queue one analysis job per sample.
+
+        Args:
+            sample_ids (list): Ids of the samples to analyze.
+
+        Returns:
+            list: The job ids, in the order of `sample_ids`.
+        """
+        # Start first, resuming must not pick up the jobs inserted here a second time
+        self.start()
+        job_ids = insert_jobs(sample_ids)
+        for job_id in job_ids:
+            self._queue.put(job_id)
+        return job_ids
+
+    def analyze_unscored(self):
+        """Queue a job for every sample without a prediction or a pending job."""
+        return self.submit(get_unscored_sample_ids())
+
+    def get_job(self, job_id):
+        return get_job(job_id)
+
+    def get_stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "succeeded": self.jobs_succeeded,
+            "failed": self.jobs_failed,
+        }
+
+    def _collect_batch(self, first):
+        job_ids = [first]
+        while len(job_ids) < self.max_in_flight:
+            try:
+                job_id = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if job_id is None:
+                break
+            job_ids.append(job_id)
+        return job_ids
+
+    def _fail(self, job_id, error):
+        self.jobs_failed += 1
+        write_behind.finish_job(job_id, JOB_FAILED, error=error)
+
+    def _finish(self, job_id, sample_id, future):
+        try:
+            predictions_array, annotated_image = future.result()
+        except Exception as e:
+            self._fail(job_id, str(e))
+            return
+        if annotated_image is None:
+            self._fail(job_id, predictions_array.get("error", "Prediction failed"))
+            return
+
+        predictions = get_highest_confidence_predictions(predictions_array)
+        prediction_id = None
+        if predictions:
+            prediction_id = write_behind.save_prediction(
+                prediction=predictions, annotated_image=annotated_image, sample_id=sample_id,
+                detections=predictions_array)
+        # Written in the same batch as the prediction, the job can't succeed without it
+        write_behind.finish_job(job_id, JOB_SUCCEEDED, result=predictions,
+                                prediction_id=prediction_id)
+        self.jobs_succeeded += 1
+
+    def _run_batch(self, job_ids):
+        rows = get_job_samples(job_ids)
+        mark_jobs_running([row["job_id"] for row in rows])
+
+        futures = []
+        for row in rows:
+            if row["name"] is None:
+                self._fail(row["job_id"], "Sample not found")
+                continue
+            sample = {
+                "name": row["name"],
+                "path": row["path"],
+                "upload_date": row["upload_date"],
+                "is_deleted": row["is_deleted"],
+            }
+            futures.append((row["job_id"], row["sample_id"], self.scheduler.submit(sample)))
+
+        for job_id, sample_id, future in futures:
+            self._finish(job_id, sample_id, future)
+
+    def _run(self):
+        while self.running:
+            job_id = self._queue.get()
+            if job_id is None:
+                continue
+            try:
+                self._run_batch(self._collect_batch(job_id))
+            except Exception as e:
+                # The jobs stay running and are retried on the next start
+                logger.exception(f"Analysis job batch failed: {e}")
+
+
+job_manager = JobManager()
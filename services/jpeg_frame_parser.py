@@ -0,0 +1,128 @@
+from .helper_log import logger
+
+
+SOI = b"\xFF\xD8"  # JPEG start of image marker
+EOI = b"\xFF\xD9"  # JPEG end of image marker
+
+
+class JpegFrameParser:
+    def __init__(self, max_frame_size=1024 * 1024):
+        """
+        Incrementally split a byte stream into JPEG frames.
+
+        Only the newly appended bytes are scanned for markers, frames may span
+        several chunks and several frames may arrive in one chunk. Bytes between
+        frames are discarded and frames growing beyond `max_frame_size` are dropped.
+
+        Args:
+            max_frame_size (int): Maximum size of a single frame in bytes.
+        """
+        self.max_frame_size = max_frame_size
+        self._buffer = bytearray()
+        self._in_frame = False
+        # Position from which the next marker search starts
+        self._scan_pos = 0
+
+        self.bytes_fed = 0
+        self.frames_parsed = 0
+        self.bytes_discarded = 0
+        self.frames_oversized = 0
+
+    def reset(self):
+        """Drop any partial frame, e.g. after the port was reopened."""
+        self._buffer.clear()
+        self._in_frame = False
+        self._scan_pos = 0
+
+    def get_stats(self):
+        return {
+            "bytes_received": self.bytes_fed,
+            "frames_parsed": self.frames_parsed,
+            "bytes_discarded": self.bytes_discarded,
+            "frames_oversized": self.frames_oversized,
+        }
+
+    def _discard(self, count):
+        del self._buffer[:count]
+        self.bytes_discarded += count
+        self._scan_pos = 0
+
+    def _drop_oversized(self, end):
+        self.frames_oversized += 1
+        logger.warning(
+            f"Dropping frame larger than {self.max_frame_size} bytes, resynchronizing.")
+        self._in_frame = False
+        # Resynchronize on the next start marker inside the dropped data, if any
+        start = self._buffer.find(SOI, 1, end)
+        self._discard(end if start == -1 else start)
+
+    def feed(self, chunk):
+        """
+        Append received bytes and return the frames they completed.
+
+        Args:
+            chunk (bytes): Newly received bytes.
+
+        Returns:
+            list: Completed JPEG frames as bytes, in arrival order.
+        """
+        self._buffer.extend(chunk)
+        self.bytes_fed += len(chunk)
+        frames = []
+
+        while self._buffer:
+            if not self._in_frame:
+                start = self._buffer.find(SOI, self._scan_pos)
+                if start == -1:
+                    # Keep a trailing 0xFF, it may be the first half of a start marker
+                    keep = 1 if self._buffer.endswith(SOI[:1]) else 0
+                    self._discard(len(self._buffer) - keep)
+                    self._scan_pos = 0
+                    break
+                if start:
+                    self._discard(start)
+                self._in_frame = True
+                self._scan_pos = len(SOI)
+
+            end = self._buffer.find(EOI, self._scan_pos)
+            if end == -1:
+                if len(self._buffer) > self.max_frame_size:
+                    self._drop_oversized(len(self._buffer))
+                    continue
+                # Next search only needs to revisit the last byte, a marker may straddle chunks
+                self._scan_pos = max(len(SOI), len(self._buffer) - 1)
+                break
+
+            end += len(EOI)
+            if end > self.max_frame_size:
+                self._drop_oversized(end)
+                continue
+
+            self._in_frame = False
+            frames.append(bytes(self._buffer[:end]))
+            del self._buffer[:end]
+            self._scan_pos = 0
+            self.frames_parsed += 1
+
+        return frames
+
+    def read_frames(self, source, chunk_size=4096):
+        """
+        Read once from a byte source and return the frames that read completed.
+
+        The source is anything with a `read(size)` method, such as a `serial.Serial`
+        opened with a read timeout or an `io.BytesIO` in tests. For serial ports this
+        blocks until data arrives or the timeout expires instead of polling.
+
+        Args:
+            source: Object to read bytes from.
+            chunk_size (int): Read size for sources that don't report `in_waiting`.
+
+        Returns:
+            list: Completed JPEG frames as bytes.
+        """
+        size = getattr(source, "in_waiting", chunk_size) or 1
+        chunk = source.read(size)
+        if not chunk:
+            return []
+        return self.feed(chunk)
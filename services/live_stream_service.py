@@ -0,0 +1,130 @@
+import json
+import struct
+import time
+
+from constants import WebSocketConstants
+from .helper_log import logger
+from .image_store import annotated_image_bytes
+
+
+LIVE_FULL = "live:full"
+LIVE_PREVIEW = "live:preview"
+VARIANTS = {"full": LIVE_FULL, "preview": LIVE_PREVIEW}
+
+# Binary live message: header length (4, big-endian) | JSON header | JPEG bytes
+HEADER_LENGTH = struct.Struct(">I")
+
+
+def encode_live_message(header, jpeg):
+    """
+    Pack a JSON header and a JPEG into a single binary WebSocket message.
+
+    Args:
+        header (dict): Prediction metadata, must be JSON serializable.
+        jpeg (bytes): The encoded image.
+
+    Returns:
+        bytes: The message, see `HEADER_LENGTH` for the layout.
+    """
+    header_bytes = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    return HEADER_LENGTH.pack(len(header_bytes)) + header_bytes + jpeg
+
+
+def decode_live_message(message):
+    """Split a binary live message back into its header dict and JPEG bytes."""
+    (length,) = HEADER_LENGTH.unpack_from(message)
+    start = HEADER_LENGTH.size
+    return json.loads(message[start:start + length]), message[start + length:]
+
+
+def make_preview(jpeg, width, quality):
+    """
+    Scale an encoded image down to `width` and re-encode it at a lower quality.
+
+    Returns:
+        bytes: The preview JPEG, or the original when it is already small enough.
+    """
+    import cv2
+    import numpy as np
+
+    image = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        return jpeg
+    height, original_width = image.shape[:2]
+    if original_width > width:
+        image = cv2.resize(image, (width, max(1, round(height * width / original_width))),
+                           interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return encoded.tobytes() if ok else jpeg
+
+
+class LiveStream:
+    def __init__(self, socket_manager, preview_width=WebSocketConstants.PREVIEW_WIDTH,
+                 preview_quality=WebSocketConstants.PREVIEW_QUALITY):
+        """
+        Push every new prediction and its annotated frame to live stream subscribers.
+
+        Each variant is encoded at most once per frame and shared by all of its
+        subscribers, and not at all while nobody is subscribed to it.
+
+        Args:
+            socket_manager (ConnectionManager): Delivers the messages.
+            preview_width (int): Width of the preview variant in pixels.
+            preview_quality (int): JPEG quality of the preview variant.
+        """
+        self.socket_manager = socket_manager
+        self.preview_width = preview_width
+        self.preview_quality = preview_quality
+
+        self.frames_published = 0
+        self.previews_encoded = 0
+        self.bytes_published = 0
+
+    def publish(self, predictions, annotated_image, sample=None):
+        """
+        Publish a scored frame from any thread.
+
+        Args:
+            predictions (list): The predictions shown on the frame.
+            annotated_image (bytes | str | Annotation): See `annotated_image_bytes`, rendered
+                here only when somebody is subscribed.
+            sample (dict): The scored sample, its name and source go into the header.
+        """
+        wants_full = self.socket_manager.has_subscribers(LIVE_FULL)
+        wants_preview = self.socket_manager.has_subscribers(LIVE_PREVIEW)
+        if not annotated_image or not (wants_full or wants_preview):
+            return
+
+        try:
+            jpeg = annotated_image_bytes(annotated_image)
+            header = {
+                "type": "prediction",
+                "timestamp": time.time(),
+                "sample": sample.get("name") if sample else None,
+                "source": sample.get("source") if sample else None,
+                "predictions": predictions,
+            }
+
+            if wants_full:
+                self._publish(LIVE_FULL, {**header, "variant": "full"}, jpeg)
+            if wants_preview:
+                preview = make_preview(jpeg, self.preview_width, self.preview_quality)
+                self.previews_encoded += 1
+                self._publish(LIVE_PREVIEW, {**header, "variant": "preview"}, preview)
+            self.frames_published += 1
+        except Exception as e:
+            logger.error(f"Failed to publish live frame: {e}")
+
+    def _publish(self, topic, header, jpeg):
+        message = encode_live_message(header, jpeg)
+        self.bytes_published += len(message)
+        self.socket_manager.publish_threadsafe(message, topic)
+
+    def get_stats(self):
+        return {
+            "frames_published": self.frames_published,
+            "previews_encoded": self.previews_encoded,
+            "bytes_published": self.bytes_published,
+            "subscribers": {variant: self.socket_manager.subscribers.get(topic, 0)
+                            for variant, topic in VARIANTS.items()},
+        }
@@ -0,0 +1,125 @@
+from ai.inference_scheduler import inference_scheduler
+from ai.prediction_cache import prediction_cache
+from ai.tiling import tiled_predictor
+from services.category_cache import category_cache
+from services.job_service import job_manager
+from services.metrics_service import metrics, stats_samples
+from services.write_behind_service import write_behind
+
+
+SERIAL_FIELDS = (
+    ("connected", "serial_connected", "gauge", "Whether the serial port is open."),
+    ("bytes_received", "serial_bytes_received_total", "counter", "Bytes read from the serial port."),
+    ("frames_received", "serial_frames_received_total", "counter", "Complete images framed from the serial stream."),
+    ("bytes_discarded", "serial_bytes_discarded_total", "counter", "Bytes skipped while resynchronizing on a frame."),
+    ("frames_oversized", "serial_frames_oversized_total", "counter", "Frames dropped for exceeding the maximum frame size."),
+    ("errors", "serial_errors_total", "counter", "Serial read errors."),
+    ("reconnects", "serial_reconnects_total", "counter", "Reconnections of the serial port."),
+    # Framed protocol only
+    ("chunks_received", "serial_chunks_received_total", "counter", "Protocol chunks received."),
+    ("crc_errors", "serial_crc_errors_total", "counter", "Protocol chunks rejected by the CRC check."),
+    ("duplicates", "serial_duplicates_total", "counter", "Protocol chunks received twice."),
+    ("out_of_window", "serial_out_of_window_total", "counter", "Protocol chunks outside the receive window."),
+    ("naks_sent", "serial_naks_sent_total", "counter", "Retransmissions requested from the sender."),
+    ("window_pending", "serial_window_pending", "gauge", "Protocol chunks waiting for a gap to be filled."),
+)
+
+PIPELINE_FIELDS = (
+    ("queue_depth", "pipeline_queue_depth", "gauge", "Frames waiting for a pipeline worker."),
+    ("queue_capacity", "pipeline_queue_capacity", "gauge", "Frames the pipeline queue holds before dropping."),
+    ("busy_workers", "pipeline_busy_workers", "gauge", "Pipeline workers processing a frame."),
+    ("frames_enqueued", "pipeline_frames_enqueued_total", "counter", "Frames handed to the pipeline."),
+    ("frames_dropped", "pipeline_frames_dropped_total", "counter", "Frames dropped because the pipeline queue was full."),
+    ("frames_processed", "pipeline_frames_processed_total", "counter", "Frames scored and persisted."),
+    ("frames_failed", "pipeline_frames_failed_total", "counter", "Frames that failed to process."),
+)
+
+SCHEDULER_FIELDS = (
+    ("queued", "inference_queue_depth", "gauge", "Samples waiting for the inference scheduler."),
+)
+
+WRITE_BEHIND_FIELDS = (
+    ("queued", "db_write_queue_depth", "gauge", "Writes waiting in the write-behind buffer."),
+    ("rows_written", "db_rows_written_total", "counter", "Rows committed by the write-behind buffer."),
+    ("rows_failed", "db_rows_failed_total", "counter", "Rows the write-behind buffer failed to write."),
+    ("batches_written", "db_batches_written_total", "counter", "Transactions committed by the write-behind buffer."),
+)
+
+JOB_FIELDS = (
+    ("queued", "jobs_queued", "gauge", "Analysis jobs waiting to run."),
+    ("succeeded", "jobs_succeeded_total", "counter", "Analysis jobs that succeeded."),
+    ("failed", "jobs_failed_total", "counter", "Analysis jobs that failed."),
+)
+
+PREDICTION_CACHE_FIELDS = (
+    ("hits", "prediction_cache_hits_total", "counter", "Predictions answered from the cache."),
+    ("near_hits", "prediction_cache_near_hits_total", "counter", "Predictions answered from a near-duplicate frame."),
+    ("misses", "prediction_cache_misses_total", "counter", "Predictions the cache couldn't answer."),
+    ("evictions", "prediction_cache_evictions_total", "counter", "Entries evicted from the prediction cache."),
+    ("entries", "prediction_cache_entries", "gauge", "Entries in the prediction cache."),
+    ("bytes", "prediction_cache_bytes", "gauge", "Size of the prediction cache."),
+)
+
+CATEGORY_CACHE_FIELDS = (
+    ("hits", "category_cache_hits_total", "counter", "Category lookups answered from memory."),
+    ("misses", "category_cache_misses_total", "counter", "Category lookups of unknown names."),
+)
+
+TILING_FIELDS = (
+    ("images_tiled", "tiling_images_total", "counter", "Images scored as tiles."),
+    ("tiles_scored", "tiling_tiles_total", "counter", "Tiles scored, not counting the full frames."),
+)
+
+WEBSOCKET_FIELDS = (
+    ("clients", "websocket_clients", "gauge", "Connected WebSocket clients."),
+    ("messages_published", "websocket_messages_published_total", "counter", "Messages published to WebSocket clients."),
+    ("messages_dropped", "websocket_messages_dropped_total", "counter", "Messages dropped for slow WebSocket clients."),
+    ("slow_disconnects", "websocket_slow_disconnects_total", "counter", "WebSocket clients disconnected for being too slow."),
+)
+
+LIVE_STREAM_FIELDS = (
+    ("frames_published", "live_frames_published_total", "counter", "Frames published to the live stream."),
+    ("previews_encoded", "live_previews_encoded_total", "counter", "Live stream previews encoded."),
+    ("bytes_published", "live_bytes_published_total", "counter", "Bytes published to the live stream."),
+)
+
+
+def register_collectors(serial_ingestion, socket_service, live_stream):
+    """
+    Expose the counters the services already keep, they are read when /metrics is scraped.
+
+    Args:
+        serial_ingestion (SerialIngestionManager): The serial ports and their frame pipeline.
+        socket_service (ConnectionManager): The WebSocket clients.
+        live_stream (LiveStream): The live frame stream.
+    """
+    def collect_serial():
+        stats = serial_ingestion.get_stats()
+        samples = stats_samples(stats["pipeline"], PIPELINE_FIELDS)
+        for port in stats["ports"]:
+            samples += stats_samples(port, SERIAL_FIELDS, {"port": port["port"]})
+        return samples
+
+    def collect_websocket():
+        stats = socket_service.get_stats()
+        samples = stats_samples(stats, WEBSOCKET_FIELDS)
+        samples += [("websocket_subscribers", "gauge", "WebSocket clients subscribed to a topic.",
+                     {"topic": topic}, count) for topic, count in stats["subscribers"].items()]
+        samples.append(("websocket_queue_depth", "gauge", "Messages waiting to be sent to WebSocket clients.",
+                        {}, sum(client["queue_depth"] for client in stats["connections"])))
+        return samples + stats_samples(live_stream.get_stats(), LIVE_STREAM_FIELDS)
+
+    metrics.add_collector(collect_serial)
+    metrics.add_collector(collect_websocket)
+    for service, fields in ((inference_scheduler, SCHEDULER_FIELDS), (write_behind, WRITE_BEHIND_FIELDS),
+                            (job_manager, JOB_FIELDS), (prediction_cache, PREDICTION_CACHE_FIELDS),
+                            (category_cache, CATEGORY_CACHE_FIELDS), (tiled_predictor, TILING_FIELDS)):
+        metrics.add_collector(_stats_collector(service, fields))
+
+
+def _stats_collector(service, fields):
+    def collect():
+        return stats_samples(service.get_stats(), fields)
+
+    collect.__name__ = f"collect_{type(service).__name__}"
+    return collect
@@ -0,0 +1,301 @@
+import bisect
+import threading
+import time
+
+from constants import MetricsConstants
+from .helper_log import logger
+
+
+# Latency buckets in seconds, from sub-millisecond queue hops to multi-second batches
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def stats_samples(stats, fields, labels=None):
+    """
+    Turn a `get_stats()` dict into collector samples.
+
+    Args:
+        stats (dict): The stats of a service.
+        fields (tuple): `(key, name, kind, documentation)` of the stats to expose, missing keys are skipped.
+        labels (dict): Labels added to every sample.
+
+    Returns:
+        list: `(name, kind, documentation, labels, value)` samples, see `MetricsRegistry.add_collector`.
+    """
+    return [(name, kind, documentation, labels or {}, stats[key])
+            for key, name, kind, documentation in fields if key in stats]
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """Return the child of these label values, created on first use."""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _default(self):
+        # Metrics without labels are their own single child
+        return self.labels()
+
+    def collect(self):
+        """
+        Render the exposition lines of every child.
+
+        Returns:
+            list: Text lines, without the HELP and TYPE header.
+        """
+        lines = []
+        for values, child in list(self._children.items()):
+            labels = dict(zip(self.labelnames, values))
+            lines.extend(child.lines(self.name, labels))
+        return lines
+
+
+class _CounterChild:
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def lines(self, name, labels):
+        return [f"{name}{_format_labels(labels)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    def set(self, value):
+        self.value = value
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().dec(amount)
+
+
+class _HistogramChild:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def time(self):
+        """Observe the duration of a `with` block in seconds."""
+        return _Timer(self)
+
+    def lines(self, name, labels):
+        with self._lock:
+            counts = list(self.counts)
+            total = self.sum
+        lines = []
+        cumulative = 0
+        for bound, count in zip((*self.buckets, float("inf")), counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels({**labels, 'le': _format_value(float(bound))})} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.histogram.observe(time.perf_counter() - self.started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def time(self):
+        return self._default().time()
+
+
+class _NoopMetric:
+    """Stands in for every metric when metrics are disabled, each call returns right away."""
+
+    def labels(self, *values):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def time(self):
+        return _NOOP_TIMER
+
+
+class _NoopTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_NOOP = _NoopMetric()
+_NOOP_TIMER = _NoopTimer()
+
+
+class MetricsRegistry:
+    def __init__(self, enabled=MetricsConstants.ENABLED, prefix=MetricsConstants.PREFIX):
+        """
+        Hold the metrics of the process and render them in the Prometheus text format.
+
+        Hot paths update their own counters and histograms. Counters the services
+        already keep are read by collectors at scrape time only, so they cost nothing
+        between scrapes. When disabled every metric is a shared no-op object.
+
+        Args:
+            enabled (bool): Record metrics, see `MetricsConstants.ENABLED`.
+            prefix (str): Prepended to every metric name.
+        """
+        self.enabled = enabled
+        self.prefix = prefix
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def _register(self, metric_class, name, *args, **kwargs):
+        if not self.enabled:
+            return _NOOP
+        name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = metric_class(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets)
+
+    def add_collector(self, collector):
+        """
+        Read metrics from a service at scrape time.
+
+        Args:
+            collector (callable): Returns `(name, kind, documentation, labels, value)` samples,
+                `kind` being "counter" or "gauge".
+        """
+        if self.enabled:
+            self._collectors.append(collector)
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format."""
+        families = {}
+        for metric in list(self._metrics.values()):
+            families[metric.name] = [metric.kind, metric.documentation, metric.collect()]
+
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                logger.error(f"Metrics collector {getattr(collector, '__name__', collector)} failed: {e}")
+                continue
+            for name, kind, documentation, labels, value in samples:
+                name = self.prefix + name
+                family = families.setdefault(name, [kind, documentation, []])
+                family[2].append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        lines = []
+        for name, (kind, documentation, samples) in families.items():
+            lines.append(f"# HELP {name} {documentation}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n" if lines else ""
+
+
+metrics = MetricsRegistry()
@@ -0,0 +1,62 @@
+import threading
+
+from constants import SerialConstants
+from services.frame_pipeline_service import FramePipeline
+from services.serialport_service import SerialPortManager
+from .helper_log import logger
+
+
+class SerialIngestionManager:
+    def __init__(self, socket_manager, ports=SerialConstants.PORTS, pipeline=None, live_stream=None):
+        """
+        Own every configured serial port and feed them into one shared pipeline.
+
+        Args:
+            socket_manager (ConnectionManager): Used by the pipeline to notify WebSocket clients.
+            ports (list): Port configurations, e.g. [{"port": "COM5", "baudrate": 9600}].
+            pipeline (FramePipeline): Pipeline shared by all ports.
+            live_stream (LiveStream): Pushes scored frames to live stream subscribers.
+        """
+        self.pipeline = pipeline or FramePipeline(socket_manager, live_stream=live_stream)
+        self.managers = {
+            config["port"]: SerialPortManager(
+                port=config["port"],
+                socket_manager=socket_manager,
+                baudrate=config.get("baudrate", SerialConstants.BAUDRATE),
+                pipeline=self.pipeline,
+                protocol=config.get("protocol", SerialConstants.PROTOCOL))
+            for config in ports
+        }
+        self._threads = []
+
+    def start(self, loop=None):
+        """
+        Start the pipeline and one reader thread per port.
+
+        Args:
+            loop (asyncio.AbstractEventLoop): Event loop owning the WebSocket connections.
+        """
+        self.pipeline.start(loop)
+        for port, manager in self.managers.items():
+            thread = threading.Thread(
+                target=manager.run_forever, name=f"serial-{port}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info(f"Serial ingestion started on {list(self.managers)}.")
+
+    def stop(self):
+        """Close every port, then let the pipeline finish the queued frames."""
+        for manager in self.managers.values():
+            manager.stop()
+        self.pipeline.stop()
+
+    def get_stats(self):
+        """Return per-port counters and the shared pipeline metrics."""
+        return {
+            "ports": [manager.get_stats() for manager in self.managers.values()],
+            "pipeline": self.pipeline.get_stats(),
+        }
+
+    def get_port_stats(self, port):
+        manager = self.managers.get(port)
+        return manager.get_stats() if manager else None
@@ -0,0 +1,317 @@
+import struct
+import zlib
+
+from .helper_log import logger
+
+
+# Frame layout, all integers big-endian:
+#   magic (2) | type (1) | flags (1) | seq (4) | length (2) | payload (length) | crc32 (4)
+# The CRC covers everything between the magic and the CRC itself.
+MAGIC = b"\xA5\x5A"
+HEADER = struct.Struct(">BBIH")
+CRC = struct.Struct(">I")
+HEADER_SIZE = len(MAGIC) + HEADER.size
+OVERHEAD = HEADER_SIZE + CRC.size
+
+DATA = 0x01  # Image chunk, flags carry START_OF_IMAGE / END_OF_IMAGE
+ACK = 0x10   # Chunk `seq` received, payload is the next in-order seq expected
+NAK = 0x11   # Chunk `seq` missing or corrupted, please retransmit
+
+END_OF_IMAGE = 0x01
+START_OF_IMAGE = 0x02
+
+SEQ_MODULO = 2 ** 32
+
+
+def encode_frame(frame_type, seq, payload=b"", flags=0):
+    """
+    Build a single protocol frame.
+
+    Args:
+        frame_type (int): DATA, ACK or NAK.
+        seq (int): Sequence number of the chunk.
+        payload (bytes): Frame payload.
+        flags (int): Frame flags, e.g. END_OF_IMAGE.
+
+    Returns:
+        bytes: The encoded frame.
+    """
+    body = HEADER.pack(frame_type, flags, seq % SEQ_MODULO, len(payload)) + payload
+    return MAGIC + body + CRC.pack(zlib.crc32(body))
+
+
+def encode_image(data, start_seq=0, chunk_size=256):
+    """
+    Split an image into DATA frames, the way a sending node does.
+
+    Args:
+        data (bytes): The image bytes.
+        start_seq (int): Sequence number of the first chunk.
+        chunk_size (int): Maximum payload size per chunk.
+
+    Returns:
+        list: The encoded frames, the first flagged START_OF_IMAGE and the last END_OF_IMAGE.
+    """
+    chunks = [data[i:i + chunk_size]
+              for i in range(0, len(data), chunk_size)] or [b""]
+    frames = []
+    for index, chunk in enumerate(chunks):
+        flags = 0
+        if index == 0:
+            flags |= START_OF_IMAGE
+        if index == len(chunks) - 1:
+            flags |= END_OF_IMAGE
+        frames.append(encode_frame(DATA, start_seq + index, chunk, flags))
+    return frames
+
+
+class FramedProtocolReceiver:
+    def __init__(self, send, window_size=16, max_payload=1024, max_image_size=1024 * 1024):
+        """
+        Receive images sent as checksummed, sequence-numbered chunks.
+
+        Every valid chunk is acknowledged immediately. Chunks within the window
+        that arrive out of order are buffered and the missing ones are requested
+        again with a NAK, so a corrupted chunk costs one retransmission instead
+        of the whole image.
+
+        Args:
+            send (callable): Writes response frames (ACK/NAK) back to the sender.
+            window_size (int): Number of chunks the sender may have outstanding.
+            max_payload (int): Largest payload accepted in a single frame.
+            max_image_size (int): Largest reassembled image accepted.
+        """
+        self.send = send
+        self.window_size = window_size
+        self.max_payload = max_payload
+        self.max_image_size = max_image_size
+
+        self._buffer = bytearray()
+        self._pending = {}  # Out-of-order chunks: seq -> (flags, payload)
+        self._nakked = set()  # Missing seqs already requested, asked again only when idle
+        self._image = bytearray()
+        self._image_overflow = False
+        self.expected_seq = 0
+        self._synced = False
+        self._consecutive_out_of_window = 0
+
+        self.bytes_fed = 0
+        self.frames_parsed = 0
+        self.images_received = 0
+        self.crc_errors = 0
+        self.duplicates = 0
+        self.out_of_window = 0
+        self.naks_sent = 0
+        self.bytes_discarded = 0
+        self.frames_oversized = 0
+
+    def reset(self):
+        """Drop partial frames and images, e.g. after the port was reopened."""
+        self._buffer.clear()
+        self._pending.clear()
+        self._nakked.clear()
+        self._image.clear()
+        self._image_overflow = False
+        self._synced = False
+
+    def _resync(self, seq):
+        """Start over at `seq`, e.g. when the sender restarted its sequence numbers."""
+        if self._synced:
+            logger.warning(
+                f"Resynchronizing framed protocol from seq {self.expected_seq} to {seq}.")
+        self._pending.clear()
+        self._nakked.clear()
+        self._image.clear()
+        self._image_overflow = False
+        self.expected_seq = seq
+        self._synced = True
+        self._consecutive_out_of_window = 0
+
+    def get_stats(self):
+        return {
+            "bytes_received": self.bytes_fed,
+            "chunks_received": self.frames_parsed,
+            "images_received": self.images_received,
+            "crc_errors": self.crc_errors,
+            "duplicates": self.duplicates,
+            "out_of_window": self.out_of_window,
+            "naks_sent": self.naks_sent,
+            "bytes_discarded": self.bytes_discarded,
+            "frames_oversized": self.frames_oversized,
+            "window_pending": len(self._pending),
+        }
+
+    def _offset(self, seq):
+        """Distance of `seq` ahead of the next expected sequence number."""
+        return (seq - self.expected_seq) % SEQ_MODULO
+
+    def _discard(self, count):
+        del self._buffer[:count]
+        self.bytes_discarded += count
+
+    def _ack(self, seq):
+        self.send(encode_frame(ACK, seq, struct.pack(">I", self.expected_seq)))
+
+    def _nak(self, seq):
+        self.naks_sent += 1
+        self.send(encode_frame(NAK, seq))
+
+    def _request_missing(self, upto_offset, again=False):
+        """
+        NAK the chunks missing below `upto_offset`.
+
+        Args:
+            upto_offset (int): Offset of the furthest chunk received.
+            again (bool): Also NAK the chunks requested before, otherwise only new gaps.
+        """
+        for offset in range(upto_offset):
+            seq = (self.expected_seq + offset) % SEQ_MODULO
+            if seq in self._pending or (seq in self._nakked and not again):
+                continue
+            self._nakked.add(seq)
+            self._nak(seq)
+
+    def _next_frame(self):
+        """Pop the next valid frame from the buffer, or None when more bytes are needed."""
+        while True:
+            start = self._buffer.find(MAGIC)
+            if start == -1:
+                # Keep a trailing byte, it may be the first half of the magic
+                keep = 1 if self._buffer.endswith(MAGIC[:1]) else 0
+                self._discard(len(self._buffer) - keep)
+                return None
+            if start:
+                self._discard(start)
+            if len(self._buffer) < HEADER_SIZE:
+                return None
+
+            frame_type, flags, seq, length = HEADER.unpack_from(
+                self._buffer, len(MAGIC))
+            if length > self.max_payload:
+                # Corrupted header, resynchronize on the next magic
+                self.crc_errors += 1
+                self._discard(len(MAGIC))
+                continue
+
+            size = HEADER_SIZE + length + CRC.size
+            if len(self._buffer) < size:
+                return None
+
+            body = bytes(self._buffer[len(MAGIC):HEADER_SIZE + length])
+            (crc,) = CRC.unpack_from(self._buffer, HEADER_SIZE + length)
+            if zlib.crc32(body) != crc:
+                self.crc_errors += 1
+                self._discard(len(MAGIC))
+                continue
+
+            del self._buffer[:size]
+            return frame_type, flags, seq, body[HEADER.size:]
+
+    def _deliver(self, flags, payload, images):
+        if not self._image_overflow:
+            if len(self._image) + len(payload) > self.max_image_size:
+                self.frames_oversized += 1
+                logger.warning(
+                    f"Dropping image larger than {self.max_image_size} bytes.")
+                self._image.clear()
+                self._image_overflow = True
+            else:
+                self._image.extend(payload)
+
+        if flags & END_OF_IMAGE:
+            if not self._image_overflow:
+                images.append(bytes(self._image))
+                self.images_received += 1
+            self._image.clear()
+            self._image_overflow = False
+
+    def _handle_data(self, flags, seq, payload, images):
+        if not self._synced:
+            # Only lock onto the sender at the start of an image, the chunks
+            # before it will be retransmitted once they go unacknowledged
+            if not flags & START_OF_IMAGE:
+                self.out_of_window += 1
+                return
+            self._resync(seq)
+
+        offset = self._offset(seq)
+        if offset >= SEQ_MODULO - self.window_size:
+            # Already delivered, our ACK was probably lost
+            self.duplicates += 1
+            self._ack(seq)
+            return
+        if offset >= self.window_size:
+            self.out_of_window += 1
+            self._consecutive_out_of_window += 1
+            # A sender that keeps sending far outside the window has restarted
+            if self._consecutive_out_of_window > 2 * self.window_size and flags & START_OF_IMAGE:
+                self._resync(seq)
+                self._handle_data(flags, seq, payload, images)
+            return
+        self._consecutive_out_of_window = 0
+        if seq in self._pending:
+            self.duplicates += 1
+            self._ack(seq)
+            return
+
+        self._pending[seq] = (flags, payload)
+        self._nakked.discard(seq)
+        if offset:
+            self._request_missing(offset)
+
+        # Deliver everything that is now contiguous
+        while self.expected_seq in self._pending:
+            chunk_flags, chunk = self._pending.pop(self.expected_seq)
+            self.expected_seq = (self.expected_seq + 1) % SEQ_MODULO
+            self._deliver(chunk_flags, chunk, images)
+
+        self._ack(seq)
+
+    def feed(self, chunk):
+        """
+        Append received bytes, acknowledge complete chunks and return finished images.
+
+        Args:
+            chunk (bytes): Newly received bytes.
+
+        Returns:
+            list: Reassembled images as bytes, in sequence order.
+        """
+        self._buffer.extend(chunk)
+        self.bytes_fed += len(chunk)
+        images = []
+
+        while True:
+            frame = self._next_frame()
+            if frame is None:
+                break
+            frame_type, flags, seq, payload = frame
+            self.frames_parsed += 1
+            if frame_type == DATA:
+                self._handle_data(flags, seq, payload, images)
+
+        return images
+
+    def on_idle(self):
+        """Ask again for chunks still missing in the window once the line went quiet."""
+        if self._pending:
+            furthest = max(self._offset(seq) for seq in self._pending)
+            self._request_missing(furthest, again=True)
+
+    def read_frames(self, source, chunk_size=4096):
+        """
+        Read once from a byte source and return the images that read completed.
+
+        Args:
+            source: Object to read bytes from, see `JpegFrameParser.read_frames`.
+            chunk_size (int): Read size for sources that don't report `in_waiting`.
+
+        Returns:
+            list: Reassembled images as bytes.
+        """
+        size = getattr(source, "in_waiting", chunk_size) or 1
+        chunk = source.read(size)
+        if not chunk:
+            self.on_idle()
+            return []
+        return self.feed(chunk)
@@ -1,36 +1,18 @@
 import serial
 import os
-import logging
+import threading
 import time
-from PIL import Image
 import io
-from datetime import datetime
-import shutil
-import asyncio
 from .helper_log import logger
-from ai.predictor import predict
-from services.db_service import get_sample_details_by_name, insert_sample, save_prediction_to_db
-import json
-
-
-def get_highest_confidence_predictions(predictions):
-    if not predictions:
-        return []
-
-    # Find the highest confidence level
-    highest_confidence = max(predictions, key=lambda x: x['confidence'])[
-        'confidence']
-
-    # Filter predictions that have the highest confidence level
-    highest_confidence_predictions = [
-        prediction for prediction in predictions if prediction['confidence'] == highest_confidence]
-
-    # Return the predictions inside a list
-    return highest_confidence_predictions
+from constants import SerialConstants
+from services.frame_pipeline_service import FramePipeline
+from services.jpeg_frame_parser import JpegFrameParser
+from services.serial_protocol import FramedProtocolReceiver
 
 
 class SerialPortManager:
-    def __init__(self, port, socket_manager, baudrate=9600, output_dir="received_images"):
+    def __init__(self, port, socket_manager, baudrate=9600, output_dir="received_images", pipeline=None,
+                 protocol=SerialConstants.PROTOCOL):
         """
         Initialize the serial port manager.
 
@@ -38,14 +20,33 @@ class SerialPortManager:
             port (str): Serial port to connect to.
             baudrate (int): Baud rate for the serial connection.
             output_dir (str): Directory to save the received images.
+            pipeline (FramePipeline): Pipeline processing the received frames.
+            protocol (str): "raw" or "framed", see `SerialConstants.PROTOCOL`.
         """
         self.port = port
         self.baudrate = baudrate
         self.output_dir = output_dir
-        self.file_counter = 1  # Counter to generate unique filenames
         self.serial_connection = None
         self.running = False
         self.socket_manager = socket_manager
+        self.pipeline = pipeline or FramePipeline(socket_manager)
+        self._stopped = threading.Event()
+        self.protocol = protocol
+        if protocol == "framed":
+            # Each chunk is acked on receipt by the receiver itself
+            self.parser = FramedProtocolReceiver(
+                send=self._write,
+                window_size=SerialConstants.WINDOW_SIZE,
+                max_payload=SerialConstants.MAX_CHUNK_SIZE,
+                max_image_size=SerialConstants.MAX_FRAME_SIZE)
+        elif protocol == "raw":
+            self.parser = JpegFrameParser(max_frame_size=SerialConstants.MAX_FRAME_SIZE)
+        else:
+            raise ValueError(f"Unknown serial protocol: {protocol}")
+        self.frames_received = 0
+        self.errors = 0
+        self.reconnects = 0
+        self.started_at = None
 
         # Ensure the output directory exists
         if not os.path.exists(self.output_dir):
@@ -55,138 +56,91 @@ class SerialPortManager:
         """Establish a serial connection."""
         try:
             self.serial_connection = serial.Serial(
-                self.port, self.baudrate, timeout=5
+                self.port, self.baudrate, timeout=SerialConstants.READ_TIMEOUT
             )
             logger.info(f"Connected to {self.port} at {self.baudrate}.")
             self.running = True
+            if self.started_at is None:
+                self.started_at = time.monotonic()
         except serial.SerialException as e:
             logger.error(f"Failed to connect to serial port: {e}")
+            self.errors += 1
             self.running = False
 
     def disconnect(self):
         """Close the serial connection."""
+        self.running = False
         if self.serial_connection and self.serial_connection.is_open:
             self.serial_connection.close()
             logger.info("Serial connection closed.")
-        self.running = False
-
-    def save_image_to_file(self, data):
-        """Save binary image data to a file."""
-        try:
-            temp_folder = 'data/temp/'
-            if not os.path.exists(temp_folder):
-                os.makedirs(temp_folder)
-
-            temp_path = temp_folder + f"image_{self.file_counter}.jpg"
-            with open(temp_path, "wb") as buffer:
-                buffer.write(data)
-
-            # Call a function to insert sample or log details into a database
-            insert_sample(f"image_{self.file_counter}.jpg", temp_folder +
-                          f"image_{self.file_counter}.jpg", datetime.now(), False)
-
-            sample = get_sample_details_by_name(
-                f"image_{self.file_counter}.jpg")
-            # After updating the database get the prediction of the image and sent it to the client
-
-            logger.info(f"Image saved to {temp_path}.")
-            self.file_counter += 1
-            return sample
-        except Exception as e:
-            logger.exception("Error saving image to file", exc_info=e)
 
     def display_image(self, data):
         """Display the image using PIL."""
+        from PIL import Image
+
         try:
             image = Image.open(io.BytesIO(data))
             image.show()
         except Exception as e:
             logger.error(f"Failed to display image: {e}")
 
+    def _write(self, data):
+        self.serial_connection.write(data)
+
     def send_acknowledgment(self):
         """Send an acknowledgment to the sender."""
+        if self.protocol != "raw":
+            return
         acknowledgment = b"IMAGE_RECEIVED"
         self.serial_connection.write(acknowledgment)
         logger.info("Acknowledgment sent: IMAGE_RECEIVED")
 
-    async def read_images(self):
-        """Continuously read images from the serial port."""
-        data = bytearray()
+    def get_stats(self):
+        """Return the receive, error and reconnect counters of this port."""
+        parser_stats = self.parser.get_stats()
+        uptime = time.monotonic() - self.started_at if self.started_at else 0.0
+        return {
+            "port": self.port,
+            "baudrate": self.baudrate,
+            "connected": self.running,
+            "protocol": self.protocol,
+            "frames_received": self.frames_received,
+            "errors": self.errors,
+            "reconnects": self.reconnects,
+            "bytes_per_second": parser_stats["bytes_received"] / uptime if uptime else 0.0,
+            "frames_per_second": self.frames_received / uptime if uptime else 0.0,
+            **parser_stats,
+        }
+
+    def read_images(self):
+        """Continuously read images from the serial port and hand them to the pipeline."""
+        self.parser.reset()
 
         while self.running:
             try:
-                if self.serial_connection.in_waiting > 0:
-                    # Read available data
-                    chunk = self.serial_connection.read(
-                        self.serial_connection.in_waiting)
-                    data.extend(chunk)
-                    logger.info(f"Received {len(chunk)} bytes.")
-
-                # Check for end of image data (JPEG EOF marker)
-                if data.endswith(b"\xFF\xD9"):  # JPEG EOF marker
-                    # Save the image to a file and get its metadata
-                    sample = self.save_image_to_file(data)
-
-                    if not sample:
-                        logging.error("Failed to save the image.")
-                        return
-
-                    # Perform prediction on the saved image
-                    predictions_array, annotated_image_base64 = predict(sample)
-                    predictions = get_highest_confidence_predictions(
-                        predictions_array)
-                    # logger.info(annotated_image_base64)
-                    if len(predictions) == 0:
-                        # logging.error(f"Prediction error:{
-                        #               predictions['error']}")
-                        logger.info(
-                            "*************PPP NO PREDICTION ****************")
-                        logger.info(predictions)
-                    logger.info("*************OKKKKKK****************")
-                    logger.info(predictions)
-
-                    save_prediction_to_db(
-                        prediction=predictions, annotated_image=annotated_image_base64)
-
-                    # modified_data = {
-                    #     'class_id': predictions[0]['class_id'] if predictions and 'class_id' in predictions[0] else None,
-                    #     'class_name': predictions[0]['class_name'] if predictions and 'class_name' in predictions[0] else None,
-                    #     'attributes': predictions[0]['attributes'] if predictions and 'attributes' in predictions[0] else None,
-                    #     'confidence': predictions[0]['confidence'] if predictions and 'confidence' in predictions[0] else None,
-                    #     'bbox': predictions[0]['bbox'] if predictions and 'bbox' in predictions[0] else None,
-                    #     'annotated_image': annotated_image_base64
-                    # }
-                    # modified_data = {
-                    #     **predictionss,
-                    #     "annotated_image": annotated_image_base64
-                    # }
-
-                    # logger.error(modified_data)
-                    # logging.info(modified_data)
-
-                    # message = json.dumps(modified_data)
-                    # Use the socket manager's broadcast method to send the message
-                    # logger.error("THE MESSAGE {message}".format(predictions))
-                    logger.info(f"THE MESSAGE: YOO YOO")
-                    await self.socket_manager.broadcast("Hello mr. how do you do.")
-                    # await self.socket_manager.broadcast_image()
-
-                    # Optionally send acknowledgment back to the client
-                    self.send_acknowledgment()
+                # Blocks until bytes arrive or the read timeout expires, no busy polling
+                frames = self.parser.read_frames(self.serial_connection)
 
-                    # Clear buffer and add optional delay
-                    data.clear()  # Clear buffer for next image
-                    time.sleep(1)
+                for frame in frames:
+                    self.frames_received += 1
+                    logger.info(f"Received frame of {len(frame)} bytes.")
+                    # Processing happens on the pipeline workers so the port keeps being drained
+                    self.pipeline.submit(frame, source=self.port)
+
+                    # Acknowledge receipt, the sender doesn't need to wait for inference
+                    self.send_acknowledgment()
 
             except serial.SerialException as e:
                 logger.error(f"Serial error: {e}")
+                self.errors += 1
                 self.disconnect()
             except Exception as e:
-                logger.error(f"Error during image processing: {e}")
+                logger.error(f"Error while receiving image: {e}")
+                self.errors += 1
                 self.send_acknowledgment()
-                data.clear()
+                self.parser.reset()
 
-    async def run(self):
+    def run(self):
         """Run the serial port manager."""
         if not self.serial_connection or not self.serial_connection.is_open:
             logger.error(
@@ -194,4 +148,26 @@ class SerialPortManager:
             return
 
         logger.info("Starting to read images from serial port...")
-        await self.read_images()
+        self.read_images()
+
+    def run_forever(self, reconnect_delay=SerialConstants.RECONNECT_DELAY):
+        """Keep the port connected and read from it, reconnecting after failures until stopped."""
+        self._stopped.clear()
+        while not self._stopped.is_set():
+            if not self.serial_connection or not self.serial_connection.is_open:
+                self.connect()
+                if not self.running:
+                    self._stopped.wait(reconnect_delay)
+                    continue
+
+            self.run()
+            if not self._stopped.is_set():
+                self.reconnects += 1
+                logger.info(
+                    f"Reconnecting to {self.port} in {reconnect_delay}s.")
+                self._stopped.wait(reconnect_delay)
+
+    def stop(self):
+        """Stop `run_forever` and close the port."""
+        self._stopped.set()
+        self.disconnect()
@@ -0,0 +1,212 @@
+import asyncio
+import itertools
+import time
+
+from fastapi import WebSocket
+
+from constants import WebSocketConstants
+from services.metrics_service import metrics
+from .helper_log import logger
+
+
+POLICIES = ("drop_oldest", "drop_newest", "disconnect")
+
+# Topic of the notifications every /ws client receives
+EVENTS = "events"
+
+FANOUT_SECONDS = metrics.histogram(
+    "websocket_fanout_seconds", "Time from publishing a message to sending it to a client.", ("topic",))
+
+
+class ClientConnection:
+    def __init__(self, client_id, websocket, queue_size, topics):
+        """
+        A connected WebSocket client and its outgoing message queue.
+
+        Args:
+            client_id (int): Identifier used in logs and stats.
+            websocket (WebSocket): The accepted connection.
+            queue_size (int): Maximum number of messages waiting to be sent.
+            topics (set): Topics the client receives messages of.
+        """
+        self.id = client_id
+        self.websocket = websocket
+        self.topics = topics
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.task = None
+        self.closed = False
+
+        self.sent = 0
+        self.dropped = 0
+
+    def get_stats(self):
+        return {
+            "id": self.id,
+            "topics": sorted(self.topics),
+            "queue_depth": self.queue.qsize(),
+            "sent": self.sent,
+            "dropped": self.dropped,
+        }
+
+
+class ConnectionManager:
+    def __init__(self, queue_size=WebSocketConstants.SEND_QUEUE_SIZE,
+                 policy=WebSocketConstants.SLOW_CLIENT_POLICY,
+                 send_timeout=WebSocketConstants.SEND_TIMEOUT):
+        """
+        Fan messages out to every WebSocket client without waiting for any of them.
+
+        Each client has a bounded queue drained by its own sender task, so a
+        broadcast only enqueues and one slow client never delays the others.
+
+        Args:
+            queue_size (int): Messages kept per client before the slow client policy applies.
+            policy (str): "drop_oldest", "drop_newest" or "disconnect", see
+                `WebSocketConstants.SLOW_CLIENT_POLICY`.
+            send_timeout (float): Seconds a single send may take before the client is dropped.
+        """
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown slow client policy: {policy}")
+
+        self.queue_size = max(1, queue_size)
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.loop = None
+        self.clients = {}  # websocket -> ClientConnection
+        self.subscribers = {}  # topic -> number of clients
+        self._ids = itertools.count(1)
+
+        self.messages_published = 0
+        self.messages_dropped = 0
+        self.slow_disconnects = 0
+
+    async def connect(self, websocket: WebSocket, topics=(EVENTS,)):
+        """
+        Accept a client and start its sender task.
+
+        Args:
+            websocket (WebSocket): The incoming connection.
+            topics (tuple): Topics the client receives messages of.
+        """
+        await websocket.accept()
+        self.loop = asyncio.get_running_loop()
+
+        client = ClientConnection(
+            next(self._ids), websocket, self.queue_size, set(topics))
+        client.task = asyncio.create_task(self._send_loop(client))
+        self.clients[websocket] = client
+        for topic in client.topics:
+            self.subscribers[topic] = self.subscribers.get(topic, 0) + 1
+        logger.info(f"WebSocket client {client.id} connected, {len(self.clients)} clients.")
+        return client
+
+    def disconnect(self, websocket: WebSocket):
+        """Forget a client and stop its sender task, messages still queued are discarded."""
+        client = self.clients.pop(websocket, None)
+        if client is None or client.closed:
+            return
+        client.closed = True
+        for topic in client.topics:
+            self.subscribers[topic] -= 1
+        if client.task and client.task is not asyncio.current_task():
+            client.task.cancel()
+        logger.info(f"WebSocket client {client.id} disconnected, {len(self.clients)} clients.")
+
+    def _enqueue(self, client, message):
+        # message is a `(payload, topic, published_at)` tuple
+        try:
+            client.queue.put_nowait(message)
+            return
+        except asyncio.QueueFull:
+            pass
+
+        client.dropped += 1
+        self.messages_dropped += 1
+        if self.policy == "drop_oldest":
+            client.queue.get_nowait()
+            client.queue.put_nowait(message)
+        elif self.policy == "disconnect":
+            self.slow_disconnects += 1
+            logger.warning(f"WebSocket client {client.id} can't keep up, disconnecting.")
+            self.disconnect(client.websocket)
+            asyncio.create_task(self._close(client.websocket))
+        # drop_newest: the message is simply not queued for this client
+
+    def has_subscribers(self, topic):
+        """Whether any client receives `topic`, lets publishers skip building unwanted messages."""
+        return self.subscribers.get(topic, 0) > 0
+
+    def publish(self, message, topic=EVENTS):
+        """
+        Queue a message for every client subscribed to `topic`, never waits. Must run on the event loop.
+
+        Args:
+            message (str | bytes): Sent as a text or binary frame.
+            topic (str): Only clients subscribed to this topic receive the message.
+        """
+        self.messages_published += 1
+        item = (message, topic, time.perf_counter())
+        # Iterate over a copy, the disconnect policy removes clients
+        for client in list(self.clients.values()):
+            if topic in client.topics:
+                self._enqueue(client, item)
+
+    def publish_threadsafe(self, message, topic=EVENTS):
+        """Queue a message from any thread, e.g. a serial or pipeline worker, see `publish`."""
+        loop = self.loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self.publish, message, topic)
+
+    async def broadcast(self, message):
+        self.publish(message)
+
+    async def _send(self, websocket, message):
+        if isinstance(message, (bytes, bytearray, memoryview)):
+            await websocket.send_bytes(bytes(message))
+        else:
+            await websocket.send_text(message)
+
+    async def _send_loop(self, client):
+        try:
+            while True:
+                message, topic, published_at = await client.queue.get()
+                await asyncio.wait_for(
+                    self._send(client.websocket, message), self.send_timeout)
+                client.sent += 1
+                FANOUT_SECONDS.labels(topic).observe(time.perf_counter() - published_at)
+        except asyncio.CancelledError:
+            pass
+        except asyncio.TimeoutError:
+            self.slow_disconnects += 1
+            logger.warning(f"WebSocket client {client.id} timed out, disconnecting.")
+            self.disconnect(client.websocket)
+            await self._close(client.websocket)
+        except Exception as e:
+            logger.error(f"Error sending message to client {client.id}: {e}")
+            self.disconnect(client.websocket)
+
+    async def _close(self, websocket):
+        try:
+            await websocket.close()
+        except Exception:
+            # Already closed by the peer
+            pass
+
+    async def close_all(self):
+        """Close every client, e.g. on application shutdown."""
+        for websocket in list(self.clients):
+            self.disconnect(websocket)
+            await self._close(websocket)
+
+    def get_stats(self):
+        return {
+            "clients": len(self.clients),
+            "policy": self.policy,
+            "queue_size": self.queue_size,
+            "subscribers": {topic: count for topic, count in self.subscribers.items() if count},
+            "messages_published": self.messages_published,
+            "messages_dropped": self.messages_dropped,
+            "slow_disconnects": self.slow_disconnects,
+            "connections": [client.get_stats() for client in self.clients.values()],
+        }
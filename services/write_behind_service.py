@@ -0,0 +1,221 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from constants import DatabaseConstants
+from services.db_service import finish_job_row, get_db_connection, insert_prediction_row, insert_sample_row
+from services.image_store import store_annotated_image
+from services.metrics_service import SIZE_BUCKETS, metrics
+from .helper_log import logger
+
+
+DB_WRITE_SECONDS = metrics.histogram(
+    "db_write_seconds", "Duration of a write-behind flush, from the first row to the commit.")
+DB_WRITE_BATCH_ROWS = metrics.histogram(
+    "db_write_batch_rows", "Rows committed per write-behind flush.", buckets=SIZE_BUCKETS)
+
+
+class WriteBehindBuffer:
+    def __init__(self, flush_rows=DatabaseConstants.WRITE_BATCH_ROWS,
+                 flush_interval_ms=DatabaseConstants.WRITE_FLUSH_MS):
+        """
+        Queue sample and prediction inserts and write them in one transaction per batch.
+
+        Args:
+            flush_rows (int): Flush once this many rows are queued.
+            flush_interval_ms (int): Flush at the latest this long after the first queued row.
+        """
+        self.flush_rows = max(1, flush_rows)
+        self.flush_interval = flush_interval_ms / 1000
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.running = False
+
+        self.rows_written = 0
+        self.rows_failed = 0
+        self.batches_written = 0
+
+    def start(self):
+        """Start the writer thread if it isn't running yet."""
+        with self._lock:
+            if self.running:
+                return
+            self.running = True
+            self._thread = threading.Thread(
+                target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=10):
+        """Write everything still queued and stop the writer thread."""
+        with self._lock:
+            if not self.running:
+                return
+            self.running = False
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _enqueue(self, write, *args):
+        self.start()
+        future = Future()
+        self._queue.put((write, args, future))
+        return future
+
+    def insert_sample(self, name, path, upload_date, is_deleted=False, source=None):
+        """
+        Queue a sample insert.
+
+        Args:
+            source (str): Serial port the sample was received on.
+
+        Returns:
+            Future: Resolves to the id of the inserted sample row.
+        """
+        return self._enqueue(insert_sample_row, name, path, upload_date, is_deleted, source)
+
+    def save_prediction(self, prediction, annotated_image, sample_id=None, detections=None):
+        """
+        Queue a prediction insert, see `save_prediction_to_db`.
+
+        Args:
+            sample_id (int | Future): Id of the sample, or the future returned by `insert_sample`.
+            detections (list): Every prediction of the frame, stored to render the annotated image later.
+
+        Returns:
+            Future: Resolves to the id of the inserted prediction row.
+        """
+        # The image file is written by the caller, the writer thread only touches the database
+        annotated_image_hash = store_annotated_image(annotated_image)
+        return self._enqueue(insert_prediction_row, prediction, annotated_image_hash, sample_id, detections)
+
+    def finish_job(self, job_id, status, result=None, prediction_id=None, error=None):
+        """
+        Queue the final state of an analysis job, see `finish_job_row`.
+
+        Args:
+            prediction_id (int | Future): Id of the stored prediction, or the future returned by `save_prediction`.
+
+        Returns:
+            Future: Resolves to the job id once the row is written.
+        """
+        return self._enqueue(finish_job_row, job_id, status, result, prediction_id, error)
+
+    def flush(self, timeout=None):
+        """Block until every write queued before this call is committed."""
+        marker = Future()
+        self._queue.put(marker)
+        self.start()
+        marker.result(timeout)
+
+    def get_stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "rows_written": self.rows_written,
+            "rows_failed": self.rows_failed,
+            "batches_written": self.batches_written,
+        }
+
+    def _collect_batch(self, first):
+        batch = [first]
+        markers = []
+        stop = False
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.flush_rows:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            if isinstance(item, Future):
+                # Someone wants everything so far on disk, don't wait any longer
+                markers.append(item)
+                break
+            batch.append(item)
+        return batch, markers, stop
+
+    @staticmethod
+    def _resolve(args, row_ids):
+        """Replace futures of rows queued earlier by their row ids."""
+        resolved = []
+        for arg in args:
+            if isinstance(arg, Future):
+                if arg in row_ids:
+                    arg = row_ids[arg]
+                elif arg.done() and arg.exception() is None:
+                    arg = arg.result()
+                else:
+                    arg = None
+            resolved.append(arg)
+        return resolved
+
+    def _write_batch(self, batch):
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        row_ids = {}
+        try:
+            for write, args, future in batch:
+                row_ids[future] = write(cursor, *self._resolve(args, row_ids))
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            logger.error(
+                f"Write-behind batch of {len(batch)} rows failed, retrying row by row: {e}")
+            self._write_rows(batch)
+            return
+
+        self.rows_written += len(batch)
+        self.batches_written += 1
+        for _, _, future in batch:
+            future.set_result(row_ids[future])
+
+    def _write_rows(self, batch):
+        """Write rows in their own transactions so one bad row doesn't lose the others."""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        for write, args, future in batch:
+            try:
+                row_id = write(cursor, *self._resolve(args, {}))
+                conn.commit()
+                self.rows_written += 1
+                future.set_result(row_id)
+            except Exception as e:
+                conn.rollback()
+                self.rows_failed += 1
+                logger.error(f"Write-behind row failed: {e}")
+                future.set_exception(e)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                if not self.running:
+                    break
+                continue
+            if isinstance(item, Future):
+                item.set_result(None)
+                continue
+
+            batch, markers, stop = self._collect_batch(item)
+            DB_WRITE_BATCH_ROWS.observe(len(batch))
+            try:
+                with DB_WRITE_SECONDS.time():
+                    self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Write-behind flush failed: {e}")
+                for _, _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+            for marker in markers:
+                marker.set_result(None)
+            if stop and not self.running:
+                # Drain whatever was queued before stop() and exit
+                self._queue.put(None)
+
+
+write_behind = WriteBehindBuffer()
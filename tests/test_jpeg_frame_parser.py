@@ -0,0 +1,87 @@
+import io
+
+from services.jpeg_frame_parser import EOI, SOI, JpegFrameParser
+
+
+def jpeg(body):
+    return SOI + body + EOI
+
+
+class FakeSerial:
+    """Hands out the queued chunks one read at a time, like a port with a read timeout."""
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    @property
+    def in_waiting(self):
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, size):
+        return self.chunks.pop(0) if self.chunks else b""
+
+
+def test_frame_split_across_reads():
+    frame = jpeg(b"\x01\x02\x03\x04")
+    # Split inside the start and the end marker too
+    source = FakeSerial([frame[:1], frame[1:4], frame[4:-1], frame[-1:]])
+    parser = JpegFrameParser()
+
+    frames = []
+    while source.chunks:
+        frames += parser.read_frames(source)
+
+    assert frames == [frame]
+    assert parser.get_stats()["frames_parsed"] == 1
+
+
+def test_several_frames_in_one_read():
+    first, second, third = jpeg(b"a"), jpeg(b"bb"), jpeg(b"ccc")
+    parser = JpegFrameParser()
+
+    assert parser.read_frames(io.BytesIO(first + second + third)) == [first, second, third]
+
+
+def test_leading_garbage_is_discarded():
+    frame = jpeg(b"payload")
+    parser = JpegFrameParser()
+
+    assert parser.feed(b"\x00garbage\xFF" + frame) == [frame]
+    assert parser.get_stats()["bytes_discarded"] == len(b"\x00garbage\xFF")
+
+
+def test_stray_start_marker_stays_inside_the_frame():
+    # Only the end marker closes a frame, a start marker inside it is payload
+    frame = jpeg(b"before" + SOI + b"after")
+    parser = JpegFrameParser()
+
+    assert parser.feed(frame) == [frame]
+    assert parser.get_stats()["bytes_discarded"] == 0
+
+
+def test_oversized_frame_is_dropped_and_parser_resynchronizes():
+    parser = JpegFrameParser(max_frame_size=16)
+    frame = jpeg(b"ok")
+
+    assert parser.feed(SOI + b"x" * 32) == []
+    assert parser.get_stats()["frames_oversized"] == 1
+    # The rest of the oversized frame and its end marker are skipped
+    assert parser.feed(b"x" * 8 + EOI + frame) == [frame]
+
+
+def test_oversized_frame_resynchronizes_on_a_start_marker_inside_it():
+    parser = JpegFrameParser(max_frame_size=16)
+    frame = jpeg(b"ok")
+
+    assert parser.feed(SOI + b"x" * 20 + frame) == [frame]
+    assert parser.get_stats()["frames_oversized"] == 1
+
+
+def test_reset_drops_the_partial_frame():
+    parser = JpegFrameParser()
+    frame = jpeg(b"new")
+
+    parser.feed(SOI + b"partial")
+    parser.reset()
+
+    assert parser.feed(b"tail" + EOI + frame) == [frame]
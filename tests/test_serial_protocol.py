@@ -0,0 +1,113 @@
+from services.serial_protocol import (ACK, DATA, END_OF_IMAGE, HEADER, MAGIC, NAK, SEQ_MODULO, START_OF_IMAGE,
+                                      FramedProtocolReceiver, encode_frame, encode_image)
+
+
+IMAGE = bytes(range(256)) * 16  # 16 chunks of 256 bytes
+
+
+def responses(sent, frame_type):
+    """Sequence numbers of the ACK or NAK frames the receiver sent back."""
+    seqs = []
+    for frame in sent:
+        sent_type, _, seq, _ = HEADER.unpack_from(frame, len(MAGIC))
+        if sent_type == frame_type:
+            seqs.append(seq)
+    return seqs
+
+
+def make_receiver():
+    sent = []
+    return FramedProtocolReceiver(sent.append), sent
+
+
+def test_corrupted_chunk_is_nakked_and_retransmitted():
+    receiver, sent = make_receiver()
+    frames = encode_image(IMAGE)
+    corrupted = bytearray(frames[1])
+    corrupted[-5] ^= 0xFF  # Last payload byte, the CRC no longer matches
+
+    images = receiver.feed(frames[0] + bytes(corrupted) + frames[2])
+    assert images == []
+    assert receiver.crc_errors == 1
+    assert responses(sent, NAK) == [1]
+
+    images = receiver.feed(frames[1] + b"".join(frames[3:]))
+    assert images == [IMAGE]
+
+
+def test_missing_chunk_is_nakked_once_until_the_line_goes_quiet():
+    receiver, sent = make_receiver()
+    frames = encode_image(IMAGE)
+
+    for frame in frames[:1] + frames[2:]:
+        assert receiver.feed(frame) == []
+    assert responses(sent, NAK) == [1]
+
+    receiver.on_idle()
+    assert responses(sent, NAK) == [1, 1]
+
+    assert receiver.feed(frames[1]) == [IMAGE]
+    receiver.on_idle()
+    assert responses(sent, NAK) == [1, 1]
+
+
+def test_resynchronizes_after_garbage():
+    receiver, sent = make_receiver()
+    frames = encode_image(IMAGE, start_seq=1000)
+
+    # Garbage, a stray magic and a chunk from the middle of an earlier image
+    garbage = b"\x00\x01" + MAGIC + b"\xFF" * 5 + encode_frame(DATA, 7, b"old")
+    assert receiver.feed(garbage) == []
+    assert receiver.out_of_window == 1
+
+    assert receiver.feed(b"".join(frames)) == [IMAGE]
+    assert receiver.bytes_discarded > 0
+    assert receiver.expected_seq == 1000 + len(frames)
+
+
+def test_resynchronizes_when_the_sender_restarts():
+    receiver, sent = make_receiver()
+    assert receiver.feed(b"".join(encode_image(b"first", start_seq=5000))) == [b"first"]
+
+    # The sender restarted at seq 0, far behind the window, and keeps sending new images
+    window = receiver.window_size
+    images = []
+    for index in range(3 * window):
+        images += receiver.feed(encode_frame(DATA, index, b"x", START_OF_IMAGE | END_OF_IMAGE))
+    # Chunks are ignored until more than twice the window arrived outside of it
+    assert receiver.out_of_window == 2 * window + 1
+    assert images == [b"x"] * window
+    assert receiver.expected_seq == 3 * window
+
+
+def test_sequence_numbers_wrap_around():
+    receiver, sent = make_receiver()
+    frames = encode_image(IMAGE[:1024], start_seq=SEQ_MODULO - 2)
+
+    assert receiver.feed(b"".join(frames)) == [IMAGE[:1024]]
+    assert receiver.expected_seq == 2
+    assert responses(sent, ACK) == [SEQ_MODULO - 2, SEQ_MODULO - 1, 0, 1]
+
+
+def test_sequence_numbers_wrap_around_with_a_missing_chunk():
+    receiver, sent = make_receiver()
+    frames = encode_image(IMAGE[:1024], start_seq=SEQ_MODULO - 2)
+
+    assert receiver.feed(frames[0] + frames[2] + frames[3]) == []
+    assert responses(sent, NAK) == [SEQ_MODULO - 1]
+    assert receiver.feed(frames[1]) == [IMAGE[:1024]]
+
+
+def test_duplicate_chunk_is_acknowledged_and_ignored():
+    receiver, sent = make_receiver()
+    frames = encode_image(IMAGE[:768])
+
+    assert receiver.feed(frames[0] + frames[0]) == []
+    assert receiver.duplicates == 1
+    assert responses(sent, ACK) == [0, 0]
+
+    # A chunk buffered out of order and sent again is ignored too
+    assert receiver.feed(frames[2] + frames[2]) == []
+    assert receiver.duplicates == 2
+
+    assert receiver.feed(frames[1]) == [IMAGE[:768]]